@@ -1,20 +1,45 @@
 from typing import Any
-from fastapi import FastAPI, UploadFile, Form, Query, HTTPException, Response
+from contextlib import asynccontextmanager, aclosing
+from fastapi import FastAPI, UploadFile, Form, Query, HTTPException, Response, Header, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field
-from app.services import storage, taxonomy, composer, evaluator
-from app.services.aoai import chat_completion
+from app.services import storage, taxonomy, composer, evaluator, aoai, blocking, prompt_vault, draft_cache, appcfg, clients, shared_cache, tracing, metrics, draft_store, uploads, extract, digest, pack_loader
+from app.services import evidence as evidence_store  # `evidence` is the batch's shared download dict below
+from app.services.aoai import chat_completion, chat_completion_stream
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from app.services.appcfg import get_bool, get as cfg_get
+from app.services.appcfg import get_bool, get as cfg_get, aget as cfg_aget
 from app.services.prompt_vault import _resolve_pack as _pv_resolve
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
 import os
 import json
+import asyncio
 
 #test
 
-app = FastAPI(title="SmartAI Proposal Builder (Dev)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the Azure SDK clients (one shared credential) before taking traffic;
+    # importing app.main no longer does this.
+    await blocking.run(clients.warm)
+    await shared_cache.start()  # multi-worker: watch for other workers' invalidations
+    # One pooled AOAI client per worker process; closed cleanly on shutdown
+    aoai.get_client()
+    await appcfg.start()  # bulk config snapshot + background refresher
+    await composer.anew_budget()  # loads the tiktoken encoding off the loop
+    prompt_vault.warm()
+    tracing.start_flusher()
+    try:
+        yield
+    finally:
+        await tracing.stop()  # writes any buffered traces
+        await draft_store.flush()  # finish background draft uploads
+        extract.shutdown()
+        await appcfg.stop()
+        await shared_cache.stop()
+        await aoai.aclose()
+        blocking.shutdown()
+
+app = FastAPI(title="SmartAI Proposal Builder (Dev)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +63,22 @@ def root():
 def health():
     return {"ok": True}
 
+# existing stats() dicts, exported as gauges next to the histograms/counters in metrics.py
+metrics.register_stats("aoai_scheduler", aoai.scheduler_stats)
+metrics.register_stats("draft_cache", draft_cache.stats)
+metrics.register_stats("draft_store", draft_store.stats)
+metrics.register_stats("evidence_digest", evidence_store.stats)
+metrics.register_stats("session_cache", storage.session_cache_stats)
+metrics.register_stats("appcfg_snapshot", appcfg.snapshot_stats)
+metrics.register_stats("shared_cache", shared_cache.stats)
+metrics.register_stats("tracing", tracing.stats)
+metrics.register_stats("pack_loader", pack_loader.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition (per worker process)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/v1/config/features")
 def features():
     packs_latest = {
@@ -67,6 +108,7 @@ def prompts_active():
         "model_worker": cfg_get("MODEL.WORKER", "gpt-4.1-mini-worker"),
         "model_manager": cfg_get("MODEL.MANAGER", "gpt-4.1-mini-manager"),
         "feature_psg_enabled": get_bool("FEATURE_PSG_ENABLED", False),
+        "prompt_vault_backend": cfg_get("PROMPT_VAULT.BACKEND", None) or "search",
         "appconfig_label": os.environ.get("APPCONFIG_LABEL", "dev"),
     }
 
@@ -99,10 +141,9 @@ class SessionFactsReq(BaseModel):
 
 @app.post("/v1/session")
 async def create_session(body: SessionCreate):
-    table = storage.sessions()
     from uuid import uuid4; sid = f"s_{uuid4().hex[:8]}"
     entity = {"PartitionKey":"session","RowKey":sid,"grant":body.grant,"status":"new"}
-    table.upsert_entity(entity)
+    await storage.aupsert_session(entity)
     return {"session_id": sid}
 
 # ------------------------------------------------------------
@@ -114,7 +155,7 @@ async def get_session(sid: str):
     Retrieve session metadata including all facts.
     """
     try:
-        sess = storage.sessions().get_entity(partition_key="session", row_key=sid)
+        sess = await storage.aget_session(sid)
     except Exception:
         raise HTTPException(status_code=404, detail="Session not found")
     return {"session_id": sid, "session": dict(sess)}
@@ -138,7 +179,7 @@ async def upsert_session_facts(sid: str, body: SessionFactsReq):
     - Free-form facts via 'extra' dict for lead-gen, diagnostics, vendor profiling
     """
     try:
-        sess = storage.sessions().get_entity(partition_key="session", row_key=sid)
+        await storage.aget_session(sid)
     except Exception:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -147,16 +188,13 @@ async def upsert_session_facts(sid: str, body: SessionFactsReq):
 
     # Flatten extra dict if present
     extras = payload.pop("extra", {}) or {}
-    
-    # Merge structured fields into session
-    for k, v in payload.items():
-        sess[k] = v
-    
-    # Merge dynamic facts at same level
-    for k, v in extras.items():
-        sess[k] = v
 
-    storage.sessions().upsert_entity(sess)
+    # Merge structured fields + dynamic facts at the same level
+    changes = dict(payload)
+    changes.update(extras)
+
+    # ETag-conditional merge; retried on concurrent updates, cache written through
+    await storage.aupdate_session(sid, changes)
     
     # Return combined facts for verification
     all_facts = payload.copy()
@@ -164,13 +202,58 @@ async def upsert_session_facts(sid: str, body: SessionFactsReq):
     
     return {"session_id": sid, "facts": all_facts}
 
+# ------------------------------------------------------------
+# Evidence Upload + Extraction
+# ------------------------------------------------------------
+@app.put("/v1/session/{sid}/uploads/{label}", status_code=202)
+async def upload_evidence(sid: str, label: str, request: Request, filename: str | None = Query(None)):
+    """
+    Upload one evidence file as the raw request body (PDF, DOCX or TXT; type from
+    `filename` or Content-Type; 415 if the server cannot extract that type). The body is streamed to the uploads container;
+    text extraction to evidence/{sid}_{label}.txt runs afterwards in a process pool.
+    Poll GET /v1/session/{sid}/uploads/{label} for progress.
+    """
+    try:
+        await storage.aget_session(sid)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        length = 0
+    try:
+        st = await uploads.receive(sid, label, filename, request.headers.get("content-type"),
+                                   request.stream(), declared_length=length)
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except uploads.ExtractorUnavailable as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    return {"session_id": sid, **st}
+
+
+@app.get("/v1/session/{sid}/uploads")
+async def upload_status_all(sid: str):
+    return {"session_id": sid, "uploads": await uploads.status(sid)}
+
+
+@app.get("/v1/session/{sid}/uploads/{label}")
+async def upload_status(sid: str, label: str):
+    st = (await uploads.status(sid)).get(label)
+    if st is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"session_id": sid, **st}
+
 # ------------------------------------------------------------
 # Validation Stub (non-blocking)
 # ------------------------------------------------------------
 @app.post("/v1/session/{sid}/validate")
 async def validate_session(sid: str):
     try:
-        sess = storage.sessions().get_entity(partition_key="session", row_key=sid)
+        sess = await storage.aget_session(sid)
     except Exception:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -190,19 +273,10 @@ async def validate_session(sid: str):
 
     return {"session_id": sid, "checks": checks}
 
-@app.get("/v1/session/{sid}/checklist")
-async def checklist(sid: str):
-    # Read the session to know which grant this session is for
-    try:
-        sess = storage.sessions().get_entity(partition_key="session", row_key=sid)
-        grant = (sess.get("grant") or "EDG").upper()
-    except Exception:
-        # If session not found or table hiccups, fall back safely
-        grant = "EDG"
-
+def _checklist_tasks(grant: str) -> list:
     if grant == "PSG":
         # PSG: uploads + drafts (no variant needed)
-        tasks = [
+        return [
             {"id": "vendor_quotation", "type": "upload"},
             {"id": "cost_breakdown", "type": "upload"},
             {"id": "business_impact", "type": "draft", "section_variant": None},
@@ -212,7 +286,7 @@ async def checklist(sid: str):
         ]
     else:
         # EDG: uploads + drafts (WITH a variant example)
-        tasks = [
+        return [
             {"id": "acra_bizfile", "type": "upload"},
             {"id": "audited_financials", "type": "upload"},
             {"id": "consultancy_scope", "type": "draft", "section_variant": None},
@@ -224,22 +298,133 @@ async def checklist(sid: str):
              "section_variant": "expansion_plan.market_access"},
         ]
 
+@app.get("/v1/session/{sid}/checklist")
+async def checklist(sid: str):
+    # Read the session to know which grant this session is for
+    try:
+        sess = await storage.aget_session(sid)
+        grant = (sess.get("grant") or "EDG").upper()
+    except Exception:
+        # If session not found or table hiccups, fall back safely
+        grant = "EDG"
+
+    tasks = _checklist_tasks(grant)
     return {"session_id": sid, "grant": grant, "tasks": tasks}
 
+DRAFT_MAX_TOKENS = 800
+DRAFT_TEMPERATURE = 0.2
+
 class DraftReq(BaseModel):
     session_id: str
     section_id: str
     section_variant: str | None = None
     inputs: dict = {}
+    stream: bool = False  # relay tokens as Server-Sent Events
+
+
+async def _load_evidence(session_id: str, labels: list, max_chars: int,
+                         shared: dict | None = None, terms: tuple | None = None) -> tuple[str, list]:
+    """
+    Download every label concurrently but assemble in priority order.
+    Once the running total reaches max_chars the remaining downloads can no
+    longer contribute, so they are cancelled.
+    `shared` ((label, max_chars) -> task) lets several sections of one batch
+    reuse the same downloads; those tasks are left running for the other sections.
+    With `terms` the labels' digests are packed by relevance instead (_pack_evidence).
+    Returns (snippet, labels_used).
+    """
+    if terms is not None:
+        return await _pack_evidence(session_id, labels, max_chars, shared, terms)
+
+    async def fetch(label: str) -> str:
+        with tracing.span("evidence.fetch", label=label) as sp:
+            try:
+                # a single label can never use more than the whole budget
+                txt = await storage.aget_text_capped("evidence", f"{session_id}_{label}.txt", max_chars)
+            except Exception:
+                # Missing evidence file is OK; skip
+                txt = ""
+            sp["chars"] = len(txt)
+            return txt
+
+    def task_for(label: str) -> asyncio.Task:
+        if shared is None:
+            return asyncio.create_task(fetch(label))
+        # the download is capped at max_chars: only sections with the same cap share it
+        key = (label, max_chars)
+        if key not in shared:
+            shared[key] = asyncio.create_task(fetch(label))
+        return shared[key]
+
+    tasks = [task_for(label) for label in labels]
+    parts, used, total = [], [], 0
+    try:
+        for label, task in zip(labels, tasks):
+            txt = await task
+            if not txt:
+                continue
+            part = f"\n\n--- [evidence:{label}] ---\n" + txt
+            parts.append(part)
+            used.append(label)
+            total += len(part)
+            if total >= max_chars:
+                break
+    finally:
+        if shared is None:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    return "".join(parts)[:max_chars], used
+
+
+async def _pack_evidence(session_id: str, labels: list, max_chars: int,
+                         shared: dict | None, terms: tuple) -> tuple[str, list]:
+    """
+    Fill max_chars with the chunks of each label's digest that best match the
+    section (BM25 on retrieval tags + template headings), instead of keeping
+    only the head of the concatenated text. Digests are cached per label.
+    """
+    async def fetch(label: str):
+        with tracing.span("evidence.fetch", label=label) as sp:
+            try:
+                d, source = await evidence_store.get(session_id, label)
+            except Exception:
+                d, source = None, "error"  # missing/unreadable evidence is skipped, as in raw mode
+            sp["source"] = source
+            sp["chunks"] = len(d.chunks) if d else 0
+            return d
+
+    def task_for(label: str) -> asyncio.Task:
+        if shared is None:
+            return asyncio.create_task(fetch(label))
+        key = ("digest", label)
+        if key not in shared:
+            shared[key] = asyncio.create_task(fetch(label))
+        return shared[key]
+
+    tasks = [task_for(label) for label in labels]
+    try:
+        digests = [await t for t in tasks]
+    finally:
+        if shared is None:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+    with tracing.span("evidence.pack", terms=len(terms)) as sp:
+        snippet, used = digest.pack(list(zip(labels, digests)), terms, max_chars)
+        sp["chars"] = len(snippet)
+    return snippet, used
 
 
 # ------------------------------------------------------------
 # Shared Draft Helper (grant-agnostic)
 # ------------------------------------------------------------
-async def _do_draft(req: DraftReq, response: Response, *, pack_hint: str):
+async def _prepare_draft(req: DraftReq, *, pack_hint: str, evidence: dict | None = None):
     """
-    Unified draft logic for any grant type.
-    Uses pack_hint to select the appropriate prompt pack (edg, psg, etc.)
+    Evidence loading + prompt composition shared by the JSON and SSE draft paths.
+    Returns (framework, messages, pack_header, evidence_order_used, token_budget);
+    token_budget is None when TOKEN_BUDGET.ENABLED is false.
     """
     fw = taxonomy.pick_framework(req.section_id)
 
@@ -279,28 +464,23 @@ async def _do_draft(req: DraftReq, response: Response, *, pack_hint: str):
         labels = DEFAULT_EVIDENCE_BY_SECTION.get(req.section_id, [req.section_id])
 
     # --- Load snippets in order; cap total length ---
-    MAX_CHARS = int(req.inputs.get("evidence_char_cap", 6000))
-    parts = []
-    evidence_used = []
-    for label in labels:
-        blob_name = f"{req.session_id}_{label}.txt"
-        try:
-            txt = storage.get_text("evidence", blob_name)
-            if not txt:
-                continue
-            header = f"\n\n--- [evidence:{label}] ---\n"
-            parts.append(header + txt)
-            evidence_used.append(label)
-            if sum(len(p) for p in parts) >= MAX_CHARS:
-                break
-        except Exception:
-            # Missing evidence file is OK; skip
-            continue
-
-    snippet = ""
-    if parts:
-        joined = "".join(parts)
-        snippet = joined[:MAX_CHARS]
+    # With a token budget the evidence share left by the template sizes the load;
+    # the character caps only apply when set explicitly.
+    budget = await composer.aplan_budget(req.section_id, fw, req.inputs or {},
+                                         section_variant=req.section_variant, pack_hint=pack_hint)
+    if budget is None:
+        MAX_CHARS = int(req.inputs.get("evidence_char_cap", 6000))
+    else:
+        MAX_CHARS = min(budget.evidence_chars(), int(req.inputs.get("evidence_char_cap") or budget.evidence_chars()))
+    cap_cfg = await cfg_aget("EVIDENCE_CHAR_CAP")
+    if str(cap_cfg).isdigit():
+        # the composer cuts the window at EVIDENCE_CHAR_CAP; pack for the smaller budget
+        MAX_CHARS = min(MAX_CHARS, int(cap_cfg))
+    terms = None
+    if await evidence_store.enabled():
+        terms = await composer.aevidence_terms(req.section_id, fw, req.inputs or {},
+                                               section_variant=req.section_variant, pack_hint=pack_hint)
+    snippet, evidence_used = await _load_evidence(req.session_id, labels, MAX_CHARS, evidence, terms)
 
     # Surface the labels into inputs so the prompt can mention them
     if evidence_used:
@@ -309,34 +489,36 @@ async def _do_draft(req: DraftReq, response: Response, *, pack_hint: str):
 
     # --- Pack selection via pack_hint (EDG/PSG/etc.) ---
     try:
-        msgs, packver, evidence_order_used = composer.compose_instruction(
+        msgs, packver, evidence_order_used = await composer.acompose_instruction(
             req.section_id, 
             fw, 
             req.inputs or {}, 
             snippet,
             section_variant=req.section_variant,
-            pack_hint=pack_hint  # IMPORTANT: drives pack selection
+            pack_hint=pack_hint,  # IMPORTANT: drives pack selection
+            budget=budget,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prompt Vault error: {type(e).__name__}: {e}")
 
-    response.headers["x-prompt-pack"] = packver
+    if budget is not None:
+        metrics.PROMPT_TOKENS.observe(budget.prompt_tokens, "prompt")
+        metrics.PROMPT_TOKENS.observe(budget.evidence_tokens, "evidence")
+    return fw, msgs, packver, evidence_order_used, budget
 
-    # --- Call AOAI ---
-    try:
-        out = await chat_completion(msgs, use="worker")
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=f"Model deployment error: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
+def _max_tokens(budget) -> int:
+    return budget.max_tokens if budget is not None else DRAFT_MAX_TOKENS
+
+
+def _draft_result(req: DraftReq, fw: str, evidence_order_used: list, out: str, budget=None) -> dict:
     # --- Soft evaluator ---
     ev = evaluator.score(out, require_tokens=["source:"] if any(c.isdigit() for c in out) else None)
 
     # --- Lightweight warnings (grant-specific checks) ---
     warnings = []
 
-    return {
+    body = {
         "section_id": req.section_id,
         "framework": fw,
         "evidence_used": evidence_order_used,  # Use the ordered labels from composer
@@ -344,46 +526,374 @@ async def _do_draft(req: DraftReq, response: Response, *, pack_hint: str):
         "evaluation": ev,
         "warnings": warnings,
     }
+    if budget is not None:
+        body["token_budget"] = budget.as_dict()
+    return body
+
+
+async def _persist_draft(req: DraftReq, body: dict, packver: str) -> None:
+    # keep the draft for reloads; the blob write happens after the response
+    if not await draft_store.enabled():
+        return
+    try:
+        draft_store.save(req.session_id, req.section_id, req.section_variant,
+                         dict(body, **{"x-prompt-pack": packver}))
+    except ValueError:
+        pass  # ids that can't be a blob path are simply not stored
+
+
+def _throttled(e: "aoai.RateLimited") -> HTTPException:
+    # AOAI is still throttling after the scheduler's retries: tell the client when to come back
+    return HTTPException(status_code=429, detail=f"AI service busy: {str(e)}",
+                         headers={"Retry-After": str(max(1, int(e.retry_after + 0.999)))})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _cached_tokens(out: str):
+    yield out
+
+
+async def _stream_draft(req: DraftReq, fw: str, msgs: list, packver: str, evidence_order_used: list, budget,
+                        *, cache_key: str | None, cache_cfg: dict, cache_status: str, cached: str | None):
+    """
+    SSE relay: `token` events carry AOAI deltas as they arrive; a final `done`
+    event carries the same body as the JSON path plus `x-prompt-pack`.
+    A draft-cache hit is replayed as a single `token` event.
+    """
+    if cached is not None:
+        tokens = _cached_tokens(cached)
+    else:
+        tokens = chat_completion_stream(msgs, use="worker", max_tokens=_max_tokens(budget),
+                                        temperature=DRAFT_TEMPERATURE)
+
+    # Pull the first delta before committing to a 200 so deployment/auth errors
+    # still surface as proper HTTP errors.
+    tr = tracing.current()
+    try:
+        with tracing.span("aoai.first_token", cached=cached is not None):
+            first = await tokens.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    except aoai.RateLimited as e:
+        raise _throttled(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Model deployment error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+
+    async def events():
+        metrics.DRAFTS_IN_FLIGHT.inc()
+        try:
+            async with aclosing(_stream_events()) as stream:
+                async for event in stream:
+                    yield event
+        finally:
+            metrics.DRAFTS_IN_FLIGHT.dec()
+
+    async def _stream_events():
+        parts = []
+        if first:
+            parts.append(first)
+            yield _sse("token", {"delta": first})
+        try:
+            with tracing.span("aoai.stream"):
+                async for delta in tokens:
+                    parts.append(delta)
+                    yield _sse("token", {"delta": delta})
+        except Exception as e:
+            tracing.finish(tr, status=500, stream=True)
+            yield _sse("error", {"detail": f"AI service error: {str(e)}"})
+            return
+        out = "".join(parts)
+        if cache_key and cached is None:
+            draft_cache.put(cache_key, out, cache_cfg)
+        with tracing.span("evaluate"):
+            body = _draft_result(req, fw, evidence_order_used, out, budget)
+        body["x-prompt-pack"] = packver
+        await _persist_draft(req, body, packver)
+        tracing.finish(tr, status=200, stream=True, cache=cache_status)
+        yield _sse("done", body)
+
+    headers = {"x-prompt-pack": packver, "X-Accel-Buffering": "no", "x-draft-cache": cache_status}
+    if tr is not None:
+        headers["x-trace-id"] = tr.trace_id
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+async def _draft_cache_lookup(msgs: list, cache_mode: str | None, max_tokens: int = DRAFT_MAX_TOKENS):
+    """
+    Returns (key, cfg, status, cached_output). key is None when the cache is off.
+    `x-draft-cache: bypass` skips the read but still refreshes the entry.
+    """
+    cfg = await draft_cache.settings()
+    if not cfg["enabled"]:
+        return None, cfg, "off", None
+    try:
+        dep = await aoai._deployment("worker")
+    except Exception:
+        # let the AOAI call report the deployment problem
+        return None, cfg, "off", None
+    key = draft_cache.make_key(msgs, dep, DRAFT_TEMPERATURE, max_tokens)
+    if (cache_mode or "").strip().lower() == "bypass":
+        return key, cfg, "bypass", None
+    out, status = await draft_cache.get(key, cfg)
+    return key, cfg, status, out
+
+
+async def _complete_draft(req: DraftReq, *, pack_hint: str, cache_mode: str | None = None,
+                          evidence: dict | None = None) -> tuple[dict, dict]:
+    """
+    Non-streaming draft: returns (body, response_headers).
+    Shared by the single-section endpoints and the batch endpoint.
+    """
+    fw, msgs, packver, evidence_order_used, budget = await _prepare_draft(req, pack_hint=pack_hint, evidence=evidence)
+    key, cfg, status, cached = await _draft_cache_lookup(msgs, cache_mode, _max_tokens(budget))
+    headers = {"x-prompt-pack": packver, "x-draft-cache": status}
+    if cached is not None:
+        with tracing.span("evaluate"):
+            body = _draft_result(req, fw, evidence_order_used, cached, budget)
+        await _persist_draft(req, body, packver)
+        return body, headers
+
+    # --- Call AOAI ---
+    try:
+        with tracing.span("aoai.chat"):
+            out = await chat_completion(msgs, use="worker", max_tokens=_max_tokens(budget),
+                                        temperature=DRAFT_TEMPERATURE)
+    except aoai.RateLimited as e:
+        raise _throttled(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Model deployment error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+
+    if key:
+        draft_cache.put(key, out, cfg)
+    with tracing.span("evaluate"):
+        body = _draft_result(req, fw, evidence_order_used, out, budget)
+    await _persist_draft(req, body, packver)
+    return body, headers
+
+
+async def _do_draft(req: DraftReq, response: Response, *, pack_hint: str, cache_mode: str | None = None):
+    """
+    Unified draft logic for any grant type.
+    Uses pack_hint to select the appropriate prompt pack (edg, psg, etc.)
+    With req.stream the draft is returned as Server-Sent Events instead of JSON.
+    Identical prompts are served from the draft cache when DRAFT_CACHE.ENABLED.
+    """
+    tr = tracing.current()
+    metrics.DRAFTS_IN_FLIGHT.inc()
+    try:
+        if req.stream:
+            fw, msgs, packver, evidence_order_used, budget = await _prepare_draft(req, pack_hint=pack_hint)
+            key, cfg, status, cached = await _draft_cache_lookup(msgs, cache_mode, _max_tokens(budget))
+            # the SSE generator finishes the trace once the last token is sent
+            return await _stream_draft(req, fw, msgs, packver, evidence_order_used, budget,
+                                       cache_key=key, cache_cfg=cfg, cache_status=status, cached=cached)
+
+        body, headers = await _complete_draft(req, pack_hint=pack_hint, cache_mode=cache_mode)
+    except HTTPException as e:
+        tracing.finish(tr, status=e.status_code)
+        raise
+    finally:
+        # a streamed draft counts again while its SSE body is being sent
+        metrics.DRAFTS_IN_FLIGHT.dec()
+    response.headers.update(headers)
+    if tr is not None:
+        response.headers["x-trace-id"] = tr.trace_id
+    tracing.finish(tr, status=200, cache=headers["x-draft-cache"])
+    return body
+
+
+def _force_trace(x_trace: str | None) -> bool:
+    # `x-trace: 1` samples this request regardless of TRACING.SAMPLE_RATE
+    return (x_trace or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+async def _start_trace(name: str, req: DraftReq, x_trace: str | None, **attrs):
+    return await tracing.start(name, force=_force_trace(x_trace), session_id=req.session_id,
+                               section_id=req.section_id, variant=req.section_variant, stream=req.stream, **attrs)
 
 
 # ------------------------------------------------------------
 # Unified Draft Endpoint (grant-agnostic)
 # ------------------------------------------------------------
 @app.post("/v1/draft")
-async def draft_any(req: DraftReq, response: Response):
+async def draft_any(req: DraftReq, response: Response, x_draft_cache: str | None = Header(None),
+                    x_trace: str | None = Header(None)):
     """
     Grant-agnostic draft endpoint.
     Determines grant type from session and selects appropriate prompt pack.
     """
+    tr = await _start_trace("draft", req, x_trace)
     # Determine grant/pack from the session
     try:
-        sess = storage.sessions().get_entity(partition_key="session", row_key=req.session_id)
+        with tracing.span("session.read"):
+            sess = await storage.aget_session(req.session_id)
     except Exception:
+        tracing.finish(tr, status=404)
         raise HTTPException(status_code=404, detail="Session not found")
     
     grant = (sess.get("grant") or "EDG").lower()
-    return await _do_draft(req, response, pack_hint=grant)
+    return await _do_draft(req, response, pack_hint=grant, cache_mode=x_draft_cache)
 
 
 # ------------------------------------------------------------
 # Backward-Compatible Grant-Specific Wrappers
 # ------------------------------------------------------------
 @app.post("/v1/grants/edg/draft")
-async def draft_edg(req: DraftReq, response: Response):
+async def draft_edg(req: DraftReq, response: Response, x_draft_cache: str | None = Header(None),
+                    x_trace: str | None = Header(None)):
     """
     EDG-specific draft endpoint (backward-compatible wrapper).
     Forwards to unified draft logic with pack_hint='edg'.
     """
-    return await _do_draft(req, response, pack_hint="edg")
+    await _start_trace("draft", req, x_trace, pack_hint="edg")
+    return await _do_draft(req, response, pack_hint="edg", cache_mode=x_draft_cache)
 
 
 @app.post("/v1/grants/psg/draft")
-async def draft_psg(req: DraftReq, response: Response):
+async def draft_psg(req: DraftReq, response: Response, x_draft_cache: str | None = Header(None),
+                    x_trace: str | None = Header(None)):
     """
     PSG-specific draft endpoint (backward-compatible wrapper).
     Forwards to unified draft logic with pack_hint='psg'.
     """
-    return await _do_draft(req, response, pack_hint="psg")
+    await _start_trace("draft", req, x_trace, pack_hint="psg")
+    return await _do_draft(req, response, pack_hint="psg", cache_mode=x_draft_cache)
+
+# ------------------------------------------------------------
+# Batch Draft: every `type: draft` checklist task in one call
+# ------------------------------------------------------------
+class DraftBatchReq(BaseModel):
+    inputs: dict = {}          # shared by every section (framework, style, evidence_char_cap, ...)
+    sections: list[str] | None = None  # restrict to these checklist ids
+    stream: bool = False       # one SSE `section` event per section as it completes
+
+
+@app.post("/v1/session/{sid}/drafts:batch")
+async def draft_batch(sid: str, req: DraftBatchReq, response: Response, x_draft_cache: str | None = Header(None),
+                      x_trace: str | None = Header(None)):
+    """
+    Drafts all checklist sections for the session's grant concurrently.
+    Evidence blobs are downloaded once and shared across sections; AOAI calls
+    are bounded by DRAFT_BATCH.CONCURRENCY (App Config, default 4).
+    """
+    tr = await tracing.start("draft.batch", force=_force_trace(x_trace), session_id=sid, stream=req.stream)
+    try:
+        with tracing.span("session.read"):
+            sess = await storage.aget_session(sid)
+    except Exception:
+        tracing.finish(tr, status=404)
+        raise HTTPException(status_code=404, detail="Session not found")
+    grant = (sess.get("grant") or "EDG").upper()
+
+    tasks = [t for t in _checklist_tasks(grant) if t["type"] == "draft"]
+    if req.sections:
+        tasks = [t for t in tasks if t["id"] in req.sections]
+    if not tasks:
+        tracing.finish(tr, status=400)
+        raise HTTPException(status_code=400, detail="No draft sections to run")
+
+    try:
+        limit = max(1, int(await cfg_aget("DRAFT_BATCH.CONCURRENCY", "4")))
+    except (TypeError, ValueError):
+        limit = 4
+    sem = asyncio.Semaphore(limit)
+    evidence: dict = {}  # (label, cap) / ("digest", label) -> download task, shared by all sections
+
+    async def one(task: dict) -> dict:
+        dreq = DraftReq(session_id=sid, section_id=task["id"],
+                        section_variant=task.get("section_variant"), inputs=dict(req.inputs))
+        async with sem:
+            metrics.DRAFTS_IN_FLIGHT.inc()
+            try:
+                # spans inside land on the batch trace; this one groups them per section
+                with tracing.span("section", section_id=task["id"]):
+                    body, headers = await _complete_draft(dreq, pack_hint=grant.lower(), cache_mode=x_draft_cache,
+                                                          evidence=evidence)
+            except HTTPException as e:
+                return {"section_id": task["id"], "section_variant": task.get("section_variant"),
+                        "status": e.status_code, "error": e.detail}
+            finally:
+                metrics.DRAFTS_IN_FLIGHT.dec()
+        body["section_variant"] = task.get("section_variant")
+        body["status"] = 200
+        body.update(headers)
+        return body
+
+    def cleanup():
+        for t in evidence.values():
+            if not t.done():
+                t.cancel()
+
+    if req.stream:
+        async def events():
+            errors = 0
+            # real tasks, so a client that disconnects (generator closed) stops the sections still running
+            running = [asyncio.create_task(one(t)) for t in tasks]
+            try:
+                for fut in asyncio.as_completed(running):
+                    item = await fut
+                    errors += item["status"] != 200
+                    yield _sse("section", item)
+            finally:
+                for t in running:
+                    if not t.done():
+                        t.cancel()
+                cleanup()
+                tracing.finish(tr, status=200, grant=grant, sections=len(tasks), errors=errors)
+            yield _sse("done", {"session_id": sid, "grant": grant, "sections": len(tasks), "errors": errors})
+
+        headers = {"X-Accel-Buffering": "no"}
+        if tr is not None:
+            headers["x-trace-id"] = tr.trace_id
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    try:
+        results = await asyncio.gather(*(one(t) for t in tasks))
+    finally:
+        cleanup()
+    errors = sum(r["status"] != 200 for r in results)
+    if tr is not None:
+        response.headers["x-trace-id"] = tr.trace_id
+    tracing.finish(tr, status=200, grant=grant, sections=len(tasks), errors=errors)
+    return {"session_id": sid, "grant": grant, "results": results, "errors": errors}
+
+@app.get("/v1/session/{sid}/drafts")
+async def list_drafts(sid: str):
+    """Stored drafts of the session: one entry per section/variant with its version history."""
+    try:
+        drafts = await draft_store.list_drafts(sid)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list drafts: {str(e)}")
+    return {"session_id": sid, "drafts": drafts}
+
+
+@app.get("/v1/session/{sid}/drafts/{section_id}")
+async def get_draft(sid: str, section_id: str, response: Response,
+                    variant: str | None = Query(None),
+                    version: str | None = Query(None, pattern=r"^\d{8}T\d{12}Z$")):
+    """
+    Last generated draft for a section (or a given version from its history),
+    without calling the model. x-draft-source says whether it came from memory or blob.
+    """
+    try:
+        if version:
+            rec, source = await draft_store.get_version(sid, section_id, variant, version)
+        else:
+            rec, source = await draft_store.latest(sid, section_id, variant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rec is None:
+        raise HTTPException(status_code=404, detail="Draft not found")
+    response.headers["x-draft-source"] = source
+    return rec
+
 
 def _strip_label(sid: str, name: str) -> str:
     # safe strip without relying on removeprefix/removesuffix
@@ -397,19 +907,20 @@ def _strip_label(sid: str, name: str) -> str:
 @app.get("/v1/debug/evidence/{sid}")
 def debug_list_evidence(sid: str, preview: int = Query(0, ge=0, le=4000)):
     try:
-        # 1) list blobs
-        blobs = storage.list_blobs("evidence", prefix=f"{sid}_", suffix=".txt")
+        # 1) list blobs (sizes come free with the listing)
+        blobs = storage.list_blob_sizes("evidence", prefix=f"{sid}_", suffix=".txt")
 
-        # 2) optionally read previews
+        # 2) optionally read previews (ranged read of just the preview chars)
         items = []
-        for name in blobs:
+        for name, size in blobs:
             label = _strip_label(sid, name)
-            txt = storage.get_text("evidence", name) if preview else ""
+            txt = storage.get_text_capped("evidence", name, preview) if preview else ""
             items.append({
                 "name": name,
                 "label": label,
+                "bytes": size,
                 "chars": (len(txt) if txt else None),
-                "preview": (txt[:preview] if txt else "")
+                "preview": txt
             })
 
         return {"session_id": sid, "items": items}
@@ -419,14 +930,32 @@ def debug_list_evidence(sid: str, preview: int = Query(0, ge=0, le=4000)):
         raise HTTPException(status_code=500, detail=f"debug_list_evidence failed: {type(e).__name__}: {e}")
 
 
+@app.get("/v1/debug/cache")
+def debug_cache():
+    return {"sessions": storage.session_cache_stats(), "drafts": draft_cache.stats(),
+            "draft_store": draft_store.stats(), "evidence": evidence_store.stats(), "appcfg": appcfg.snapshot_stats(),
+            "shared": shared_cache.stats()}
+
+
+@app.post("/v1/debug/cache/invalidate")
+def debug_cache_invalidate(scope: str = Query("packs", pattern="^(packs|appcfg|secrets|all)$")):
+    """
+    Drop cached templates / config / secrets in every worker, e.g. after
+    re-indexing packs or rotating the AOAI key.
+    """
+    scopes = ["packs", "appcfg", "secrets"] if scope == "all" else [scope]
+    return {"invalidated": {ns: shared_cache.bump(ns) for ns in scopes}}
+
+
+@app.get("/v1/debug/tracing")
+def debug_tracing():
+    return tracing.stats()
+
+
 # dev-only
 @app.get("/v1/debug/packs")
 def debug_packs(pack: str = Query("psg"), ver: str = Query("latest-approved")):
-    endpoint = os.environ["AZURE_SEARCH_ENDPOINT"].rstrip("/")
-    query_key = os.environ["AZURE_SEARCH_QUERY_KEY"]
-    index_name = os.environ.get("AZURE_SEARCH_INDEX", "smartai-prompts")
-
-    client = SearchClient(endpoint, index_name, AzureKeyCredential(query_key))
+    client = clients.get("search")
 
     # Resolve latest-approved → concrete version using the same helper as the vault
     # Also canonicalize pack IDs to uppercase for explicit versions
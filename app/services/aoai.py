@@ -1,7 +1,18 @@
 # app/services/aoai.py
-import os, httpx
-from .secrets import get_secret
-from .appcfg import get
+import os, re, json, time, random, asyncio, httpx
+from typing import Optional
+from .secrets import aget_secret
+from .appcfg import get, get_bool, aget
+from . import metrics
+
+try:
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+    _HAS_H2 = True
+except ImportError:
+    _HAS_H2 = False
+
+# Process-wide pooled client (created lazily, closed from the FastAPI lifespan)
+_client: Optional[httpx.AsyncClient] = None
 
 def _get_endpoint() -> str:
     ep = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -10,25 +21,319 @@ def _get_endpoint() -> str:
     return ep.rstrip("/")
 
 # Pull key from Key Vault at runtime (cached)
-def _headers():
-    return {"api-key": get_secret("aoai-key-dev"), "Content-Type": "application/json"}
+async def _headers():
+    return {"api-key": await aget_secret("aoai-key-dev"), "Content-Type": "application/json"}
 
-def _deployment(use: str) -> str:
+async def _deployment(use: str) -> str:
     if use == "manager":
-        dep = get("MODEL.MANAGER", default="gpt-4.1-manager")
+        dep = await aget("MODEL.MANAGER", default="gpt-4.1-manager")
     else:
-        dep = get("MODEL.WORKER", default="gpt-4.1-mini-worker")
+        dep = await aget("MODEL.WORKER", default="gpt-4.1-mini-worker")
     return dep.strip()
 
-async def chat_completion(messages, *, use="worker", max_tokens=800, temperature=0.2, timeout=60):
+def _as_int(v, default: int) -> int:
+    return int(v) if str(v).strip().isdigit() else default
+
+def _as_float(v, default: float) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+def _cfg_int(key: str, default: int) -> int:
+    return _as_int(get(key, None), default)
+
+def _cfg_float(key: str, default: float) -> float:
+    return _as_float(get(key, None), default)
+
+async def _acfg_int(key: str, default: int) -> int:
+    return _as_int(await aget(key, None), default)
+
+async def _acfg_float(key: str, default: float) -> float:
+    return _as_float(await aget(key, None), default)
+
+def _limits() -> httpx.Limits:
+    # Pool sizing comes from App Config so it can be tuned without a redeploy
+    return httpx.Limits(
+        max_connections=_cfg_int("AOAI.MAX_CONNECTIONS", 20),
+        max_keepalive_connections=_cfg_int("AOAI.MAX_KEEPALIVE", 10),
+        keepalive_expiry=_cfg_float("AOAI.KEEPALIVE_EXPIRY", 60.0),
+    )
+
+def _new_client() -> httpx.AsyncClient:
+    http2 = _HAS_H2 and get_bool("AOAI.HTTP2", True)
+    return httpx.AsyncClient(http2=http2, limits=_limits(), timeout=60)
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client; reused across drafts so we skip TCP+TLS setup."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
+async def aclose() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+def _url(dep: str) -> str:
     endpoint = _get_endpoint()
-    dep = _deployment(use)
-    #url = f"{endpoint}/openai/deployments/{dep}/chat/completions?api-version=2024-10-01-preview"
-    url = f"{endpoint}/openai/deployments/{dep}/chat/completions?api-version=2024-02-15-preview"  # <= use a known-stable version
+    #return f"{endpoint}/openai/deployments/{dep}/chat/completions?api-version=2024-10-01-preview"
+    return f"{endpoint}/openai/deployments/{dep}/chat/completions?api-version=2024-02-15-preview"  # <= use a known-stable version
+
+# ------------------------------------------------------------
+# Scheduler: per-deployment token bucket + retry with jittered back-off
+#
+# App Config (read once per deployment, on first call):
+#   AOAI.RATE_RPS[.WORKER|.MANAGER]  steady requests/sec per deployment (0 = only server feedback)
+#   AOAI.BURST                       bucket size, default 10 (with RATE_RPS 0: requests in
+#                                    flight per deployment, each slot freed when its response ends)
+#   AOAI.MAX_RETRIES                 retries on 429/5xx/connect errors, default 3
+#   AOAI.QUEUE_MAX                   callers allowed to wait for a slot, default 100 (0 = unbounded)
+#   AOAI.QUEUE_TIMEOUT               max seconds a caller waits for a slot, default 30
+# ------------------------------------------------------------
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_BACKOFF_BASE = 0.5
+_BACKOFF_CAP = 8.0
+_WINDOW = 1.0  # quota window assumed when x-ratelimit-reset-requests is absent
+
+class RateLimited(RuntimeError):
+    """AOAI kept throttling (or the local queue is full); retry_after is a hint in seconds."""
+    def __init__(self, msg: str, retry_after: float = 1.0):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+_stats = {"requests": 0, "retries": 0, "throttled": 0, "queue_rejected": 0, "waited_s": 0.0}
+
+def scheduler_stats() -> dict:
+    st = dict(_stats)
+    st["waited_s"] = round(st["waited_s"], 3)
+    st["deployments"] = {dep: b.snapshot() for dep, b in _buckets.items()}
+    return st
+
+def _retry_after(headers) -> Optional[float]:
+    # AOAI sends retry-after-ms on some 429s, plain retry-after (seconds) on others
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        v = headers.get(name)
+        if v:
+            try:
+                return max(0.0, float(v) * scale)
+            except ValueError:
+                pass
+    return None
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)?")
+_UNIT = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0, None: 1.0}
+
+def _reset_after(headers) -> Optional[float]:
+    # x-ratelimit-reset-requests: "1s", "250ms", "6m0s" or plain seconds
+    v = (headers.get("x-ratelimit-reset-requests") or "").strip()
+    parts = _DURATION.findall(v) if v else []
+    if not parts or _DURATION.sub("", v):
+        return None
+    return sum(float(n) * _UNIT[u or None] for n, u in parts)
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": uniform(0, min(cap, base * 2^attempt))
+    return random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * (2 ** attempt)))
+
+class _Bucket:
+    """
+    Token bucket for one deployment. Waiters queue FIFO on the lock.
+    Server feedback (retry-after, x-ratelimit-remaining-*) pauses or drains it.
+    With rate 0 there is no steady refill: burst caps the requests in flight
+    (release() when a response ends), and the server's remaining-requests count
+    caps what is sent until its quota window resets (x-ratelimit-reset-requests).
+    """
+    def __init__(self, rate: float, burst: int, queue_max: int, queue_timeout: float, max_retries: int = 3):
+        self.rate = rate
+        self.max_retries = max_retries
+        self.burst = max(1, burst)
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.window_until = 0.0  # rate 0: server-reported quota holds until then
+        self.quota: Optional[float] = None  # rate 0: requests the server still takes this window
+        self.in_flight = 0
+        self.waiting = 0
+        self._lock = asyncio.Lock()
+        self._freed = asyncio.Event()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {"tokens": round(self.tokens, 2), "waiting": self.waiting, "in_flight": self.in_flight,
+                "paused_s": round(max(0.0, self.paused_until - now), 3),
+                "window_s": round(max(0.0, self.window_until - now), 3), "quota": self.quota}
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        else:
+            if now >= self.window_until:
+                self.quota = None
+            slots = float(self.burst - self.in_flight)
+            self.tokens = slots if self.quota is None else min(slots, self.quota)
+        self.updated = now
+
+    async def _take(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    if self.quota is not None:
+                        self.quota -= 1
+                    return
+                if self.rate > 0:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                elif self.quota is not None and self.quota < 1:
+                    await asyncio.sleep(max(0.001, self.window_until - now))
+                else:
+                    # every slot is in flight: wait for a response to end
+                    self._freed.clear()
+                    await self._freed.wait()
+
+    def release(self) -> None:
+        """A request taken with acquire() has finished (its response is read or closed)."""
+        self.in_flight = max(0, self.in_flight - 1)
+        self._freed.set()
+
+    async def acquire(self) -> None:
+        if self.queue_max and self.waiting >= self.queue_max:
+            _stats["queue_rejected"] += 1
+            raise RateLimited("AOAI request queue is full", retry_after=self.pause_left() or 1.0)
+        self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(self._take(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            _stats["queue_rejected"] += 1
+            raise RateLimited("timed out waiting for an AOAI slot", retry_after=self.pause_left() or 1.0)
+        finally:
+            self.waiting -= 1
+            _stats["waited_s"] += time.monotonic() - t0
+
+    def pause_left(self) -> float:
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe(self, r: httpx.Response) -> None:
+        ra = _retry_after(r.headers)
+        if r.status_code == 429:
+            self.pause(ra if ra is not None else 1.0)
+        elif ra is not None and r.status_code >= 500:
+            self.pause(ra)
+        # remaining quota in the current window: don't send more than the server will take
+        for name in ("x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens"):
+            v = r.headers.get(name)
+            if v is None:
+                continue
+            try:
+                left = float(v)
+            except ValueError:
+                continue
+            if left <= 0:
+                self.pause(ra if ra is not None else 1.0)
+            elif name.endswith("requests"):
+                self.tokens = min(self.tokens, left)
+                if self.rate <= 0:
+                    # no steady refill to undo the clamp: hold it for the server's window
+                    # (a guessed window is not extended by later responses)
+                    now, reset = time.monotonic(), _reset_after(r.headers)
+                    if reset is not None:
+                        self.window_until = now + reset
+                    elif now >= self.window_until:
+                        self.window_until = now + _WINDOW
+                    self.quota = left if self.quota is None else min(self.quota, left)
+
+_buckets: dict[str, _Bucket] = {}
+
+def _release(dep: str) -> None:
+    b = _buckets.get(dep)
+    if b is not None:
+        b.release()
+
+async def _bucket(use: str, dep: str) -> _Bucket:
+    b = _buckets.get(dep)
+    if b is None:
+        # App Config via aget: a snapshot miss goes to the I/O pool, not the loop
+        rate = await _acfg_float(f"AOAI.RATE_RPS.{use.upper()}", await _acfg_float("AOAI.RATE_RPS", 0.0))
+        b = _Bucket(rate, await _acfg_int("AOAI.BURST", 10), await _acfg_int("AOAI.QUEUE_MAX", 100),
+                    await _acfg_float("AOAI.QUEUE_TIMEOUT", 30.0), await _acfg_int("AOAI.MAX_RETRIES", 3))
+        b = _buckets.setdefault(dep, b)  # a concurrent first call may have won
+    return b
+
+async def _send(use: str, dep: str, payload: dict, timeout: float, *, stream: bool = False) -> httpx.Response:
+    """
+    POST through the deployment's bucket, retrying 429/5xx and connect errors.
+    Returns the last response (caller handles status). With stream=True the
+    caller must close it and then release its slot (_release).
+    """
+    t0 = time.perf_counter()
+    try:
+        r = await _send_with_retries(use, dep, payload, timeout, stream=stream)
+    except Exception:
+        metrics.AOAI_SECONDS.observe(time.perf_counter() - t0, dep, "error")
+        raise
+    metrics.AOAI_SECONDS.observe(time.perf_counter() - t0, dep, str(r.status_code))
+    return r
+
+async def _send_with_retries(use: str, dep: str, payload: dict, timeout: float, *, stream: bool) -> httpx.Response:
+    bucket = await _bucket(use, dep)
+    retries = bucket.max_retries
+    client = get_client()
+    for attempt in range(retries + 1):
+        await bucket.acquire()
+        _stats["requests"] += 1
+        try:
+            req = client.build_request("POST", _url(dep), headers=await _headers(), json=payload, timeout=timeout)
+            r = await client.send(req, stream=stream)
+        except (httpx.ConnectError, httpx.RemoteProtocolError):
+            bucket.release()
+            if attempt == retries:
+                raise
+            _stats["retries"] += 1
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        except BaseException:
+            bucket.release()
+            raise
+
+        bucket.observe(r)
+        if r.status_code == 429:
+            _stats["throttled"] += 1
+        if r.status_code not in _RETRY_STATUS or attempt == retries:
+            if not stream:
+                bucket.release()  # body already read
+            return r
+        if stream:
+            await r.aclose()
+        bucket.release()
+        _stats["retries"] += 1
+        # the bucket already holds everyone back for retry-after; add jitter on top
+        await asyncio.sleep(_backoff(attempt))
+    return r
+
+def _raise_throttled(r: httpx.Response, body: str):
+    raise RateLimited(f"AOAI 429: {body[:500]}", retry_after=_retry_after(r.headers) or 1.0)
+
+async def chat_completion(messages, *, use="worker", max_tokens=800, temperature=0.2, timeout=60):
+    dep = await _deployment(use)
 
     payload = {"messages": messages, "max_tokens": max_tokens, "temperature": temperature}
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        r = await client.post(url, headers=_headers(), json=payload)
+    r = await _send(use, dep, payload, timeout)
+    if r.status_code == 429:
+        _raise_throttled(r, r.text)
     if r.status_code == 404:
         raise ValueError(f"MODEL.WORKER/manager points to unknown deployment: '{dep}'")
     try:
@@ -41,4 +346,42 @@ async def chat_completion(messages, *, use="worker", max_tokens=800, temperature
         data = r.json()
     except Exception:
         raise RuntimeError(f"AOAI returned non-JSON ({r.status_code}): {r.text[:500]}")
-    return data["choices"][0]["message"]["content"]
\ No newline at end of file
+    return data["choices"][0]["message"]["content"]
+
+async def chat_completion_stream(messages, *, use="worker", max_tokens=800, temperature=0.2, timeout=60):
+    """
+    Same call as chat_completion but with AOAI `stream: true`.
+    Yields content deltas as they arrive; errors are raised before the first delta.
+    """
+    dep = await _deployment(use)
+
+    payload = {"messages": messages, "max_tokens": max_tokens, "temperature": temperature, "stream": True}
+    r = await _send(use, dep, payload, timeout, stream=True)
+    try:
+        if r.status_code == 404:
+            raise ValueError(f"MODEL.WORKER/manager points to unknown deployment: '{dep}'")
+        if r.status_code >= 400:
+            body = (await r.aread()).decode("utf-8", errors="replace")
+            if r.status_code == 429:
+                _raise_throttled(r, body)
+            raise RuntimeError(f"AOAI {r.status_code}: {body[:500]}")
+
+        # AOAI streams SSE lines: `data: {chunk}` ... `data: [DONE]`
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                continue
+            # content-filter preambles arrive with an empty choices list
+            for choice in chunk.get("choices") or []:
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+    finally:
+        await r.aclose()
+        _release(dep)
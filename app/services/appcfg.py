@@ -1,29 +1,229 @@
 # app/services/appcfg.py
-import os, time
+# Reads come from an in-memory snapshot of every key for APPCONFIG_LABEL,
+# loaded at startup and swapped whole by a background refresher, so the
+# request path does no App Config I/O. Before the first snapshot (or if it
+# failed) keys are fetched one by one with a TTL cache, one fetch per key.
+#
+# With several workers, snapshots and per-key values also go through
+# shared_cache. Workers that see the sentinel move race to claim the new ETag
+# (an atomic set-if-absent in the store); only the winner reloads from App
+# Config, publishes the snapshot and bumps "appcfg" (plus "packs" when pack pins
+# or PROMPT_VAULT.* changed); the others pick the snapshot up from the store.
+# A claim expires after one refresh interval, so a winner that dies is
+# replaced at the next poll.
+#
+# Env:
+#   APPCONFIG_REFRESH_SECONDS  refresher poll interval, default 30
+#   APPCONFIG_SENTINEL_KEY     bump this key to publish a change set, default SENTINEL;
+#                              if it doesn't exist every poll reloads the full snapshot
+import os, time, asyncio, threading
 from typing import Optional
-from azure.identity import DefaultAzureCredential
-from azure.appconfiguration import AzureAppConfigurationClient
+from . import blocking, clients, metrics, shared_cache
 
-_ENDPOINT = os.environ["APPCONFIG_ENDPOINT"]
 _LABEL   = os.environ.get("APPCONFIG_LABEL", None)
-_cred    = DefaultAzureCredential()
-_client  = AzureAppConfigurationClient(_ENDPOINT, credential=_cred)
+_REFRESH_SECONDS = float(os.environ.get("APPCONFIG_REFRESH_SECONDS", "30"))
+_SENTINEL_KEY = os.environ.get("APPCONFIG_SENTINEL_KEY", "SENTINEL")
+
+def _new_client():
+    from azure.appconfiguration import AzureAppConfigurationClient
+    return AzureAppConfigurationClient(clients.env("APPCONFIG_ENDPOINT"), credential=clients.credential())
+
+clients.register("appconfig", _new_client)
+
+def _client():
+    return clients.get("appconfig")
 
 _cache: dict[tuple[str, Optional[str]], tuple[str, float]] = {}  # (key,label) -> (val, expires)
+_key_locks: dict[str, threading.Lock] = {}
+_key_locks_guard = threading.Lock()
 
-def get(key: str, default: Optional[str] = None, *, ttl_seconds: int = 30) -> str:
-    now = time.time()
+# Whole-snapshot state; replaced by assignment, never mutated in place
+_snapshot: Optional[dict[str, str]] = None
+_snapshot_info = {"loaded_at": None, "sentinel_etag": None, "loads": 0, "polls": 0, "errors": 0, "deferred": 0}
+_refresher: Optional[asyncio.Task] = None
+_publishing = False  # set while this worker announces its own reload
+
+def _cached(key: str):
+    snap = _snapshot
+    if snap is not None:
+        return True, snap.get(key)
     k = (key, _LABEL)
-    if k in _cache and _cache[k][1] > now: return _cache[k][0]
-    try:
-        cfg = _client.get_configuration_setting(key=key, label=_LABEL)
-        val = cfg.value
-    except Exception:
-        val = default
-    _cache[k] = (val, now + ttl_seconds)
-    return val
+    if k in _cache and _cache[k][1] > time.time(): return True, _cache[k][0]
+    return False, None
+
+def _key_lock(key: str) -> threading.Lock:
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+def get(key: str, default: Optional[str] = None, *, ttl_seconds: int = 30) -> str:
+    hit, val = _cached(key)
+    if hit:
+        metrics.cache_result("appcfg", True)
+        return default if val is None else val
+    # single-flight: concurrent cold misses on one key share a single fetch
+    with _key_lock(key):
+        hit, val = _cached(key)
+        metrics.cache_result("appcfg", hit)
+        if hit: return default if val is None else val
+        hit, val = shared_cache.get("appcfg", f"{_LABEL}|{key}")
+        if not hit:
+            try:
+                cfg = _client().get_configuration_setting(key=key, label=_LABEL)
+                val = cfg.value
+            except Exception:
+                val = None
+            shared_cache.put("appcfg", f"{_LABEL}|{key}", val, ttl_seconds)
+        _cache[(key, _LABEL)] = (val, time.time() + ttl_seconds)
+    return default if val is None else val
 
 def get_bool(key: str, default: bool = False) -> bool:
     v = get(key, None)
     if v is None: return default
-    return str(v).lower() in ("1","true","yes","on")
\ No newline at end of file
+    return str(v).lower() in ("1","true","yes","on")
+
+async def aget(key: str, default: Optional[str] = None, *, ttl_seconds: int = 30) -> str:
+    # snapshot / cache hits stay on the loop; only misses go to the I/O pool
+    hit, val = _cached(key)
+    if hit:
+        metrics.cache_result("appcfg", True)
+        return default if val is None else val
+    return await blocking.run(get, key, default, ttl_seconds=ttl_seconds)
+
+async def aget_bool(key: str, default: bool = False) -> bool:
+    v = await aget(key, None)
+    if v is None: return default
+    return str(v).lower() in ("1","true","yes","on")
+
+# --- snapshot ----------------------------------------------------------------
+
+def _label_filter() -> str:
+    # no APPCONFIG_LABEL means the null label, same as get_configuration_setting(label=None)
+    return _LABEL if _LABEL is not None else "\0"
+
+def _sentinel_etag() -> Optional[str]:
+    try:
+        return _client().get_configuration_setting(key=_SENTINEL_KEY, label=_LABEL).etag
+    except Exception:
+        return None
+
+_PACK_KEYS = ("PROMPT_PACK_LATEST.", "PROMPT_VAULT.")
+
+def _snapshot_key() -> str:
+    return f"snapshot|{_LABEL}"
+
+def load_snapshot(*, publish: bool = False) -> int:
+    """
+    Bulk-load every key for the label and swap it in. Returns the key count.
+    Reuses a snapshot another worker published for the same sentinel ETag;
+    with publish=True (a change this worker detected) always reads App Config
+    and tells the other workers.
+    """
+    global _snapshot, _publishing
+    etag = _sentinel_etag()
+    snap = None
+    if not publish and etag is not None:
+        hit, shared = shared_cache.get("appcfg", _snapshot_key())
+        if hit and shared and shared.get("etag") == etag:
+            snap = shared["values"]
+    fetched = snap is None
+    if fetched:
+        settings = _client().list_configuration_settings(key_filter="*", label_filter=_label_filter())
+        snap = {s.key: s.value for s in settings}
+
+    old = _snapshot
+    _snapshot = snap
+    _cache.clear()
+    _snapshot_info.update(loaded_at=time.time(), sentinel_etag=etag, loads=_snapshot_info["loads"] + 1)
+
+    if fetched:
+        if publish:
+            _publishing = True
+            try:
+                shared_cache.bump("appcfg")
+            finally:
+                _publishing = False
+            if old is not None and any(old.get(k) != snap.get(k) for k in set(old) | set(snap)
+                                       if k.startswith(_PACK_KEYS)):
+                shared_cache.bump("packs")
+        shared_cache.put("appcfg", _snapshot_key(), {"etag": etag, "values": snap},
+                         max(60.0, 2 * _REFRESH_SECONDS))
+    return len(snap)
+
+def pin_snapshot(values: dict) -> None:
+    """Serve every key from `values`, with no App Config I/O (offline tools, tests)."""
+    global _snapshot
+    _snapshot = {k: str(v) for k, v in values.items()}
+    _cache.clear()
+    _snapshot_info.update(loaded_at=time.time(), sentinel_etag=None, loads=_snapshot_info["loads"] + 1)
+
+def _claim_reload(etag: str) -> bool:
+    # own namespace, so the winner's bump of "appcfg" doesn't drop the claim;
+    # unreachable store (None): reload as if alone
+    return shared_cache.add("appcfg.reload", f"{_LABEL}|{etag}", os.getpid(), max(5.0, _REFRESH_SECONDS)) is not False
+
+def refresh_if_changed() -> bool:
+    """One refresher poll: reload when the sentinel's ETag moved (or there is no sentinel)."""
+    _snapshot_info["polls"] += 1
+    etag = _sentinel_etag()
+    if _snapshot is not None and etag is not None and etag == _snapshot_info["sentinel_etag"]:
+        return False
+    if _snapshot is None or etag is None:
+        load_snapshot()
+        return True
+    if not _claim_reload(etag):
+        # another worker is reloading this change: take its snapshot once published
+        hit, shared = shared_cache.get("appcfg", _snapshot_key())
+        if not (hit and shared and shared.get("etag") == etag):
+            _snapshot_info["deferred"] += 1
+            return False
+        load_snapshot()
+        return True
+    load_snapshot(publish=True)
+    return True
+
+def _on_invalidate() -> None:
+    # another worker reloaded (or /v1/debug/cache/invalidate): drop per-key
+    # values and reload the snapshot, from the store when one was published
+    if _publishing:
+        return
+    _cache.clear()
+    if _snapshot is not None:
+        load_snapshot()
+
+shared_cache.on_invalidate("appcfg", _on_invalidate)
+
+def snapshot_stats() -> dict:
+    st = dict(_snapshot_info)
+    st["keys"] = len(_snapshot) if _snapshot is not None else None
+    st["age_s"] = round(time.time() - st["loaded_at"], 1) if st["loaded_at"] else None
+    return st
+
+async def _refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(_REFRESH_SECONDS)
+        try:
+            await blocking.run(refresh_if_changed)
+        except Exception:
+            # keep serving the last good snapshot
+            _snapshot_info["errors"] += 1
+
+async def start() -> None:
+    """Load the first snapshot and start the refresher (FastAPI lifespan)."""
+    global _refresher
+    try:
+        await blocking.run(load_snapshot)
+    except Exception:
+        # per-key fallback keeps working; the refresher retries the bulk load
+        _snapshot_info["errors"] += 1
+    if _refresher is None or _refresher.done():
+        _refresher = asyncio.create_task(_refresh_loop())
+
+async def stop() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        try:
+            await _refresher
+        except (asyncio.CancelledError, Exception):
+            pass
+    _refresher = None
@@ -0,0 +1,27 @@
+# app/services/blocking.py
+# Bounded thread pool for the synchronous Azure SDK clients (Blob, Table,
+# App Config, Key Vault, Search) so route handlers never block the event loop.
+import os, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+_MAX_WORKERS = int(os.environ.get("AZURE_IO_WORKERS", "32"))
+_pool: Optional[ThreadPoolExecutor] = None
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="azure-io")
+    return _pool
+
+async def run(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking SDK call on the shared pool and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), partial(fn, *args, **kwargs))
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
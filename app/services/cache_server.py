@@ -0,0 +1,80 @@
+# app/services/cache_server.py
+# Host-local cache server for multi-worker mode (see shared_cache.py).
+# startup.sh launches it next to gunicorn when more than one worker runs:
+#   python -m app.services.cache_server --socket /tmp/smartai-cache.sock
+# and waits for it to answer before starting the workers:
+#   python -m app.services.cache_server --socket /tmp/smartai-cache.sock --wait 10
+#
+# Protocol: one JSON object per line in each direction.
+#   {"op":"get","ns":..,"k":..}            -> {"hit":bool,"v":..}
+#   {"op":"set","ns":..,"k":..,"v":..,"ttl":s} -> {"ok":true}
+#   {"op":"add","ns":..,"k":..,"v":..,"ttl":s} -> {"ok":bool}  (set if absent)
+#   {"op":"bump","ns":..}                  -> {"gen":n}
+#   {"op":"gens"}                          -> {"gens":{ns:n}}
+#   {"op":"stats"}                         -> {"size":n,"gens":{..}}
+import argparse, asyncio, json, os, sys, time
+from .shared_cache import LocalStore, SocketStore
+
+async def _serve(path: str, max_entries: int) -> None:
+    store = LocalStore(max_entries)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    resp = store.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    resp = {"error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(resp, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)  # stale socket from a previous run
+    # secrets pass through here: owner (the app user) only. The umask makes the
+    # socket 0600 as bind() creates it, so it is never reachable by others.
+    old = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(handle, path=path)
+    finally:
+        os.umask(old)
+    os.chmod(path, 0o600)
+    print(f"cache server listening on {path}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+def wait_ready(path: str, timeout: float) -> bool:
+    """Poll the server at `path` with a stats request until it answers or `timeout` passes."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if os.path.exists(path) and SocketStore(path).size() is not None:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--socket", default=os.environ.get("SHARED_CACHE_SOCKET", "/tmp/smartai-cache.sock"))
+    ap.add_argument("--max-entries", type=int, default=int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", "20000")))
+    ap.add_argument("--wait", type=float, metavar="SECONDS",
+                    help="don't serve: exit 0 once a server on --socket answers, 1 after SECONDS")
+    args = ap.parse_args()
+    if args.wait is not None:
+        ok = wait_ready(args.socket, args.wait)
+        print(f"cache server on {args.socket}: {'ready' if ok else 'not answering'}", flush=True)
+        return 0 if ok else 1
+    try:
+        asyncio.run(_serve(args.socket, args.max_entries))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
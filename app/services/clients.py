@@ -0,0 +1,67 @@
+# app/services/clients.py
+# Shared credential + SDK client registry. Service modules register a factory
+# at import; the client (and the single DefaultAzureCredential they share) is
+# only built on first use, or up front by warm() from the FastAPI lifespan.
+# Importing app.main therefore needs no env vars and does no credential discovery.
+import os, threading, time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+_factories: Dict[str, Callable[[], Any]] = {}
+_instances: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+def env(name: str) -> str:
+    v = os.environ.get(name)
+    if not v:
+        raise RuntimeError(f"Azure client not configured: set {name}")
+    return v
+
+def register(name: str, factory: Callable[[], Any]) -> None:
+    _factories[name] = factory
+
+def get(name: str) -> Any:
+    inst = _instances.get(name)
+    if inst is not None:
+        return inst
+    with _lock:
+        inst = _instances.get(name)
+        if inst is None:
+            inst = _instances[name] = _factories[name]()
+    return inst
+
+def override(name: str, instance: Any) -> None:
+    """Swap in a client (tests, tools/fake_azure.py)."""
+    with _lock:
+        _instances[name] = instance
+
+def reset(name: Optional[str] = None) -> None:
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+def _credential():
+    from azure.identity import DefaultAzureCredential
+    return DefaultAzureCredential()
+
+register("credential", _credential)
+
+def credential():
+    return get("credential")
+
+def warm(names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Build the registered clients now so the first request doesn't pay for it.
+    Returns name -> build seconds, or the error text for clients that can't be built
+    (e.g. missing env in a partial dev setup); those stay lazy.
+    """
+    out: Dict[str, Any] = {}
+    for name in list(names or _factories):
+        t0 = time.perf_counter()
+        try:
+            get(name)
+            out[name] = round(time.perf_counter() - t0, 4)
+        except Exception as e:
+            out[name] = f"{type(e).__name__}: {e}"
+    return out
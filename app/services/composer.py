@@ -1,8 +1,9 @@
 # composer.py
-from .prompt_vault import retrieve_template
-from .appcfg import get as cfg_get
+from .prompt_vault import retrieve_template, aretrieve_template
+from .appcfg import get as cfg_get, aget as cfg_aget
+from . import blocking, digest, tracing
 
-import re
+import asyncio, functools, math, re, threading, time
 from typing import Dict, List, Tuple, Any, Optional
 
 # --- tiny mustache-ish helpers (no external deps) ----------------------------
@@ -59,6 +60,117 @@ def _render_label_blocks(text: str, labels: Dict[str, str]) -> str:
     rendered = re.sub(r"\s+", " ", rendered).strip()
     return rendered
 
+def _kv_replace(s: str, kv: Dict[str, str]) -> str:
+    for k, v in kv.items():
+        s = s.replace("{{" + k + "}}", str(v))
+    return s
+
+def _render_legacy(tpl: str, kv: Dict[str, str], labels: Dict[str, str]) -> str:
+    """Reference renderer (string passes); kept for equivalence checks against the compiled one."""
+    return _render_label_blocks(_kv_replace(tpl, kv), labels)
+
+# --- compiled templates ---------------------------------------------------------
+# A template is tokenised once into a flat op list; rendering is then a single
+# linear walk plus one whitespace pass. Same output as _render_legacy, except
+# that substituted values are inserted verbatim (never re-scanned for tags).
+
+_VARS = ("framework", "style", "length_limit", "evidence_window", "user_prompt")
+_TOKEN = re.compile(
+    r"{{#\s*labels\.(?P<open>[a-zA-Z0-9_]+)\s*}}"
+    r"|{{/\s*labels\.(?P<close>[a-zA-Z0-9_]+)\s*}}"
+    r"|{{\s*labels\.(?P<label>[a-zA-Z0-9_]+)\s*}}"
+    r"|{{(?P<var>" + "|".join(_VARS) + r")}}"
+)
+
+# op codes
+_LIT, _VAR, _LABEL, _BLOCK = 0, 1, 2, 3
+
+def compile_template(tpl: str) -> Tuple[tuple, ...]:
+    """
+    Ops: (_LIT, text) | (_VAR, name) | (_LABEL, key) | (_BLOCK, key, end)
+    A _BLOCK whose key is not in labels jumps to `end`. Mirrors the legacy
+    quirks: a close tag with a different key drops the block, a stray close
+    turns the rest of the template into plain text (refs still resolve), and
+    an unclosed block keeps its content.
+    """
+    root: list = []
+    stack: List[Tuple[str, list]] = []   # (block key, parent node list)
+    cur = root
+    raw = False
+    i = 0
+    for m in _TOKEN.finditer(tpl):
+        if m.start() > i:
+            cur.append((_LIT, tpl[i:m.start()]))
+        i = m.end()
+        if m.group("var"):
+            cur.append((_VAR, m.group("var")))
+        elif m.group("label"):
+            cur.append((_LABEL, m.group("label")))
+        elif raw:
+            cur.append((_LIT, m.group(0)))
+        elif m.group("open"):
+            stack.append((m.group("open"), cur))
+            cur = []
+        elif stack:
+            key, parent = stack.pop()
+            if key == m.group("close"):
+                parent.append(("block", key, cur))
+            cur = parent
+        else:
+            raw = True
+            cur.append((_LIT, m.group(0)))
+    if i < len(tpl):
+        cur.append((_LIT, tpl[i:]))
+    while stack:  # unclosed blocks: keep content unconditionally
+        _, parent = stack.pop()
+        parent.extend(cur)
+        cur = parent
+
+    ops: list = []
+    def flatten(nodes):
+        for n in nodes:
+            if n[0] == "block":
+                at = len(ops)
+                ops.append(None)
+                flatten(n[2])
+                ops[at] = (_BLOCK, n[1], len(ops))
+            else:
+                ops.append(n)
+    flatten(cur)
+    return tuple(ops)
+
+def render_compiled(ops: Tuple[tuple, ...], kv: Dict[str, str], labels: Dict[str, str]) -> str:
+    out: List[str] = []
+    i, n = 0, len(ops)
+    while i < n:
+        op = ops[i]
+        code = op[0]
+        if code == _LIT:
+            out.append(op[1])
+        elif code == _VAR:
+            out.append(kv[op[1]])
+        elif code == _LABEL:
+            out.append(labels.get(op[1], ""))
+        elif op[1] not in labels:
+            i = op[2]
+            continue
+        i += 1
+    # collapse whitespace runs + strip (same as re.sub(r"\s+", " ", ...).strip())
+    return " ".join("".join(out).split())
+
+_compiled: Dict[Tuple[Any, Any, Any], Tuple[str, Tuple[tuple, ...]]] = {}
+# key=(pack_id, version, template_key) -> (source text, ops)
+
+def _compiled_for(tpl_obj: dict, tpl: str) -> Tuple[tuple, ...]:
+    meta = tpl_obj.get("metadata") or {}
+    key = (tpl_obj.get("pack_id"), tpl_obj.get("version"), meta.get("template_key") or meta.get("section_id"))
+    item = _compiled.get(key)
+    # recompile if the text behind the key changed (e.g. pack edited without a version bump)
+    if item is None or (item[0] is not tpl and item[0] != tpl):
+        item = (tpl, compile_template(tpl))
+        _compiled[key] = item
+    return item[1]
+
 # --- evidence label helpers ---------------------------------------------------
 
 _LABEL_HEAD = re.compile(r'---\s*\[evidence:([^\]]+)\]\s*---')
@@ -106,6 +218,223 @@ def _labels_map_from_available(avail: List[str]) -> Dict[str, str]:
     if "consultant_proposal" in avail:    m["consultant_proposal"] = "consultant_proposal"
     return m
 
+# --- token budget -------------------------------------------------------------
+# The prompt is sized in tokens of the worker model instead of evidence
+# characters: system + template + operator prompt are counted, evidence gets
+# what is left of PROMPT_TOKENS, and max_tokens follows the request's length_limit
+# (words, default 350), the same value that fills the template's "Max words".
+# The allocation is reported with the draft.
+#
+# Token counts come from tiktoken (requirements.txt; >= 0.7 for o200k_base) when
+# its encoding is loaded, else from a word/digit/punctuation estimate that errs
+# high. Counts of repeated texts (system message, rendered template) are memoised.
+#
+# Loading an encoding may download its BPE file (offline hosts: pre-seed
+# TIKTOKEN_CACHE_DIR), so counting never loads one: the lifespan and
+# anew_budget() load it on the I/O pool (one load at a time per encoding), and
+# until it is there the estimate is used. A failed load is retried after
+# _ENCODER_RETRY_SECONDS.
+#
+# App Config:
+#   TOKEN_BUDGET.ENABLED            default true (false: character caps + fixed max_tokens)
+#   TOKEN_BUDGET.PROMPT_TOKENS      whole prompt, default 3000
+#   TOKEN_BUDGET.OPERATOR_TOKENS    cap on the operator's free-text prompt, default 300
+#   TOKEN_BUDGET.TOKENS_PER_WORD    max_tokens = length_limit * this, default 2.0
+#                                   (~1.3 tokens/word + headings, citations, overshoot)
+#   TOKEN_BUDGET.MAX_OUTPUT_TOKENS  ceiling for max_tokens, default 2048
+#   TOKEN_BUDGET.ENCODING           tiktoken encoding of the worker model, default o200k_base
+#   EVIDENCE_CHAR_CAP               still honoured as an upper bound when set
+
+SYSTEM_PROMPT = "You are a grant consultant. Use only the provided evidence; cite factual claims with [source:<label>]."
+_MSG_TOKENS = 4      # per-message framing in the chat format
+_REPLY_TOKENS = 3    # assistant reply priming
+_MIN_OUTPUT = 256
+_CHARS_PER_TOKEN = 5  # evidence chars to load per budgeted token (generous: the composer trims exactly)
+_MEMO_CHARS = 16384   # longer texts (evidence) are counted without memoising
+
+_ENCODER_RETRY_SECONDS = 300.0
+
+_encoders: Dict[str, Tuple[Any, float]] = {}  # name -> (encoder or None, retry load after)
+_encoder_lock = threading.Lock()
+_encoder_loads: Dict[str, "asyncio.Task"] = {}
+
+def _encoder(name: str):
+    """The loaded encoder, or None (not loaded yet, or failed): never loads."""
+    item = _encoders.get(name)
+    return item[0] if item else None
+
+def _needs_load(name: str) -> bool:
+    item = _encoders.get(name)
+    return item is None or (item[0] is None and time.monotonic() >= item[1])
+
+def load_encoder(name: str):
+    """Load a tiktoken encoding (blocking: may download). Sync callers and the I/O pool only."""
+    with _encoder_lock:
+        if _needs_load(name):
+            try:
+                import tiktoken
+                _encoders[name] = (tiktoken.get_encoding(name), 0.0)
+            except Exception:
+                # not installed, unknown encoding, or its BPE file can't be fetched
+                _encoders[name] = (None, time.monotonic() + _ENCODER_RETRY_SECONDS)
+            _count_memo.cache_clear()  # counts so far came from the estimate
+    return _encoder(name)
+
+async def aload_encoder(name: str):
+    """load_encoder on the I/O pool; concurrent callers share one load."""
+    if not _needs_load(name):
+        return _encoder(name)
+    task = _encoder_loads.get(name)
+    if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+        task = _encoder_loads[name] = asyncio.create_task(blocking.run(load_encoder, name))
+    return await asyncio.shield(task)
+
+_EST = re.compile(r"[^\W\d_]+|\d{1,3}|\n+|[^\w\s]|_")
+
+def estimate_tokens(text: str) -> int:
+    """Fallback count: one token per short word, digit group or symbol; long words cost more."""
+    n = 0
+    for m in _EST.finditer(text):
+        w = m.end() - m.start()
+        n += 1 + (w - 1) // 8 if text[m.start()].isalpha() else 1
+    return n
+
+def _count(text: str, encoding: str) -> int:
+    enc = _encoder(encoding)
+    return len(enc.encode(text, disallowed_special=())) if enc is not None else estimate_tokens(text)
+
+_count_memo = functools.lru_cache(maxsize=2048)(_count)
+
+def count_tokens(text: str, encoding: str = "o200k_base") -> int:
+    if not text:
+        return 0
+    return _count_memo(text, encoding) if len(text) <= _MEMO_CHARS else _count(text, encoding)
+
+def trim_tokens(text: str, limit: int, encoding: str = "o200k_base") -> Tuple[str, int, bool]:
+    """Longest prefix of `text` within `limit` tokens: (prefix, tokens, was_cut)."""
+    n = count_tokens(text, encoding)
+    if n <= limit:
+        return text, n, False
+    if limit <= 0:
+        return "", 0, True
+    enc = _encoder(encoding)
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())[:limit]
+        return enc.decode(ids), len(ids), True
+    cut = len(text) * limit // n
+    while cut > 0:
+        head = text[:cut]
+        m = estimate_tokens(head)
+        if m <= limit:
+            return head, m, True
+        cut = min(cut - 1, int(cut * limit / m))
+    return "", 0, True
+
+class TokenBudget:
+    """Token allocation for one section's prompt; filled in by composition, reported with the draft."""
+    __slots__ = ("encoding", "prompt_budget", "operator_limit", "tokens_per_word", "max_output",
+                 "template_tokens", "operator_tokens", "evidence_budget", "evidence_tokens",
+                 "evidence_truncated", "length_limit", "max_tokens")
+
+    def __init__(self, *, encoding: str = "o200k_base", prompt_budget: int = 3000, operator_limit: int = 300,
+                 tokens_per_word: float = 2.0, max_output: int = 2048):
+        self.encoding = encoding
+        self.prompt_budget = prompt_budget
+        self.operator_limit = operator_limit
+        self.tokens_per_word = tokens_per_word
+        self.max_output = max(_MIN_OUTPUT, max_output)
+        self.template_tokens = self.operator_tokens = self.evidence_tokens = 0
+        self.evidence_budget = prompt_budget
+        self.evidence_truncated = False
+        self.length_limit = 0
+        self.max_tokens = _MIN_OUTPUT
+
+    @property
+    def tokenizer(self) -> str:
+        return f"tiktoken:{self.encoding}" if _encoder(self.encoding) is not None else "estimate"
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.template_tokens + self.operator_tokens + self.evidence_tokens
+
+    def evidence_chars(self) -> int:
+        """Characters of evidence worth loading for this budget."""
+        return self.evidence_budget * _CHARS_PER_TOKEN
+
+    def size_output(self, length_limit: int) -> None:
+        self.length_limit = length_limit
+        self.max_tokens = min(self.max_output, max(_MIN_OUTPUT, math.ceil(length_limit * self.tokens_per_word)))
+
+    def as_dict(self) -> dict:
+        return {
+            "tokenizer": self.tokenizer,
+            "prompt_budget": self.prompt_budget,
+            "prompt_tokens": self.prompt_tokens,
+            "template_tokens": self.template_tokens,
+            "operator_tokens": self.operator_tokens,
+            "evidence_budget": self.evidence_budget,
+            "evidence_tokens": self.evidence_tokens,
+            "evidence_truncated": self.evidence_truncated,
+            "length_limit": self.length_limit,
+            "max_tokens": self.max_tokens,
+        }
+
+def _budget_from(raw: Dict[str, Optional[str]]) -> Optional[TokenBudget]:
+    if str(raw.get("ENABLED") or "true").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    def num(key, default, cast=int):
+        try:
+            v = cast(str(raw.get(key)).strip())
+            return v if v > 0 else default
+        except (TypeError, ValueError):
+            return default
+    return TokenBudget(
+        encoding=(raw.get("ENCODING") or "o200k_base").strip(),
+        prompt_budget=num("PROMPT_TOKENS", 3000),
+        operator_limit=num("OPERATOR_TOKENS", 300),
+        tokens_per_word=num("TOKENS_PER_WORD", 2.0, float),
+        max_output=num("MAX_OUTPUT_TOKENS", 2048),
+    )
+
+_BUDGET_KEYS = ("ENABLED", "PROMPT_TOKENS", "OPERATOR_TOKENS", "TOKENS_PER_WORD", "MAX_OUTPUT_TOKENS", "ENCODING")
+
+def new_budget() -> Optional[TokenBudget]:
+    """A TokenBudget from App Config, or None when TOKEN_BUDGET.ENABLED is false."""
+    budget = _budget_from({k: cfg_get(f"TOKEN_BUDGET.{k}", None) for k in _BUDGET_KEYS})
+    if budget is not None:
+        load_encoder(budget.encoding)
+    return budget
+
+async def anew_budget() -> Optional[TokenBudget]:
+    budget = _budget_from({k: await cfg_aget(f"TOKEN_BUDGET.{k}", None) for k in _BUDGET_KEYS})
+    if budget is not None:
+        await aload_encoder(budget.encoding)  # no-op once loaded
+    return budget
+
+async def aplan_budget(
+    section_id: str,
+    framework: str,
+    inputs: dict,
+    *,
+    section_variant: Optional[str] = None,
+    pack_hint: Optional[str] = None,
+) -> Optional[TokenBudget]:
+    """
+    Allocate the budget before evidence is loaded: the evidence share is what
+    the section's template and operator prompt leave (see evidence_chars()).
+    acompose_instruction(budget=...) then re-measures with the real evidence.
+    """
+    budget = await anew_budget()
+    if budget is None:
+        return None
+    try:
+        tpl_obj = await aretrieve_template(section_id, tags=_retrieval_tags(section_id, framework, inputs, section_variant),
+                                           section_variant=section_variant, pack_hint=pack_hint) or {}
+    except Exception:
+        tpl_obj = {}  # composition reports vault errors
+    _render_instruction(framework, inputs, "", tpl_obj, None, budget)
+    return budget
+
 # --- main entrypoint ----------------------------------------------------------
 
 def compose_instruction(
@@ -116,35 +445,108 @@ def compose_instruction(
     *,
     section_variant: Optional[str] = None,
     pack_hint: Optional[str] = None,
+    budget: Optional[TokenBudget] = None,
 ) -> Tuple[List[Dict[str, str]], str, List[str]]:
     """
     Returns (messages, pack_header, evidence_order_used)
     - messages: for chat completion
     - pack_header: 'pack@version' string (for x-prompt-pack)
     - evidence_order_used: the labels we prioritized
+    With `budget` the prompt is fitted to it (evidence trimmed in tokens) and
+    the budget is filled in with the measured allocation and max_tokens.
     """
+    # Retrieve template (+metadata) with awareness of variant & pack if provided
+    tpl_obj = retrieve_template(
+        section_id,
+        tags=_retrieval_tags(section_id, framework, inputs, section_variant),
+        section_variant=section_variant,   # <-- supports Day-7 delta
+        pack_hint=pack_hint
+    ) or {}
+    return _render_instruction(framework, inputs, evidence_snippet, tpl_obj, cfg_get("EVIDENCE_CHAR_CAP"), budget)
 
-    style = inputs.get("style", "Formal, consultant voice")
-    length = int(inputs.get("length_limit", 350))
-    grant = (inputs.get("grant") or inputs.get("grant_id") or "edg").lower()
-    user_prompt = (inputs.get("prompt") or "").strip()
+async def acompose_instruction(
+    section_id: str,
+    framework: str,
+    inputs: dict,
+    evidence_snippet: str = "",
+    *,
+    section_variant: Optional[str] = None,
+    pack_hint: Optional[str] = None,
+    budget: Optional[TokenBudget] = None,
+) -> Tuple[List[Dict[str, str]], str, List[str]]:
+    """Async compose_instruction: template + config lookups never block the event loop."""
+    with tracing.span("template.retrieve", section_id=section_id, variant=section_variant) as sp:
+        tpl_obj = await aretrieve_template(
+            section_id,
+            tags=_retrieval_tags(section_id, framework, inputs, section_variant),
+            section_variant=section_variant,
+            pack_hint=pack_hint
+        ) or {}
+        sp["pack"] = f"{tpl_obj.get('pack_id')}@{tpl_obj.get('version')}"
+    cap_cfg = await cfg_aget("EVIDENCE_CHAR_CAP")
+    with tracing.span("compose") as sp:
+        out = _render_instruction(framework, inputs, evidence_snippet, tpl_obj, cap_cfg, budget)
+        if budget is not None:
+            sp["prompt_tokens"] = budget.prompt_tokens
+            sp["max_tokens"] = budget.max_tokens
+        return out
+
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$", re.M)
+_terms_memo: Dict[Tuple[Any, ...], Tuple[str, ...]] = {}
+
+async def aevidence_terms(
+    section_id: str,
+    framework: str,
+    inputs: dict,
+    *,
+    section_variant: Optional[str] = None,
+    pack_hint: Optional[str] = None,
+) -> Tuple[str, ...]:
+    """
+    Query terms for ranking evidence chunks: the section's retrieval tags
+    (request + template metadata) and the template's markdown headings.
+    The template lookup is the same cached one acompose_instruction does next.
+    """
+    tags = _retrieval_tags(section_id, framework, inputs, section_variant)
+    try:
+        tpl_obj = await aretrieve_template(section_id, tags=tags, section_variant=section_variant,
+                                           pack_hint=pack_hint) or {}
+    except Exception:
+        tpl_obj = {}  # composition reports vault errors; rank on the tags alone
+    meta = tpl_obj.get("metadata") or {}
+    key = (tuple(tags), tpl_obj.get("pack_id"), tpl_obj.get("version"), meta.get("template_key"))
+    terms = _terms_memo.get(key)
+    if terms is None:
+        headings = _HEADING.findall(tpl_obj.get("template") or "")
+        terms = digest.query_terms(" ".join(tags), " ".join(meta.get("retrieval_tags") or []), *headings)
+        if len(_terms_memo) > 1024:
+            _terms_memo.clear()
+        _terms_memo[key] = terms
+    return terms
 
+def _retrieval_tags(section_id: str, framework: str, inputs: dict, section_variant: Optional[str]) -> List[str]:
+    grant = (inputs.get("grant") or inputs.get("grant_id") or "edg").lower()
     # tags help retrieval choose variant-specific prompts too
     tags = [section_id, framework.lower(), grant] + list(inputs.get("tags", []))
     if section_variant:
         # add variant tokens to help retrieval ranking
         tags += section_variant.replace(".", " ").replace("__", " ").split()
+    return tags
 
-    # Retrieve template (+metadata) with awareness of variant & pack if provided
-    tpl_obj = retrieve_template(
-        section_id,
-        tags=tags,
-        section_variant=section_variant,   # <-- supports Day-7 delta
-        pack_hint=pack_hint
-    ) or {}
-
+def _render_instruction(
+    framework: str,
+    inputs: dict,
+    evidence_snippet: str,
+    tpl_obj: dict,
+    cap_cfg: Optional[str],
+    budget: Optional[TokenBudget] = None,
+) -> Tuple[List[Dict[str, str]], str, List[str]]:
     tpl = tpl_obj.get("template") or ""
     metadata = tpl_obj.get("metadata", {})
+
+    style = inputs.get("style", "Formal, consultant voice")
+    length = int(inputs.get("length_limit", 350))
+    user_prompt = (inputs.get("prompt") or "").strip()
     pack_header = f"{tpl_obj.get('pack_id','unknown')}@{tpl_obj.get('version','0.0.0')}"
 
     # Evidence selection
@@ -165,43 +567,55 @@ def compose_instruction(
     # Build labels map for optional blocks
     labels_map = _labels_map_from_available(chosen_order)
 
+    ops = _compiled_for(tpl_obj, tpl)
+
+    def render(evidence_window: str, user_prompt: str) -> str:
+        # Fill {{framework}}, {{style}}, {{length_limit}}, {{evidence_window}}, {{user_prompt}},
+        # optional label blocks and {{labels.*}} in one pass over the precompiled template
+        prompt_text = render_compiled(ops, {
+            "framework": str(framework),
+            "style": str(style),
+            "length_limit": str(length),
+            "evidence_window": evidence_window,
+            "user_prompt": user_prompt
+        }, labels_map)
+
+        # Prepend the operator's free-text prompt so the model MUST address it
+        if user_prompt:
+            prompt_text = (
+                "Operator prompt (must be addressed explicitly): "
+                + user_prompt
+                + "\n\n"
+                + prompt_text
+            )
+        return prompt_text
+
     # Evidence window
-    cap_cfg = cfg_get("EVIDENCE_CHAR_CAP")
-    cap = int(cap_cfg) if str(cap_cfg).isdigit() else 6000
-    evidence_window = (evidence_snippet or "")[: cap]
-
-    # Fill core vars first (leave labels blocks untouched here)
-    # We use a lightweight replace for {{framework}}, {{style}}, {{length_limit}}, {{evidence_window}}
-    def _kv_replace(s: str, kv: Dict[str, str]) -> str:
-        for k, v in kv.items():
-            s = s.replace("{{" + k + "}}", str(v))
-        return s
-
-    prompt_text = _kv_replace(tpl, {
-        "framework": framework,
-        "style": style,
-        "length_limit": str(length),
-        "evidence_window": evidence_window,
-        "user_prompt": user_prompt
-    })
-
-    # Render optional label blocks + substitute {{labels.*}}
-    prompt_text = _render_label_blocks(prompt_text, labels_map)
-
-    # Prepend the operator's free-text prompt so the model MUST address it
-    if user_prompt:
-        prompt_text = (
-            "Operator prompt (must be addressed explicitly): "
-            + user_prompt
-            + "\n\n"
-            + prompt_text
-        )
+    if budget is None:
+        cap = int(cap_cfg) if str(cap_cfg).isdigit() else 6000
+        prompt_text = render((evidence_snippet or "")[: cap], user_prompt)
+    else:
+        # characters only bound the window when EVIDENCE_CHAR_CAP is set; tokens decide
+        evidence = evidence_snippet or ""
+        if str(cap_cfg).isdigit():
+            evidence = evidence[: int(cap_cfg)]
+        enc = budget.encoding
+        user_prompt = trim_tokens(user_prompt, budget.operator_limit, enc)[0]
+        frame = count_tokens(SYSTEM_PROMPT, enc) + 2 * _MSG_TOKENS + _REPLY_TOKENS
+        budget.template_tokens = frame + count_tokens(render("", ""), enc)
+        budget.operator_tokens = (frame + count_tokens(render("", user_prompt), enc) - budget.template_tokens
+                                  if user_prompt else 0)
+        budget.evidence_budget = max(0, budget.prompt_budget - budget.template_tokens - budget.operator_tokens)
+        window, budget.evidence_tokens, budget.evidence_truncated = trim_tokens(evidence, budget.evidence_budget, enc)
+        budget.evidence_truncated = budget.evidence_truncated or len(evidence) < len(evidence_snippet or "")
+        budget.size_output(length)
+        prompt_text = render(window, user_prompt)
 
     # Final messages; keep system brief and generic to avoid over-constraining the template
     messages = [
         {
             "role": "system",
-            "content": "You are a grant consultant. Use only the provided evidence; cite factual claims with [source:<label>]."
+            "content": SYSTEM_PROMPT
         },
         {
             "role": "user",
@@ -0,0 +1,188 @@
+# app/services/digest.py
+# Evidence digests: a label's text split into chunks with BM25 term statistics,
+# built once per uploaded label (uploads/extraction stage, or lazily on first
+# use) and stored next to the text as evidence/{sid}_{label}.digest.json.
+#
+# The draft path ranks chunks against the section's query terms (retrieval tags
+# + template headings), memoised per digest, and packs the best chunks into the
+# evidence budget instead of cutting the concatenated text at max_chars.
+#
+# Stdlib only: build() also runs in the extraction process pool.
+import math, re
+from typing import Dict, List, Optional, Tuple
+
+VERSION = 1
+CHUNK_CHARS = 800
+_K1, _B = 1.2, 0.75
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOP = frozenset("""
+a an and are as at be been by for from has have in into is it its of on or our that the their this
+to was were will with which who we you your not but than then there these those such can may also
+""".split())
+
+def _stem(w: str) -> str:
+    # just enough folding for tags vs prose: "customers" ~ "customer", "activities" ~ "activity"
+    if len(w) > 4 and w.endswith("ies"):
+        return w[:-3] + "y"
+    if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+        return w[:-1]
+    return w
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(w) for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in _STOP]
+
+_PARA = re.compile(r"\n\s*\n")
+_SENT = re.compile(r"(?<=[.!?;:])\s+|\n")
+
+def _split_long(para: str, size: int) -> List[str]:
+    out, cur = [], ""
+    for piece in _SENT.split(para):
+        while len(piece) > size:  # no boundary at all: hard cut
+            if cur:
+                out.append(cur)
+                cur = ""
+            out.append(piece[:size])
+            piece = piece[size:]
+        if cur and len(cur) + 1 + len(piece) > size:
+            out.append(cur)
+            cur = piece
+        else:
+            cur = f"{cur} {piece}" if cur else piece
+    if cur:
+        out.append(cur)
+    return out
+
+def chunk(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """Paragraph-aligned chunks of about `size` chars (long paragraphs split at sentences)."""
+    chunks: List[str] = []
+    cur = ""
+    for para in _PARA.split(text or ""):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) > size * 1.5:
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            chunks.extend(_split_long(para, size))
+        elif cur and len(cur) + 2 + len(para) > size:
+            chunks.append(cur)
+            cur = para
+        else:
+            cur = f"{cur}\n\n{para}" if cur else para
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+def build(text: str, size: int = CHUNK_CHARS) -> dict:
+    """JSON-serialisable digest: chunks, per-chunk term counts, document frequencies."""
+    chunks = chunk(text, size)
+    tfs: List[Dict[str, int]] = []
+    df: Dict[str, int] = {}
+    for c in chunks:
+        tf: Dict[str, int] = {}
+        for t in tokenize(c):
+            tf[t] = tf.get(t, 0) + 1
+        tfs.append(tf)
+        for t in tf:
+            df[t] = df.get(t, 0) + 1
+    return {"v": VERSION, "chunks": chunks, "tf": tfs, "len": [sum(tf.values()) for tf in tfs], "df": df}
+
+class Digest:
+    """A loaded digest with memoised rankings (one per distinct query)."""
+    __slots__ = ("chunks", "tf", "lens", "df", "avgdl", "chars", "_ranked")
+
+    def __init__(self, d: dict):
+        self.chunks: List[str] = d.get("chunks") or []
+        self.tf: List[Dict[str, int]] = d.get("tf") or []
+        self.lens: List[int] = d.get("len") or []
+        self.df: Dict[str, int] = d.get("df") or {}
+        self.avgdl = (sum(self.lens) / len(self.lens)) if self.lens else 0.0
+        self.chars = sum(len(c) for c in self.chunks) + 2 * max(0, len(self.chunks) - 1)
+        self._ranked: Dict[Tuple[str, ...], List[Tuple[float, int]]] = {}
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(self.chunks)
+
+    def rank(self, terms: Tuple[str, ...]) -> List[Tuple[float, int]]:
+        """(score, chunk index), best first; ties and zero scores keep document order."""
+        hit = self._ranked.get(terms)
+        if hit is not None:
+            return hit
+        n = len(self.chunks)
+        idf = {t: math.log(1 + (n - self.df[t] + 0.5) / (self.df[t] + 0.5)) for t in set(terms) if t in self.df}
+        scored = []
+        for i, tf in enumerate(self.tf):
+            s = 0.0
+            norm = _K1 * (1 - _B + _B * (self.lens[i] / self.avgdl if self.avgdl else 0))
+            for t, w in idf.items():
+                f = tf.get(t)
+                if f:
+                    s += w * f * (_K1 + 1) / (f + norm)
+            scored.append((s, i))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        if len(self._ranked) > 32:
+            self._ranked.clear()
+        self._ranked[terms] = scored
+        return scored
+
+def query_terms(*texts: str) -> Tuple[str, ...]:
+    """Unique query tokens, in a stable order so equal queries share a memo entry."""
+    return tuple(sorted({t for text in texts for t in tokenize(text)}))
+
+def _header(label: str) -> str:
+    # same separator the composer parses labels from
+    return f"\n\n--- [evidence:{label}] ---\n"
+
+_GAP = "\n[...]\n"
+
+def pack(items: List[Tuple[str, Digest]], terms: Tuple[str, ...], budget: int) -> Tuple[str, List[str]]:
+    """
+    Fill `budget` chars with the best chunks of each label (items in priority
+    order). Every label first gets its best chunk, then chunks are taken by
+    score across labels. Output keeps label order and document order within a
+    label, marking skipped text with [...]. Returns (snippet, labels_used).
+    """
+    items = [(label, d) for label, d in items if d is not None and d.chunks]
+    if not items or budget <= 0:
+        return "", []
+    if sum(len(_header(label)) + d.chars for label, d in items) <= budget:
+        return "".join(_header(label) + d.text for label, d in items), [label for label, _ in items]
+
+    rankings = [d.rank(terms) for _, d in items]
+    firsts = [(li, r[0][1]) for li, r in enumerate(rankings)]
+    rest = sorted(((s, li, ci) for li, r in enumerate(rankings) for s, ci in r[1:]),
+                  key=lambda x: (-x[0], x[1], x[2]))
+    chosen: Dict[int, List[int]] = {}
+    remaining = budget
+    for li, ci in firsts + [(li, ci) for _, li, ci in rest]:
+        if li in chosen and ci in chosen[li]:
+            continue
+        label, d = items[li]
+        cost = len(d.chunks[ci]) + (len(_header(label)) if li not in chosen else len(_GAP))
+        if cost <= remaining:
+            chosen.setdefault(li, []).append(ci)
+            remaining -= cost
+    if not chosen:
+        # even the best chunk of the first label is larger than the budget: cut it
+        ci = firsts[0][1]
+        label, d = items[0]
+        return (_header(label) + d.chunks[ci])[:budget], [label]
+    parts, used = [], []
+    for li, (label, d) in enumerate(items):
+        if li not in chosen:
+            continue
+        idx = sorted(chosen[li])
+        body = [d.chunks[idx[0]]]
+        for prev, ci in zip(idx, idx[1:]):
+            body.append(("\n\n" if ci == prev + 1 else _GAP) + d.chunks[ci])
+        parts.append(_header(label) + "".join(body))
+        used.append(label)
+    return "".join(parts)[:budget], used
+
+def load(d: Optional[dict]) -> Optional[Digest]:
+    if not d or d.get("v") != VERSION:
+        return None
+    return Digest(d)
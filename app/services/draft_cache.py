@@ -0,0 +1,165 @@
+# app/services/draft_cache.py
+# Opt-in cache for identical draft requests. The key is a hash of exactly what
+# is sent to AOAI (composed messages + deployment + sampling params), so any
+# change in template, evidence or inputs is a miss.
+#
+# App Config:
+#   DRAFT_CACHE.ENABLED      off unless true
+#   DRAFT_CACHE.TTL_SECONDS  default 3600
+#   DRAFT_CACHE.MAX_ENTRIES     memory tier entry cap (LRU), default 256
+#   DRAFT_CACHE.MAX_BYTES       memory tier size cap (LRU, UTF-8 bytes of the outputs), default 8 MiB
+#   DRAFT_CACHE.BLOB            also keep entries in the outputs container under draft-cache/
+#   DRAFT_CACHE.BLOB_MAX_BYTES  blob tier size cap, default 256 MiB
+#   DRAFT_CACHE.SWEEP_SECONDS   blob tier sweep interval, default 3600
+#
+# Blob tier retention: at most once per SWEEP_SECONDS a write also starts a
+# sweep of draft-cache/ that deletes entries older than TTL_SECONDS, then the
+# oldest ones until the rest fit in BLOB_MAX_BYTES. Each worker sweeps on its
+# own; deletes are idempotent.
+import asyncio, hashlib, json, threading, time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from . import metrics, storage
+from .appcfg import aget as cfg_aget, aget_bool as cfg_aget_bool
+
+_BLOB_PREFIX = "draft-cache/"
+
+_mem: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()  # key -> (output, expires, bytes)
+_mem_bytes = 0
+_lock = threading.Lock()
+_pending: set = set()  # background blob writes / sweeps (keep references until done)
+_last_sweep = 0.0
+_stats = {"hits_memory": 0, "hits_blob": 0, "misses": 0, "evictions": 0, "sweeps": 0, "blob_deleted": 0}
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+def stats() -> dict:
+    with _lock:
+        st = dict(_stats)
+        st["size"] = len(_mem)
+        st["bytes"] = _mem_bytes
+    reads = st["hits_memory"] + st["hits_blob"] + st["misses"]
+    st["hit_ratio"] = round((st["hits_memory"] + st["hits_blob"]) / reads, 4) if reads else None
+    return st
+
+def make_key(messages: list, deployment: str, temperature: float, max_tokens: int) -> str:
+    basis = json.dumps(
+        {"m": messages, "d": deployment, "t": temperature, "n": max_tokens},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+async def _int_cfg(key: str, default: int) -> int:
+    v = await cfg_aget(key, None)
+    return int(v) if str(v).strip().isdigit() else default
+
+async def settings() -> dict:
+    return {
+        "enabled": await cfg_aget_bool("DRAFT_CACHE.ENABLED", False),
+        "blob": await cfg_aget_bool("DRAFT_CACHE.BLOB", False),
+        "ttl": await _int_cfg("DRAFT_CACHE.TTL_SECONDS", 3600),
+        "max_entries": await _int_cfg("DRAFT_CACHE.MAX_ENTRIES", 256),
+        "max_bytes": await _int_cfg("DRAFT_CACHE.MAX_BYTES", 8 * 1024 * 1024),
+        "blob_max_bytes": await _int_cfg("DRAFT_CACHE.BLOB_MAX_BYTES", 256 * 1024 * 1024),
+        "sweep_seconds": await _int_cfg("DRAFT_CACHE.SWEEP_SECONDS", 3600),
+    }
+
+def _mem_get(key: str) -> Optional[str]:
+    global _mem_bytes
+    with _lock:
+        item = _mem.get(key)
+        if not item:
+            return None
+        if item[1] <= time.time():
+            del _mem[key]
+            _mem_bytes -= item[2]
+            return None
+        _mem.move_to_end(key)
+        return item[0]
+
+def _mem_put(key: str, output: str, ttl: int, max_entries: int, max_bytes: int) -> None:
+    global _mem_bytes
+    size = len(output.encode("utf-8"))
+    if size > max_bytes:
+        return
+    with _lock:
+        old = _mem.pop(key, None)
+        if old:
+            _mem_bytes -= old[2]
+        _mem[key] = (output, time.time() + ttl, size)
+        _mem_bytes += size
+        while _mem and (len(_mem) > max_entries or _mem_bytes > max_bytes):
+            _, (_, _, evicted) = _mem.popitem(last=False)
+            _mem_bytes -= evicted
+            _stats["evictions"] += 1
+
+async def get(key: str, cfg: dict) -> Tuple[Optional[str], str]:
+    """Returns (output or None, status) with status in hit-memory | hit-blob | miss."""
+    out = _mem_get(key)
+    metrics.cache_result("draft_memory", out is not None)
+    if out is not None:
+        _count("hits_memory")
+        return out, "hit-memory"
+    if cfg["blob"]:
+        try:
+            rec = json.loads(await storage.aget_text(storage.CONTAINER_OUTPUTS, f"{_BLOB_PREFIX}{key}.json"))
+        except Exception:
+            rec = None
+        if rec and time.time() - float(rec.get("created", 0)) < cfg["ttl"]:
+            _mem_put(key, rec["output"], cfg["ttl"], cfg["max_entries"], cfg["max_bytes"])
+            _count("hits_blob")
+            return rec["output"], "hit-blob"
+    _count("misses")
+    return None, "miss"
+
+async def _blob_put(key: str, output: str) -> None:
+    rec = json.dumps({"output": output, "created": time.time()}, ensure_ascii=False)
+    try:
+        await storage.aput_text(storage.CONTAINER_OUTPUTS, f"{_BLOB_PREFIX}{key}.json", rec)
+    except Exception:
+        # best effort: the memory tier still has it
+        pass
+
+async def sweep(cfg: dict) -> int:
+    """Delete expired blob entries, then the oldest beyond BLOB_MAX_BYTES. Returns the count deleted."""
+    entries = await storage.alist_blob_props(storage.CONTAINER_OUTPUTS, _BLOB_PREFIX, ".json")
+    now = time.time()
+    doomed = [name for name, _, modified in entries if now - modified >= cfg["ttl"]]
+    kept = 0
+    for name, size, modified in sorted(entries, key=lambda e: e[2], reverse=True):  # newest first
+        if now - modified < cfg["ttl"]:
+            kept += size
+            if kept > cfg["blob_max_bytes"]:
+                doomed.append(name)
+    deleted = 0
+    for name in doomed:
+        if await storage.adelete_blob(storage.CONTAINER_OUTPUTS, name):
+            deleted += 1
+    with _lock:
+        _stats["sweeps"] += 1
+        _stats["blob_deleted"] += deleted
+    return deleted
+
+async def _sweep_bg(cfg: dict) -> None:
+    try:
+        await sweep(cfg)
+    except Exception:
+        pass  # retried at the next interval
+
+def _spawn(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+def put(key: str, output: str, cfg: dict) -> None:
+    global _last_sweep
+    _mem_put(key, output, cfg["ttl"], cfg["max_entries"], cfg["max_bytes"])
+    if cfg["blob"]:
+        # don't hold the response for the blob upload
+        _spawn(_blob_put(key, output))
+        now = time.time()
+        if now - _last_sweep >= cfg["sweep_seconds"]:
+            _last_sweep = now
+            _spawn(_sweep_bg(cfg))
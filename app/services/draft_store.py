@@ -0,0 +1,171 @@
+# app/services/draft_store.py
+# Generated drafts, kept per session / section / variant with full history in
+# the outputs container:
+#   drafts/{sid}/{section_id}[@{variant}]/{version}.json
+# version is the UTC write time (YYYYMMDDTHHMMSSffffffZ), so names sort by age
+# and the newest blob is the current draft.
+#
+# save() puts the record in a local LRU straight away and uploads it from a
+# background task; the draft response never waits for Blob Storage. latest()
+# answers from the LRU and only lists/downloads on a miss. With several workers
+# the newest version of each section is also published in shared_cache
+# ("drafts"), so a worker holding an older copy goes back to blob.
+#
+# App Config: DRAFT_STORE.ENABLED  default true
+# Env:        DRAFT_STORE_CACHE_MAX  LRU entries, default 512
+import asyncio, json, os, threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from . import blocking, metrics, shared_cache, storage
+from .appcfg import aget_bool as cfg_aget_bool
+
+_PREFIX = "drafts/"
+_CACHE_MAX = int(os.environ.get("DRAFT_STORE_CACHE_MAX", "512"))
+_SHARED_TTL = 24 * 3600
+
+_lru: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()  # (sid, key) -> newest record
+_lock = threading.Lock()
+_pending: set = set()  # background uploads (keep references until done)
+_stats = {"saved": 0, "unchanged": 0, "uploaded": 0, "upload_errors": 0, "hits_memory": 0, "hits_blob": 0, "misses": 0}
+
+async def enabled() -> bool:
+    return await cfg_aget_bool("DRAFT_STORE.ENABLED", True)
+
+def _key(section_id: str, variant: Optional[str]) -> str:
+    for part in (section_id, variant or ""):
+        if "/" in part or "@" in part:
+            raise ValueError(f"invalid section id/variant: {part!r}")
+    return f"{section_id}@{variant}" if variant else section_id
+
+def _split_key(key: str) -> Tuple[str, Optional[str]]:
+    section_id, _, variant = key.partition("@")
+    return section_id, variant or None
+
+def _blob_name(sid: str, key: str, version: str) -> str:
+    return f"{_PREFIX}{sid}/{key}/{version}.json"
+
+def _new_version() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+def _lru_get(sid: str, key: str) -> Optional[dict]:
+    with _lock:
+        rec = _lru.get((sid, key))
+        if rec is not None:
+            _lru.move_to_end((sid, key))
+        return rec
+
+def _lru_put(sid: str, key: str, rec: dict) -> None:
+    with _lock:
+        cur = _lru.get((sid, key))
+        if cur is not None and cur["version"] > rec["version"]:
+            return  # never replace a newer draft with an older one
+        _lru[(sid, key)] = rec
+        _lru.move_to_end((sid, key))
+        while len(_lru) > _CACHE_MAX:
+            _lru.popitem(last=False)
+
+def _upload(sid: str, key: str, rec: dict) -> None:
+    storage.put_text(storage.CONTAINER_OUTPUTS, _blob_name(sid, key, rec["version"]),
+                     json.dumps(rec, ensure_ascii=False))
+    # announce only once the blob exists, so other workers can read it
+    shared_cache.put("drafts", f"{sid}|{key}", rec["version"], _SHARED_TTL)
+
+async def _upload_bg(sid: str, key: str, rec: dict) -> None:
+    try:
+        await blocking.run(_upload, sid, key, rec)
+        _stats["uploaded"] += 1
+    except Exception:
+        # the LRU still serves it in this worker; the next generation retries
+        _stats["upload_errors"] += 1
+
+def save(sid: str, section_id: str, variant: Optional[str], draft: dict) -> Optional[str]:
+    """
+    Record a generated draft as the newest version of its section; returns the
+    version (None when identical to the current one). Upload happens in the background.
+    """
+    key = _key(section_id, variant)
+    cur = _lru_get(sid, key)
+    if cur is not None and cur.get("output") == draft.get("output") \
+            and cur.get("x-prompt-pack") == draft.get("x-prompt-pack"):
+        _stats["unchanged"] += 1
+        return None
+    rec = dict(draft, session_id=sid, section_id=section_id, section_variant=variant,
+               version=_new_version(), created=datetime.now(timezone.utc).isoformat())
+    _lru_put(sid, key, rec)
+    _stats["saved"] += 1
+    task = asyncio.get_running_loop().create_task(_upload_bg(sid, key, rec))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return rec["version"]
+
+async def flush() -> None:
+    """Wait for background uploads (lifespan shutdown, tests)."""
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
+
+async def _read_blob(sid: str, key: str, version: str) -> Optional[dict]:
+    try:
+        return json.loads(await storage.aget_text(storage.CONTAINER_OUTPUTS, _blob_name(sid, key, version)))
+    except Exception:
+        return None
+
+async def _newest_in_blob(sid: str, key: str) -> Optional[dict]:
+    names = await storage.alist_blobs(storage.CONTAINER_OUTPUTS, f"{_PREFIX}{sid}/{key}/", ".json")
+    if not names:
+        return None
+    return await _read_blob(sid, key, max(names).rsplit("/", 1)[-1][:-5])
+
+async def latest(sid: str, section_id: str, variant: Optional[str] = None) -> Tuple[Optional[dict], str]:
+    """Newest draft for the section: (record or None, memory | blob | miss)."""
+    key = _key(section_id, variant)
+    rec = _lru_get(sid, key)
+    if rec is not None and shared_cache.mode() == "socket":
+        # another worker may have generated a newer version since
+        hit, newest = await blocking.run(shared_cache.get, "drafts", f"{sid}|{key}")
+        if hit and newest and newest > rec["version"]:
+            rec = None
+    metrics.cache_result("draft_store", rec is not None)
+    if rec is not None:
+        _stats["hits_memory"] += 1
+        return rec, "memory"
+    rec = await _newest_in_blob(sid, key)
+    if rec is None:
+        _stats["misses"] += 1
+        return None, "miss"
+    _lru_put(sid, key, rec)
+    _stats["hits_blob"] += 1
+    return rec, "blob"
+
+async def get_version(sid: str, section_id: str, variant: Optional[str], version: str) -> Tuple[Optional[dict], str]:
+    key = _key(section_id, variant)
+    rec = _lru_get(sid, key)
+    if rec is not None and rec["version"] == version:
+        return rec, "memory"
+    rec = await _read_blob(sid, key, version)
+    return rec, "blob" if rec is not None else "miss"
+
+async def list_drafts(sid: str) -> list[dict]:
+    """Every stored section of the session with its version history (newest last)."""
+    versions: dict[str, set] = {}
+    for name in await storage.alist_blobs(storage.CONTAINER_OUTPUTS, f"{_PREFIX}{sid}/", ".json"):
+        key, _, fname = name[len(_PREFIX) + len(sid) + 1:].partition("/")
+        if key and fname and "/" not in fname:
+            versions.setdefault(key, set()).add(fname[:-5])
+    # uploads still in flight are only in the LRU
+    with _lock:
+        for (s, key), rec in _lru.items():
+            if s == sid:
+                versions.setdefault(key, set()).add(rec["version"])
+    out = []
+    for key in sorted(versions):
+        section_id, variant = _split_key(key)
+        vs = sorted(versions[key])
+        out.append({"section_id": section_id, "section_variant": variant, "latest": vs[-1], "versions": vs})
+    return out
+
+def stats() -> dict:
+    st = dict(_stats)
+    st["size"] = len(_lru)
+    st["pending"] = len(_pending)
+    return st
@@ -0,0 +1,146 @@
+# app/services/evidence.py
+# Loads evidence digests (see digest.py) for the draft path.
+#
+#   local LRU -> evidence/{sid}_{label}.digest.json -> build from {sid}_{label}.txt
+#
+# A digest built lazily (text written without going through uploads) is saved
+# back to blob, so the build happens once per label. Large texts are digested
+# in the extraction process pool. save() is called by the uploads stage after
+# each extraction and bumps the shared "evidence" namespace so every worker
+# drops its cached copy.
+#
+# Every digest records the ETag of the text it was built from ("src"). A stored
+# digest whose src no longer matches the text blob is rebuilt, and cached
+# copies are re-checked against the blob every EVIDENCE_DIGEST_REVALIDATE_SECONDS,
+# so rewriting the text by any route never leaves an old digest in use.
+#
+# App Config: EVIDENCE_DIGEST.ENABLED  default true (false: raw capped text, as before)
+# Env:        EVIDENCE_DIGEST_CACHE_MAX  LRU entries, default 256
+#             EVIDENCE_DIGEST_MAX_CHARS  text read for a lazy build, default 2,000,000
+#             EVIDENCE_DIGEST_REVALIDATE_SECONDS  default 30
+import json, os, threading, time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from . import blocking, digest, extract, metrics, shared_cache, storage
+from .appcfg import aget_bool as cfg_aget_bool
+
+_CACHE_MAX = int(os.environ.get("EVIDENCE_DIGEST_CACHE_MAX", "256"))
+_MAX_CHARS = int(os.environ.get("EVIDENCE_DIGEST_MAX_CHARS", "2000000"))
+_REVALIDATE_SECONDS = float(os.environ.get("EVIDENCE_DIGEST_REVALIDATE_SECONDS", "30"))
+_INLINE_CHARS = 100_000  # smaller texts are digested on the I/O pool thread
+
+# (sid, label) -> (digest, source text ETag, checked at)
+_lru: "OrderedDict[Tuple[str, str], Tuple[digest.Digest, Optional[str], float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits_memory": 0, "hits_blob": 0, "built": 0, "missing": 0, "stale": 0}
+
+async def enabled() -> bool:
+    return await cfg_aget_bool("EVIDENCE_DIGEST.ENABLED", True)
+
+def text_name(sid: str, label: str) -> str:
+    return f"{sid}_{label}.txt"
+
+def digest_name(sid: str, label: str) -> str:
+    return f"{sid}_{label}.digest.json"
+
+def _lru_get(sid: str, label: str) -> Optional[Tuple[digest.Digest, Optional[str], float]]:
+    with _lock:
+        item = _lru.get((sid, label))
+        if item is not None:
+            _lru.move_to_end((sid, label))
+        return item
+
+def _lru_put(sid: str, label: str, d: digest.Digest, src: Optional[str]) -> None:
+    with _lock:
+        _lru[(sid, label)] = (d, src, time.monotonic())
+        _lru.move_to_end((sid, label))
+        while len(_lru) > _CACHE_MAX:
+            _lru.popitem(last=False)
+
+def _clear() -> None:
+    with _lock:
+        _lru.clear()
+
+shared_cache.on_invalidate("evidence", _clear)
+
+def _text_etag(sid: str, label: str) -> Optional[str]:
+    try:
+        return storage.blob_etag(storage.CONTAINER_EVIDENCE, text_name(sid, label))
+    except Exception:
+        return None
+
+def _read_digest(sid: str, label: str) -> Tuple[Optional[dict], Optional[str]]:
+    """(stored digest or None, current ETag of the text)."""
+    etag = _text_etag(sid, label)
+    if etag is None:
+        return None, None
+    try:
+        return json.loads(storage.get_text(storage.CONTAINER_EVIDENCE, digest_name(sid, label))), etag
+    except Exception:
+        return None, etag
+
+def _read_text(sid: str, label: str) -> Optional[str]:
+    try:
+        return storage.get_text_capped(storage.CONTAINER_EVIDENCE, text_name(sid, label), _MAX_CHARS)
+    except Exception:
+        return None  # missing evidence is OK
+
+def _write_digest(sid: str, label: str, d: dict) -> None:
+    storage.put_text(storage.CONTAINER_EVIDENCE, digest_name(sid, label),
+                     json.dumps(d, ensure_ascii=False, separators=(",", ":")))
+
+async def get(sid: str, label: str) -> Tuple[Optional[digest.Digest], str]:
+    """(digest or None, memory | blob | built | missing)."""
+    item = _lru_get(sid, label)
+    if item is not None and time.monotonic() - item[2] >= _REVALIDATE_SECONDS:
+        if await blocking.run(_text_etag, sid, label) == item[1]:
+            _lru_put(sid, label, item[0], item[1])
+        else:
+            _stats["stale"] += 1
+            item = None
+    metrics.cache_result("evidence_digest", item is not None)
+    if item is not None:
+        _stats["hits_memory"] += 1
+        return item[0], "memory"
+    raw, etag = await blocking.run(_read_digest, sid, label)
+    if etag is None:
+        _stats["missing"] += 1
+        return None, "missing"
+    d = digest.load(raw)
+    source = "blob"
+    if d is not None and raw.get("src") != etag:
+        _stats["stale"] += 1  # the text was rewritten after this digest was built
+        d = None
+    if d is None:
+        text = await blocking.run(_read_text, sid, label)
+        if not text:
+            _stats["missing"] += 1
+            return None, "missing"
+        if len(text) > _INLINE_CHARS:
+            raw = await extract.run_fn(digest.build, text)
+        else:
+            raw = await blocking.run(digest.build, text)
+        # etag was read before the text: a rewrite in between is caught next time
+        raw["src"] = etag
+        try:
+            await blocking.run(_write_digest, sid, label, raw)
+        except Exception:
+            pass  # rebuilt next time; the draft still uses it
+        d = digest.load(raw)
+        source = "built"
+    _stats["hits_blob" if source == "blob" else "built"] += 1
+    _lru_put(sid, label, d, etag)
+    return d, source
+
+def save(sid: str, label: str, raw: dict) -> None:
+    """
+    Store a freshly built digest of the text just written (sync; I/O pool)
+    and drop stale copies in every worker.
+    """
+    _write_digest(sid, label, dict(raw, src=_text_etag(sid, label)))
+    shared_cache.bump("evidence")
+
+def stats() -> dict:
+    st = dict(_stats)
+    st["size"] = len(_lru)
+    return st
@@ -0,0 +1,127 @@
+# app/services/extract.py
+# Text extraction for uploaded evidence (PDF / DOCX / TXT), run in a process
+# pool so parsing a large financial PDF never holds the GIL of an API worker.
+#
+# The functions below execute in the child processes: this module only uses
+# the stdlib at import time (children are spawned and import just this file).
+# Parsers are optional dependencies, imported on first use:
+#   PDF  -> pypdf        (pip install pypdf)
+#   DOCX -> python-docx  (pip install python-docx)
+# Both are pinned in requirements.txt; available() lets the upload endpoint
+# refuse a kind whose parser is missing instead of failing after the upload.
+#
+# Env: EXTRACT_WORKERS  pool size, default 2 (at most the CPU count)
+import asyncio, importlib.util, multiprocessing, os, re, unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+from . import digest
+
+KINDS = ("pdf", "docx", "txt")
+
+_EXT = {".pdf": "pdf", ".docx": "docx", ".txt": "txt", ".text": "txt", ".md": "txt", ".csv": "txt"}
+_MIME = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/plain": "txt", "text/markdown": "txt", "text/csv": "txt",
+}
+
+def kind_of(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    """pdf | docx | txt from the file extension, else the content type; None if unsupported."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in _EXT:
+        return _EXT[ext]
+    return _MIME.get((content_type or "").split(";")[0].strip().lower())
+
+# --- normalisation -----------------------------------------------------------
+
+_CTRL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b\ufeff]")  # keeps \t and \n
+_HYPHEN_BREAK = re.compile(r"([a-z])-\n([a-z])")  # "manu-\nfacturing" (letters only: keep "2019-\n2020")
+_SPACES = re.compile(r"[ \t]+")  # NFKC has already turned NBSP etc. into spaces
+_BLANKS = re.compile(r"\n{3,}")
+
+def normalise(text: str) -> str:
+    """NFKC, unix newlines, no control chars, single spaces, at most one blank line in a row."""
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\f", "\n\n")
+    text = _CTRL.sub("", text)
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    text = _SPACES.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANKS.sub("\n\n", text).strip()
+
+# --- parsers (child process) -------------------------------------------------
+
+def _pdf(path: str) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("PDF extraction needs pypdf (pip install pypdf)")
+    reader = PdfReader(path)
+    return "\n\n".join((page.extract_text() or "") for page in reader.pages)
+
+def _docx(path: str) -> str:
+    try:
+        import docx
+    except ImportError:
+        raise RuntimeError("DOCX extraction needs python-docx (pip install python-docx)")
+    doc = docx.Document(path)
+    parts = [p.text for p in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            parts.append(" | ".join(cell.text.strip() for cell in row.cells))
+    return "\n".join(parts)
+
+def _txt(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+_PARSERS = {"pdf": _pdf, "docx": _docx, "txt": _txt}
+_MODULES = {"pdf": "pypdf", "docx": "docx"}  # kind -> module its parser imports
+_available: dict = {}
+
+def available(kind: str) -> bool:
+    """True if this kind's parser dependency is importable (checked once per kind)."""
+    if kind not in _available:
+        mod = _MODULES.get(kind)
+        _available[kind] = kind in _PARSERS and (mod is None or importlib.util.find_spec(mod) is not None)
+    return _available[kind]
+
+def extract_file(path: str, kind: str) -> str:
+    """Parse and normalise one local file (runs in a pool process)."""
+    if kind not in _PARSERS:
+        raise ValueError(f"unsupported file type: {kind}")
+    return normalise(_PARSERS[kind](path))
+
+def extract_with_digest(path: str, kind: str) -> tuple:
+    """(text, digest) in one pool round trip, so the digest is built once per upload."""
+    text = extract_file(path, kind)
+    return text, digest.build(text)
+
+# --- pool (API process) ------------------------------------------------------
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _workers() -> int:
+    return max(1, min(int(os.environ.get("EXTRACT_WORKERS", "2")), os.cpu_count() or 1))
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process has running threads (I/O pool, SDK clients)
+        _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+async def run_fn(fn: Callable, *args):
+    """Run a module-level function (e.g. extract_file) in the process pool; the event loop stays free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), fn, *args)
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
@@ -0,0 +1,154 @@
+# app/services/metrics.py
+# Prometheus text-format metrics for GET /metrics, without a client library.
+#
+# - Counter / Gauge / Histogram keep one small list or float per label set,
+#   created on first use; after that an update is a dict lookup and an add
+#   under the metric's own uncontended lock (about 1us), so collection stays on
+#   in production. Histogram buckets are fixed at definition time.
+# - register_stats(prefix, fn) exports the numeric fields of an existing
+#   stats() dict as gauges at scrape time (scheduler, shared cache, ...).
+# - Values are per process: with several gunicorn workers each scrape sees the
+#   worker that served it (scrape each worker, or sum in the dashboard).
+import bisect, threading
+from typing import Callable, Dict, List, Tuple
+
+# seconds; covers cache hits (sub-ms) up to slow AOAI completions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_stats_fns: List[Tuple[str, Callable[[], dict]]] = []
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+class _Metric:
+    kind = ""
+    __slots__ = ("name", "help", "labelnames", "_series", "_lock")
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+    __slots__ = ()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._series.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._series.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+    __slots__ = ()
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._series[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+    __slots__ = ("buckets",)
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                # per-bucket counts (+Inf last), then sum
+                s = self._series[labels] = [0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    def count(self, *labels) -> int:
+        s = self._series.get(labels)
+        return sum(s[:-1]) if s else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s)) for k, s in self._series.items()]
+        out = self._header()
+        for k, s in items:
+            cum = 0
+            for le, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cum += n
+                le_label = 'le="%s"' % _num(le)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le_label)} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(round(s[-1], 6))}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {cum}")
+        return out
+
+def register_stats(prefix: str, fn: Callable[[], dict]) -> None:
+    """Export fn()'s top-level numeric fields as gauges named smartai_{prefix}_{field}."""
+    _stats_fns.append((prefix, fn))
+
+def _render_stats(prefix: str, fn: Callable[[], dict]) -> List[str]:
+    try:
+        st = fn() or {}
+    except Exception:
+        return []
+    out = []
+    for k, v in st.items():
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            continue
+        name = f"smartai_{prefix}_{k}"
+        out += [f"# TYPE {name} gauge", f"{name} {_num(v)}"]
+    return out
+
+def render() -> str:
+    lines: List[str] = []
+    for m in _registry:
+        lines += m.render()
+    for prefix, fn in _stats_fns:
+        lines += _render_stats(prefix, fn)
+    return "\n".join(lines) + "\n"
+
+# --- the app's metrics -------------------------------------------------------
+
+AOAI_SECONDS = Histogram("smartai_aoai_request_seconds",
+                         "AOAI chat completion latency incl. retries (stream: until headers)",
+                         ("deployment", "status"))
+CACHE_REQUESTS = Counter("smartai_cache_requests_total",
+                         "Per-process cache lookups by cache and result (hit|miss)", ("cache", "result"))
+SEARCH_SECONDS = Histogram("smartai_search_query_seconds", "AI Search template query latency", ("status",))
+BLOB_SECONDS = Histogram("smartai_blob_seconds", "Blob Storage call latency", ("op",))
+BLOB_BYTES = Counter("smartai_blob_download_bytes_total", "Bytes downloaded from Blob Storage", ("container",))
+TABLE_SECONDS = Histogram("smartai_table_seconds", "Table Storage (sessions) call latency", ("op",))
+DRAFTS_IN_FLIGHT = Gauge("smartai_drafts_in_flight", "Draft requests currently being composed or generated")
+PROMPT_TOKENS = Histogram("smartai_prompt_tokens", "Composed draft prompt size (token budget)", ("part",),
+                          buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000))
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
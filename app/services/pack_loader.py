@@ -0,0 +1,353 @@
+# app/services/pack_loader.py
+# The one reader of prompt packs (app/vault/<PACK>.v<N>/pack.yml + templates/),
+# shared by the API (vault_index) and every tool: lint_packs,
+# build_index_payload, offline_eval and scripts/load_prompt_packs.
+#
+# - pack.yml parses are memoised per path and revalidated by (mtime_ns, size),
+#   then by a sha256 of the bytes, so an unchanged manifest is never parsed
+#   twice in a process. With PACK_CACHE_DIR set, parses are also kept on disk
+#   keyed by that hash, so the separate CI steps share one parse per pack.
+# - Pack / Template are small __slots__ objects; a template body is read from
+#   disk on first access only.
+# - doc_id() is the single prompt-index document key and index_doc() the single
+#   document shape, whichever tool uploads.
+# - iter_payload_docs() streams a build_index_payload artifact (JSON Lines or
+#   the compat JSON array) for index_packs and vault_index.load_artifact.
+# - normalize() is the back-compat shim for legacy manifests (pack_id,
+#   templates-only), formerly private to lint_packs.
+#
+# Parsed manifests are shared between callers: treat them as read-only.
+#
+# Env: PACK_CACHE_DIR  directory for the on-disk parse cache (unset: memory only)
+import hashlib, json, os, pickle, re, sys, threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_lock = threading.Lock()
+_memo: Dict[str, Tuple[int, int, str, Any]] = {}  # path -> (mtime_ns, size, sha256, parsed)
+_stats = {"parses": 0, "memo_hits": 0, "rehashed": 0, "disk_hits": 0}
+
+# --- manifests -----------------------------------------------------------------
+
+def _disk_dir() -> Optional[Path]:
+    d = os.environ.get("PACK_CACHE_DIR")
+    return Path(d) if d else None
+
+def _parse(data: bytes, sha: str) -> Any:
+    cache_dir = _disk_dir()
+    cached = cache_dir / f"{sha}.pickle" if cache_dir else None
+    if cached is not None:
+        try:
+            with cached.open("rb") as f:
+                parsed = pickle.load(f)
+            _stats["disk_hits"] += 1
+            return parsed
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+    import yaml
+    parsed = yaml.safe_load(data.decode("utf-8"))
+    _stats["parses"] += 1
+    if cached is not None:
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_name(f"{cached.name}.{os.getpid()}.tmp")
+            with tmp.open("wb") as f:
+                pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cached)
+        except OSError:
+            pass
+    return parsed
+
+def read_manifest(path: Path) -> Any:
+    """Parsed YAML of `path`, memoised by (mtime, size) and content hash. Do not mutate."""
+    key = str(path)
+    st = os.stat(key)
+    with _lock:
+        hit = _memo.get(key)
+        if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            _stats["memo_hits"] += 1
+            return hit[3]
+    data = Path(path).read_bytes()
+    sha = hashlib.sha256(data).hexdigest()
+    if hit and hit[2] == sha:
+        _stats["rehashed"] += 1  # touched, not changed
+        parsed = hit[3]
+    else:
+        parsed = _parse(data, sha)
+    with _lock:
+        _memo[key] = (st.st_mtime_ns, st.st_size, sha, parsed)
+    return parsed
+
+def stats() -> dict:
+    st = dict(_stats)
+    st["memoised"] = len(_memo)
+    return st
+
+def clear() -> None:
+    with _lock:
+        _memo.clear()
+
+# --- normalisation ---------------------------------------------------------------
+
+# Example path patterns we expect: app/vault/EDG.v1/pack.yml
+# Capture "ver" from ".v1" or ".1.2.3"
+VERSION_FROM_DIR = re.compile(r"[\\/](?P<name>[A-Za-z0-9._-]+)\.(?P<ver>v?\d[\w.-]*)[\\/]")
+
+def infer_version_from_path(path: str) -> str:
+    """Extract version from directory name like EDG.v1 → '1.0.0' or EDG.v1.2.3 → '1.2.3'"""
+    m = VERSION_FROM_DIR.search(str(path))
+    if m and m.group("ver"):
+        # normalize "v1" or "1.2.3" -> "1" or "1.2.3"
+        ver = m.group("ver").lstrip("vV")
+        # If just a single number, default to SemVer format
+        if re.match(r'^\d+$', ver):
+            return f"{ver}.0.0"
+        return ver
+    return "1.0.0"
+
+def normalize(pack: Optional[Dict[str, Any]], file_path: str, log: Optional[list] = None) -> Dict[str, Any]:
+    """
+    Back-compat shim:
+      - Prefer `id`, but fall back to `pack_id`.
+      - Prefer explicit `sections`, else derive from `templates` file paths or keys.
+      - Fill `version` from folder if missing.
+      - Default `status` to "draft" if missing.
+    Returns a new dict; it only ensures required keys exist.
+    Deprecation warnings go to `log` when given, else straight to stderr.
+    """
+    def warn(msg: str) -> None:
+        if log is None:
+            print(f"WARNING: {msg}", file=sys.stderr)
+        else:
+            log.append(msg)
+
+    norm = dict(pack) if pack else {}
+
+    # id ← pack_id (back-compat)
+    if "id" not in norm and "pack_id" in norm:
+        norm["id"] = norm["pack_id"]
+        warn(f"[PACK] {file_path}: using legacy 'pack_id' → 'id' (deprecated)")
+
+    # sections ← template file stems, else template keys (back-compat)
+    if "sections" not in norm:
+        templates = norm.get("templates")
+        if isinstance(templates, dict) and templates:
+            sections = []
+            for key, tmpl_data in templates.items():
+                # "templates/about_company.md" -> "about_company"; no/empty file: the key
+                file_path_str = tmpl_data.get("file") if isinstance(tmpl_data, dict) else None
+                sections.append(Path(file_path_str).stem if file_path_str else key)
+            norm["sections"] = sections
+        else:
+            norm.setdefault("sections", [])
+        if norm.get("sections"):
+            warn(f"[PACK] {file_path}: deriving 'sections' from 'templates' (deprecated)")
+
+    # version
+    if "version" not in norm or not norm["version"]:
+        norm["version"] = infer_version_from_path(file_path)
+
+    # status
+    if "status" not in norm or not norm["status"]:
+        norm["status"] = "draft"
+
+    return norm
+
+# --- model -------------------------------------------------------------------------
+
+class Template:
+    __slots__ = ("pack", "key", "section_id", "file", "status", "cfg", "_body")
+
+    def __init__(self, pack: "Pack", key: str, cfg: dict):
+        self.pack = pack
+        self.key = key
+        self.cfg = cfg
+        self.section_id = str(cfg.get("section_id") or key)
+        self.file = cfg.get("file") or f"templates/{key}.md"
+        self.status = str(cfg.get("status") or pack.status).lower()
+        self._body: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"Template({self.pack.id}@{self.pack.version}:{self.key})"
+
+    @property
+    def path(self) -> Path:
+        return self.pack.dir / self.file
+
+    @property
+    def stem(self) -> str:
+        return Path(self.file).stem
+
+    @property
+    def retrieval_tags(self) -> list:
+        return self.cfg.get("retrieval_tags") or []
+
+    @property
+    def rubric(self) -> dict:
+        return self.cfg.get("rubric") or {}
+
+    @property
+    def evidence_hints(self) -> dict:
+        return self.cfg.get("evidence_hints") or {}
+
+    def exists(self) -> bool:
+        return self._body is not None or self.path.is_file()
+
+    @property
+    def body(self) -> str:
+        """Template markdown, read on first access (FileNotFoundError if missing)."""
+        if self._body is None:
+            self._body = self.path.read_text(encoding="utf-8")
+        return self._body
+
+    def metadata(self) -> dict:
+        pack = self.pack
+        return {
+            "pack_id": pack.id,
+            "version": pack.version,
+            "labels": pack.labels,
+            "section_id": self.section_id,
+            "template_key": self.key,
+            "file": self.file,
+            "path": str(self.path),
+            "retrieval_tags": self.retrieval_tags,
+            "rubric": self.rubric,
+            "evidence_hints": self.evidence_hints,
+        }
+
+class Pack:
+    __slots__ = ("dir", "manifest", "raw", "data", "id", "version", "status", "labels",
+                 "sections", "templates", "notes", "_by_stem")
+
+    def __init__(self, pack_dir: Path, manifest: Path, raw: Any):
+        self.dir = pack_dir
+        self.manifest = manifest
+        self.raw = raw if isinstance(raw, dict) else {}
+        self.notes: List[str] = []  # normalisation warnings, for the caller to report
+        self.data = normalize(raw, str(manifest), self.notes)
+        self.id = str(self.data.get("id") or pack_dir.name.split(".")[0]).upper()
+        self.version = str(self.data["version"])
+        status = self.data["status"]
+        self.status = status.lower() if isinstance(status, str) else str(status)
+        self.labels = self.data.get("labels") or {}
+        sections = self.data.get("sections")
+        self.sections = list(sections) if isinstance(sections, list) else []
+        cfgs = self.data.get("templates")
+        if not isinstance(cfgs, dict) or not cfgs:
+            cfgs = {sec: {"file": f"templates/{sec}.md"} for sec in self.sections if isinstance(sec, str)}
+        self.templates: Dict[str, Template] = {
+            key: Template(self, key, cfg if isinstance(cfg, dict) else {}) for key, cfg in cfgs.items()
+        }
+        self._by_stem: Optional[Dict[str, Template]] = None
+
+    def __repr__(self) -> str:
+        return f"Pack({self.id}@{self.version}, {len(self.templates)} templates)"
+
+    @property
+    def key(self) -> str:
+        return f"{self.id}@{self.version}"
+
+    def template_by_stem(self, stem: str) -> Optional[Template]:
+        """Template whose file is templates/<stem>.md (explicit `file:` entries only)."""
+        if self._by_stem is None:
+            self._by_stem = {}
+            for t in self.templates.values():
+                if t.cfg.get("file"):
+                    self._by_stem.setdefault(t.stem, t)
+        return self._by_stem.get(stem)
+
+def load_pack(pack_dir: Path) -> Pack:
+    pack_dir = Path(pack_dir)
+    manifest = pack_dir / "pack.yml"
+    return Pack(pack_dir, manifest, read_manifest(manifest))
+
+def discover(vault_root: Path) -> Iterator[Tuple[Path, Path]]:
+    """(pack_dir, pack.yml) for every <NAME>.<ver> directory with a manifest, sorted."""
+    for p in sorted(Path(vault_root).glob("*.*")):
+        pack_yml = p / "pack.yml"
+        if pack_yml.exists():
+            yield p, pack_yml
+
+def iter_packs(vault_root: Path) -> Iterator[Pack]:
+    for pack_dir, _ in discover(vault_root):
+        yield load_pack(pack_dir)
+
+# --- index documents ---------------------------------------------------------------
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_\-=]")  # Azure Search key charset
+
+def doc_id(pack_id: str, version: str, template_key: str, status: str) -> str:
+    """
+    The prompt-index key of one template: PACK=1_0_1=<template_key>=<status>.
+    Unique per (pack, version, template key, status); independent of the file
+    name. A short hash is appended when a part had to be sanitised, so two keys
+    differing only in disallowed characters never collide.
+    """
+    parts = [str(pack_id).upper(), str(version).replace(".", "_"), str(template_key), str(status).lower()]
+    safe = [_UNSAFE.sub("_", p) for p in parts]
+    out = "=".join(safe)
+    if safe != parts:
+        out += "=" + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:8]
+    return out
+
+def index_doc(t: Template, *, updated_at: Optional[str] = None, text: Optional[str] = None) -> dict:
+    """Search document for one template (fields of smartai-prompts-v2.schema.json); `text` overrides the body."""
+    meta = t.metadata()
+    if updated_at:
+        meta["updated_at"] = updated_at
+    return {
+        "id": doc_id(t.pack.id, t.pack.version, t.key, t.status),
+        "pack_id": t.pack.id,
+        "version": t.pack.version,
+        "status": t.status,
+        "section_id": t.section_id,
+        "retrieval_tags": t.retrieval_tags,
+        "template_text": t.body if text is None else text,
+        "metadata_json": json.dumps(meta, ensure_ascii=False),
+    }
+
+# --- payload artifacts -----------------------------------------------------------
+
+def iter_payload_docs(path: str, chunk_chars: int = 1 << 16) -> Iterator[dict]:
+    """
+    Docs of a build_index_payload.py artifact, one at a time: JSON Lines, or a
+    JSON array (decoded incrementally, element by element).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(chunk_chars)
+        if not head.lstrip().startswith("["):
+            for line in _lines(head, f, chunk_chars):
+                if line.strip():
+                    yield json.loads(line)
+            return
+        dec = json.JSONDecoder()
+        buf, pos, eof = head, head.index("[") + 1, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                doc, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_chars)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield doc
+            pos = end
+            if pos > chunk_chars:  # drop what has been consumed
+                buf, pos = buf[pos:], 0
+
+def _lines(head: str, f, chunk_chars: int) -> Iterator[str]:
+    rest = ""
+    chunk = head
+    while chunk:
+        rest += chunk
+        *lines, rest = rest.split("\n")
+        yield from lines
+        chunk = f.read(chunk_chars)
+    if rest:
+        yield rest
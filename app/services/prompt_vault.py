@@ -1,19 +1,53 @@
 # app/services/prompt_vault.py
 import os, time, json
 from typing import Dict, List, Tuple, Optional
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from .appcfg import get as cfg_get
+from .appcfg import get as cfg_get, aget as cfg_aget, get_bool as cfg_get_bool
+from . import blocking, clients, metrics, shared_cache, vault_index
 
-_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"].rstrip("/")
-_SEARCH_KEY      = os.environ["AZURE_SEARCH_QUERY_KEY"]  # use *query* key in app svc
-_INDEX           = os.environ.get("AZURE_SEARCH_INDEX","smartai-prompts")
+_INDEX = os.environ.get("AZURE_SEARCH_INDEX","smartai-prompts")
 
-_client = SearchClient(_SEARCH_ENDPOINT, _INDEX, AzureKeyCredential(_SEARCH_KEY))
+def _new_client():
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+    endpoint = clients.env("AZURE_SEARCH_ENDPOINT").rstrip("/")
+    key = clients.env("AZURE_SEARCH_QUERY_KEY")  # use *query* key in app svc
+    return SearchClient(endpoint, _INDEX, AzureKeyCredential(key))
+
+clients.register("search", _new_client)
+
+def _client():
+    return clients.get("search")
 
 _cache: Dict[Tuple[str,str,str,str], Tuple[dict,float]] = {}
 # key=(pack,ver,section,variant) -> (doc, expires)
 
+# Backend selection (App Config):
+#   PROMPT_VAULT.BACKEND          search (default) | local
+#   PROMPT_VAULT.SOURCE           vault dir or build_index_payload artifact, JSONL or JSON
+#                                 array (default app/vault)
+#   PROMPT_VAULT.SEARCH_FALLBACK  query Search when the local index misses (default true)
+_local: Optional[vault_index.VaultIndex] = None
+
+def _backend() -> str:
+    return (cfg_get("PROMPT_VAULT.BACKEND") or "search").strip().lower()
+
+def local_index() -> vault_index.VaultIndex:
+    global _local
+    if _local is None:
+        _local = vault_index.load(cfg_get("PROMPT_VAULT.SOURCE") or None)
+    return _local
+
+def warm() -> None:
+    """Load the local index at startup when it is the selected backend."""
+    if _backend() == "local":
+        local_index()
+
+def _local_lookup(pack: str, ver: str, section_id: str, section_variant: Optional[str]) -> Optional[dict]:
+    hit = local_index().lookup(pack, ver, section_id, section_variant)
+    if hit is None and not cfg_get_bool("PROMPT_VAULT.SEARCH_FALLBACK", True):
+        raise LookupError(f"No template found for {pack}@{ver}:{section_id}")
+    return hit
+
 def _active_pack() -> Tuple[str,str]:
     """
     Default pack when caller does not pass pack_hint.
@@ -23,14 +57,8 @@ def _active_pack() -> Tuple[str,str]:
     """
     return "edg", "latest-approved"
 
-def _resolve_pack(pack_hint: Optional[str]) -> Tuple[str, str]:
-    """
-    Resolve pack and version from hint or fall back to active pack.
-    Accept forms: "psg", "edg", "psg@1.0.0".
-
-    Returns canonical (PACK_ID_UPPER, version), because index rows store
-    pack_id as uppercase (e.g., "PSG", "EDG").
-    """
+def _parse_hint(pack_hint: Optional[str]) -> Tuple[str, str]:
+    """Split "psg" / "psg@1.0.0" into (PACK_ID_UPPER, version) without any config lookup."""
     if pack_hint:
         if "@" in pack_hint:
             p, ver = pack_hint.split("@", 1)
@@ -43,7 +71,17 @@ def _resolve_pack(pack_hint: Optional[str]) -> Tuple[str, str]:
     ver = (ver or "latest-approved").strip()
 
     # Canonicalise pack IDs to uppercase -> matches index docs with pack_id="PSG"/"EDG"
-    p_norm = p.upper()
+    return p.upper(), ver
+
+def _resolve_pack(pack_hint: Optional[str]) -> Tuple[str, str]:
+    """
+    Resolve pack and version from hint or fall back to active pack.
+    Accept forms: "psg", "edg", "psg@1.0.0".
+
+    Returns canonical (PACK_ID_UPPER, version), because index rows store
+    pack_id as uppercase (e.g., "PSG", "EDG").
+    """
+    p_norm, ver = _parse_hint(pack_hint)
 
     # Map "latest-approved" -> concrete version via per-pack config
     if ver == "latest-approved":
@@ -54,6 +92,14 @@ def _resolve_pack(pack_hint: Optional[str]) -> Tuple[str, str]:
 
     return p_norm, ver
 
+async def _aresolve_pack(pack_hint: Optional[str]) -> Tuple[str, str]:
+    p_norm, ver = _parse_hint(pack_hint)
+    if ver == "latest-approved":
+        pinned = (await cfg_aget(f"PROMPT_PACK_LATEST.{p_norm}") or "").strip()
+        if pinned:
+            ver = pinned
+    return p_norm, ver
+
 def _cache_get(pack, ver, section, variant) -> Optional[dict]:
     key = (pack, ver, section, variant or "")
     item = _cache.get(key)
@@ -64,6 +110,26 @@ def _cache_get(pack, ver, section, variant) -> Optional[dict]:
 def _cache_set(pack, ver, section, variant, doc, ttl=30):
     _cache[(pack,ver,section,variant or "")] = (doc, time.time()+ttl)
 
+# Search results are also shared across workers, with the same 30s TTL as the
+# per-process cache. A PROMPT_PACK_LATEST.* / PROMPT_VAULT.* change in App Config
+# bumps "packs" (appcfg), which drops them everywhere; re-indexing a pack
+# (promote-pack) does not, so it shows within the TTL, or at once after
+# POST /v1/debug/cache/invalidate?scope=packs.
+_SHARED_TTL = 30
+
+def _shared_key(pack, ver, section, variant) -> str:
+    return f"{pack}|{ver}|{section}|{variant or ''}"
+
+def invalidate() -> None:
+    """Drop cached templates and the local index (reloaded on next use / warm)."""
+    global _local
+    _cache.clear()
+    if _local is not None:
+        _local = None
+        warm()
+
+shared_cache.on_invalidate("packs", invalidate)
+
 def retrieve_template(
     section_id: str,
     tags: Optional[List[str]] = None,
@@ -78,9 +144,54 @@ def retrieve_template(
       we hard-fail with LookupError instead of silently downgrading.
     """
     pack, ver = _resolve_pack(pack_hint)
+    if _backend() == "local":
+        hit = _local_lookup(pack, ver, section_id, section_variant)
+        if hit:
+            metrics.cache_result("prompt_vault", True)
+            return hit
     cached = _cache_get(pack, ver, section_id, section_variant)
+    metrics.cache_result("prompt_vault", bool(cached))
     if cached:
         return cached
+    return _search_template(pack, ver, section_id, tags, section_variant)
+
+async def aretrieve_template(
+    section_id: str,
+    tags: Optional[List[str]] = None,
+    section_variant: Optional[str] = None,
+    pack_hint: Optional[str] = None,
+) -> dict:
+    """Async retrieve_template: local/cache hits return inline, Search misses run on the I/O pool."""
+    pack, ver = await _aresolve_pack(pack_hint)
+    if (await cfg_aget("PROMPT_VAULT.BACKEND") or "search").strip().lower() == "local":
+        hit = _local_lookup(pack, ver, section_id, section_variant)
+        if hit:
+            metrics.cache_result("prompt_vault", True)
+            return hit
+    cached = _cache_get(pack, ver, section_id, section_variant)
+    metrics.cache_result("prompt_vault", bool(cached))
+    if cached:
+        return cached
+    return await blocking.run(_search_template, pack, ver, section_id, tags, section_variant)
+
+def _timed_search(**query) -> list:
+    # SearchClient.search is lazy; the request happens when the first page is read
+    t0 = time.perf_counter()
+    try:
+        docs = list(_client().search(**query))
+    except Exception:
+        metrics.SEARCH_SECONDS.observe(time.perf_counter() - t0, "error")
+        raise
+    metrics.SEARCH_SECONDS.observe(time.perf_counter() - t0, "ok")
+    return docs
+
+def _search_template(pack: str, ver: str, section_id: str, tags: Optional[List[str]], section_variant: Optional[str]) -> dict:
+    skey = _shared_key(pack, ver, section_id, section_variant)
+    found, shared = shared_cache.get("packs", skey)
+    metrics.cache_result("prompt_vault_shared", bool(found and shared))
+    if found and shared:
+        _cache_set(pack, ver, section_id, section_variant, shared)
+        return shared
 
     flt = f"pack_id eq '{pack}' and status eq 'approved' and section_id eq '{section_id}'"
     if ver != "latest-approved":
@@ -90,7 +201,7 @@ def retrieve_template(
     SELECT_FIELDS = ["template_text", "metadata_json"]
 
     # Primary search: honour pack + version strictly
-    results = _client.search(
+    results = _timed_search(
         search_text=search_text,
         filter=flt,
         top=3,
@@ -118,7 +229,7 @@ def retrieve_template(
 
     # Optional, looser fallback only for "latest-approved"
     if not hit and ver == "latest-approved":
-        results = _client.search(
+        results = _timed_search(
             search_text=section_id,
             filter=f"pack_id eq '{pack}' and status eq 'approved' and section_id eq '{section_id}'",
             top=1,
@@ -141,4 +252,5 @@ def retrieve_template(
         raise LookupError(f"No template found for {pack}@{ver}:{section_id}")
 
     _cache_set(pack, ver, section_id, section_variant, hit)
+    shared_cache.put("packs", skey, hit, _SHARED_TTL)
     return hit
\ No newline at end of file
@@ -1,19 +1,37 @@
 # app/services/secrets.py
 import os, time
 from typing import Optional
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from . import blocking, clients, metrics, shared_cache
 
-_KV_URI = os.environ["KEYVAULT_URI"]
-_cred = DefaultAzureCredential()
-_client = SecretClient(vault_url=_KV_URI, credential=_cred)
+def _new_client():
+    from azure.keyvault.secrets import SecretClient
+    return SecretClient(vault_url=clients.env("KEYVAULT_URI"), credential=clients.credential())
+
+clients.register("keyvault", _new_client)
+
+def _client():
+    return clients.get("keyvault")
 
 _cache: dict[str, tuple[str, float]] = {}  # name -> (value, expires_at)
 
 def get_secret(name: str, ttl_seconds: int = 900) -> str:
     now = time.time()
     if name in _cache and _cache[name][1] > now:
+        metrics.cache_result("secrets", True)
         return _cache[name][0]
-    val = _client.get_secret(name).value
+    metrics.cache_result("secrets", False)
+    hit, val = shared_cache.get("secrets", name)
+    if not hit:
+        val = _client().get_secret(name).value
+        shared_cache.put("secrets", name, val, ttl_seconds)
     _cache[name] = (val, now + ttl_seconds)
-    return val
\ No newline at end of file
+    return val
+
+# bump("secrets") after a rotation drops every worker's copy
+shared_cache.on_invalidate("secrets", _cache.clear)
+
+async def aget_secret(name: str, ttl_seconds: int = 900) -> str:
+    if name in _cache and _cache[name][1] > time.time():
+        metrics.cache_result("secrets", True)
+        return _cache[name][0]
+    return await blocking.run(get_secret, name, ttl_seconds)
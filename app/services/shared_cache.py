@@ -0,0 +1,253 @@
+# app/services/shared_cache.py
+# Second-level cache shared by every gunicorn worker on the host, sitting
+# between the per-process dicts (appcfg/secrets/prompt_vault) and Azure.
+#
+#   SHARED_CACHE_SOCKET set   -> client for app/services/cache_server.py (Unix socket)
+#   SHARED_CACHE_SOCKET unset -> in-process LocalStore with the same interface
+#                                (single worker, dev, tests)
+#
+# Invalidation: each namespace has a generation number. bump(ns) drops the
+# namespace from the store and bumps its generation; every worker polls the
+# generations (SHARED_CACHE_POLL_SECONDS, default 1) and runs the callbacks
+# registered with on_invalidate(ns), so per-process caches are dropped too.
+# The store is best-effort: if the server is unreachable, reads miss and
+# writes are skipped, and callers fall through to Azure as before.
+import asyncio, json, os, socket, threading, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from . import blocking
+
+_SOCKET = os.environ.get("SHARED_CACHE_SOCKET") or None
+_POLL_SECONDS = float(os.environ.get("SHARED_CACHE_POLL_SECONDS", "1"))
+_MAX_ENTRIES = int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", "20000"))
+
+class LocalStore:
+    """Dict store with TTLs and per-namespace generations (also the cache server's backing store)."""
+    def __init__(self, max_entries: int = _MAX_ENTRIES):
+        self._data: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+        self._gen: Dict[str, int] = {}
+        self._max = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, ns: str, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get((ns, key))
+            if item is None:
+                return False, None
+            if item[1] <= time.time():
+                del self._data[(ns, key)]
+                return False, None
+            return True, item[0]
+
+    def _put(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        # caller holds the lock
+        self._data.pop((ns, key), None)
+        self._data[(ns, key)] = (value, time.time() + ttl)
+        if len(self._data) > self._max:
+            # oldest writes first (dicts keep insertion order)
+            for k in list(self._data)[: len(self._data) - self._max]:
+                del self._data[k]
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._put(ns, key, value, ttl)
+
+    def add(self, ns: str, key: str, value: Any, ttl: float) -> bool:
+        """Set only if absent (or expired); True when this call set it."""
+        with self._lock:
+            item = self._data.get((ns, key))
+            if item is not None and item[1] > time.time():
+                return False
+            self._put(ns, key, value, ttl)
+            return True
+
+    def bump(self, ns: str) -> int:
+        with self._lock:
+            for k in [k for k in self._data if k[0] == ns]:
+                del self._data[k]
+            self._gen[ns] = self._gen.get(ns, 0) + 1
+            return self._gen[ns]
+
+    def generations(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._gen)
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def handle(self, req: dict) -> dict:
+        """One protocol request (see cache_server.py)."""
+        op = req.get("op")
+        if op == "get":
+            hit, value = self.get(req["ns"], req["k"])
+            return {"hit": hit, "v": value}
+        if op == "set":
+            self.set(req["ns"], req["k"], req.get("v"), float(req.get("ttl", 60)))
+            return {"ok": True}
+        if op == "add":
+            return {"ok": self.add(req["ns"], req["k"], req.get("v"), float(req.get("ttl", 60)))}
+        if op == "bump":
+            return {"gen": self.bump(req["ns"])}
+        if op == "gens":
+            return {"gens": self.generations()}
+        if op == "stats":
+            return {"size": self.size(), "gens": self.generations()}
+        return {"error": f"unknown op {op!r}"}
+
+class SocketStore:
+    """Client for cache_server.py: one connection per thread, newline-delimited JSON."""
+    def __init__(self, path: str, timeout: float = 0.5):
+        self.path = path
+        self.timeout = timeout
+        self._tls = threading.local()
+        self._down_until = 0.0
+
+    def _call(self, req: dict) -> Optional[dict]:
+        if time.monotonic() < self._down_until:
+            return None
+        f = getattr(self._tls, "f", None)
+        try:
+            if f is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                f = self._tls.f = sock.makefile("rwb")
+            f.write(json.dumps(req, separators=(",", ":")).encode("utf-8") + b"\n")
+            f.flush()
+            line = f.readline()
+            if not line:
+                raise ConnectionError("cache server closed the connection")
+            return json.loads(line)
+        except (OSError, ValueError):
+            self._tls.f = None
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+            _stats["errors"] += 1
+            self._down_until = time.monotonic() + 5.0  # don't hammer a dead server
+            return None
+
+    def get(self, ns: str, key: str) -> Tuple[bool, Any]:
+        resp = self._call({"op": "get", "ns": ns, "k": key})
+        return (True, resp["v"]) if resp and resp.get("hit") else (False, None)
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        self._call({"op": "set", "ns": ns, "k": key, "v": value, "ttl": ttl})
+
+    def add(self, ns: str, key: str, value: Any, ttl: float) -> Optional[bool]:
+        resp = self._call({"op": "add", "ns": ns, "k": key, "v": value, "ttl": ttl})
+        return resp.get("ok") if resp else None
+
+    def bump(self, ns: str) -> Optional[int]:
+        resp = self._call({"op": "bump", "ns": ns})
+        return resp.get("gen") if resp else None
+
+    def generations(self) -> Optional[Dict[str, int]]:
+        resp = self._call({"op": "gens"})
+        return resp.get("gens") if resp else None
+
+    def size(self) -> Optional[int]:
+        resp = self._call({"op": "stats"})
+        return resp.get("size") if resp else None
+
+_store = None
+_store_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "sets": 0, "bumps": 0, "invalidations": 0, "errors": 0}
+_callbacks: Dict[str, List[Callable[[], None]]] = {}
+_seen: Dict[str, int] = {}
+_watcher: Optional[asyncio.Task] = None
+
+def store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SocketStore(_SOCKET) if _SOCKET else LocalStore()
+    return _store
+
+def mode() -> str:
+    return "socket" if isinstance(store(), SocketStore) else "local"
+
+def get(ns: str, key: str) -> Tuple[bool, Any]:
+    hit, value = store().get(ns, key)
+    _stats["hits" if hit else "misses"] += 1
+    return hit, value
+
+def put(ns: str, key: str, value: Any, ttl: float) -> None:
+    """value must be JSON-serialisable (it may cross the socket)."""
+    _stats["sets"] += 1
+    store().set(ns, key, value, ttl)
+
+def add(ns: str, key: str, value: Any, ttl: float) -> Optional[bool]:
+    """
+    Set-if-absent, atomic in the store: True for the one caller that set it,
+    False for the rest, None when the store is unreachable.
+    """
+    _stats["sets"] += 1
+    return store().add(ns, key, value, ttl)
+
+def on_invalidate(ns: str, callback: Callable[[], None]) -> None:
+    """Run callback (sync; on the I/O pool for remote bumps) whenever ns is bumped by any worker."""
+    _callbacks.setdefault(ns, []).append(callback)
+
+def _fire(ns: str) -> None:
+    _stats["invalidations"] += 1
+    for cb in _callbacks.get(ns, []):
+        try:
+            cb()
+        except Exception:
+            _stats["errors"] += 1
+
+def bump(ns: str) -> Optional[int]:
+    """Invalidate ns for every worker (including this one, synchronously)."""
+    _stats["bumps"] += 1
+    gen = store().bump(ns)
+    if gen is not None:
+        _seen[ns] = gen
+    _fire(ns)
+    return gen
+
+def check() -> List[str]:
+    """One watcher poll: run callbacks for namespaces another worker bumped."""
+    gens = store().generations()
+    if gens is None:
+        return []
+    changed = [ns for ns, g in gens.items() if _seen.get(ns, 0) != g]
+    for ns in changed:
+        _seen[ns] = gens[ns]
+        _fire(ns)
+    return changed
+
+def stats() -> dict:
+    st = dict(_stats)
+    st["mode"] = mode()
+    st["size"] = store().size()
+    return st
+
+async def _watch() -> None:
+    while True:
+        await asyncio.sleep(_POLL_SECONDS)
+        try:
+            await blocking.run(check)
+        except Exception:
+            _stats["errors"] += 1
+
+async def start() -> None:
+    """Record current generations and start the watcher (only needed with a shared server)."""
+    global _watcher
+    if mode() != "socket":
+        return
+    _seen.update(await blocking.run(lambda: store().generations() or {}))
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.create_task(_watch())
+
+async def stop() -> None:
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except (asyncio.CancelledError, Exception):
+            pass
+    _watcher = None
@@ -1,35 +1,333 @@
-import os
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient
-from azure.data.tables import TableServiceClient
-
-ACCOUNT = os.environ["STORAGE_ACCOUNT_NAME"]
-CONTAINER_UPLOADS  = os.environ["STORAGE_CONTAINER_UPLOADS"]
-CONTAINER_EVIDENCE = os.environ["STORAGE_CONTAINER_EVIDENCE"]
-CONTAINER_OUTPUTS  = os.environ["STORAGE_CONTAINER_OUTPUTS"]
-CONTAINER_TRACES   = os.environ["STORAGE_CONTAINER_TRACES"]
-TABLE_SESSIONS     = os.environ["STORAGE_TABLE_SESSIONS"]
-
-_cred = DefaultAzureCredential()
-_blob = BlobServiceClient(f"https://{ACCOUNT}.blob.core.windows.net", credential=_cred)    
-_table = TableServiceClient(endpoint=f"https://{ACCOUNT}.table.core.windows.net", credential=_cred)
+import os, codecs, math, threading, time
+from collections import OrderedDict
+from typing import Optional
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import UpdateMode
+from . import blocking, clients, metrics, shared_cache
+
+CONTAINER_UPLOADS  = os.environ.get("STORAGE_CONTAINER_UPLOADS", "uploads")
+CONTAINER_EVIDENCE = os.environ.get("STORAGE_CONTAINER_EVIDENCE", "evidence")
+CONTAINER_OUTPUTS  = os.environ.get("STORAGE_CONTAINER_OUTPUTS", "outputs")
+CONTAINER_TRACES   = os.environ.get("STORAGE_CONTAINER_TRACES", "traces")
+TABLE_SESSIONS     = os.environ.get("STORAGE_TABLE_SESSIONS", "sessions")
+
+def _account() -> str:
+    return clients.env("STORAGE_ACCOUNT_NAME")
+
+def _new_blob_service():
+    from azure.storage.blob import BlobServiceClient
+    return BlobServiceClient(f"https://{_account()}.blob.core.windows.net", credential=clients.credential())
+
+def _new_table_service():
+    from azure.data.tables import TableServiceClient
+    return TableServiceClient(endpoint=f"https://{_account()}.table.core.windows.net", credential=clients.credential())
+
+clients.register("blob", _new_blob_service)
+clients.register("table", _new_table_service)
+
+def _blob():
+    return clients.get("blob")
+
+def _table():
+    return clients.get("table")
 
 def list_blobs(container: str, prefix: str = "", suffix: str = "") -> list[str]:
-    cc = _blob.get_container_client(container)
+    t0 = time.perf_counter()
+    cc = _blob().get_container_client(container)
     names = []
     for b in cc.list_blobs(name_starts_with=prefix):
         n = b.name
         if not suffix or n.endswith(suffix):
             names.append(n)
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "list")
     return names
 
+def list_blob_sizes(container: str, prefix: str = "", suffix: str = "") -> list[tuple[str, int]]:
+    t0 = time.perf_counter()
+    cc = _blob().get_container_client(container)
+    out = [(b.name, b.size) for b in cc.list_blobs(name_starts_with=prefix)
+           if not suffix or b.name.endswith(suffix)]
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "list")
+    return out
+
+def list_blob_props(container: str, prefix: str = "", suffix: str = "") -> list[tuple[str, int, float]]:
+    """(name, size, last modified as epoch seconds) of the blobs under prefix."""
+    t0 = time.perf_counter()
+    cc = _blob().get_container_client(container)
+    out = [(b.name, b.size, b.last_modified.timestamp()) for b in cc.list_blobs(name_starts_with=prefix)
+           if not suffix or b.name.endswith(suffix)]
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "list")
+    return out
+
+def delete_blob(container: str, name: str) -> bool:
+    """False if the blob was already gone."""
+    try:
+        _blob().get_container_client(container).delete_blob(name)
+    except ResourceNotFoundError:
+        return False
+    return True
+
 def put_text(container:str, name:str, text:str):
-    _blob.get_container_client(container).upload_blob(name, text, overwrite=True)
-    return f"https://{ACCOUNT}.blob.core.windows.net/{container}/{name}"
+    t0 = time.perf_counter()
+    _blob().get_container_client(container).upload_blob(name, text, overwrite=True)
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "upload")
+    return f"https://{_account()}.blob.core.windows.net/{container}/{name}"
+
+def blob_etag(container: str, name: str) -> Optional[str]:
+    """ETag of a blob (one HEAD request), or None if it doesn't exist."""
+    try:
+        props = _blob().get_container_client(container).get_blob_client(name).get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+    return props.etag
+
+def stage_block(container: str, name: str, block_id: str, data: bytes) -> None:
+    """Upload one block of a block blob; nothing is visible until commit_blocks."""
+    t0 = time.perf_counter()
+    _blob().get_container_client(container).get_blob_client(name).stage_block(block_id, data)
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "stage_block")
+
+def commit_blocks(container: str, name: str, block_ids: list[str], content_type: Optional[str] = None) -> None:
+    from azure.storage.blob import BlobBlock, ContentSettings
+    t0 = time.perf_counter()
+    settings = ContentSettings(content_type=content_type) if content_type else None
+    _blob().get_container_client(container).get_blob_client(name).commit_block_list(
+        [BlobBlock(block_id=b) for b in block_ids], content_settings=settings)
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "commit")
 
 def get_text(container:str, name:str)->str:
-    b = _blob.get_container_client(container).download_blob(name)
-    return b.content_as_text()
+    t0 = time.perf_counter()
+    data = _blob().get_container_client(container).download_blob(name).readall()
+    metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "download")
+    metrics.BLOB_BYTES.inc(container, amount=len(data))
+    return data.decode("utf-8")
+
+def get_text_capped(container: str, name: str, max_chars: int, *, chunk_bytes: int = 256 * 1024) -> str:
+    """
+    Read at most max_chars characters of a UTF-8 blob using ranged downloads.
+    The first range is sized for ASCII (1 byte/char); later ranges use the
+    bytes/char ratio seen so far. An incremental decoder carries multi-byte
+    sequences split across range boundaries.
+    """
+    if max_chars <= 0:
+        return ""
+    cc = _blob().get_container_client(container)
+    dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    out: list[str] = []
+    have, offset, ratio = 0, 0, 1.0
+    while have < max_chars:
+        # +4 leaves room to finish a multi-byte sequence at the end of the range
+        length = min(chunk_bytes, math.ceil((max_chars - have) * ratio) + 4)
+        t0 = time.perf_counter()
+        try:
+            data = cc.download_blob(name, offset=offset, length=length).readall()
+        except HttpResponseError as e:
+            if e.status_code == 416:  # offset past end of blob (also: empty blob)
+                break
+            raise
+        finally:
+            metrics.BLOB_SECONDS.observe(time.perf_counter() - t0, "download_range")
+        if not data:
+            break
+        metrics.BLOB_BYTES.inc(container, amount=len(data))
+        offset += len(data)
+        txt = dec.decode(data)
+        out.append(txt)
+        have += len(txt)
+        if len(data) < length:  # short read -> end of blob
+            break
+        if have:
+            ratio = max(1.0, offset / have)
+    out.append(dec.decode(b"", final=True))
+    return "".join(out)[:max_chars]
 
 def sessions():
-    return _table.get_table_client(table_name=TABLE_SESSIONS)
\ No newline at end of file
+    return _table().get_table_client(table_name=TABLE_SESSIONS)
+
+# --- session store: LRU+TTL cache over the sessions table ---------------------
+# Reads are served from an in-process cache; writes go to Table Storage first
+# (conditional on the cached ETag) and then refresh the cache (write-through).
+# With several workers every write also publishes the row's new ETag in
+# shared_cache ("session", per sid); a cached copy whose ETag differs from the
+# published one is dropped and re-read, so a write on one worker is seen by the
+# next read on any other.
+
+_SESSION_TTL = float(os.environ.get("SESSION_CACHE_TTL", "30"))
+_SESSION_MAX = int(os.environ.get("SESSION_CACHE_MAX", "2048"))
+_SESSION_RETRIES = 3
+_SESSION_SHARED_TTL = max(60.0, 2 * _SESSION_TTL)  # outlives any cached copy
+
+_session_cache: "OrderedDict[str, tuple[dict, Optional[str], float]]" = OrderedDict()  # sid -> (entity, etag, expires)
+_session_lock = threading.Lock()  # touched from the I/O pool threads
+_session_stats = {"hits": 0, "misses": 0, "writes": 0, "conflicts": 0, "stale": 0}
+
+def _etag_of(meta) -> Optional[str]:
+    if isinstance(meta, dict):
+        return meta.get("etag")
+    return None
+
+def _shared() -> bool:
+    return shared_cache.mode() == "socket"
+
+def _session_entry(sid: str) -> Optional[tuple[dict, Optional[str]]]:
+    """(entity, etag) from the cache, or None; blocks on the shared store with several workers."""
+    with _session_lock:
+        item = _session_cache.get(sid)
+        if item and item[2] <= time.time():
+            del _session_cache[sid]
+            item = None
+    if item is None:
+        return None
+    if _shared():
+        # another worker may have written the row since this copy was cached
+        hit, newest = shared_cache.get("session", sid)
+        if hit and newest != item[1]:
+            with _session_lock:
+                _session_stats["stale"] += 1
+            invalidate_session(sid)
+            return None
+    with _session_lock:
+        if sid in _session_cache:
+            _session_cache.move_to_end(sid)
+        _session_stats["hits"] += 1
+    metrics.cache_result("session", True)
+    return dict(item[0]), item[1]
+
+def _session_cached(sid: str) -> Optional[dict]:
+    entry = _session_entry(sid)
+    return entry[0] if entry else None
+
+def _session_publish(sid: str, etag: Optional[str]) -> None:
+    # a write without an ETag still has to invalidate the other workers' copies
+    if _shared():
+        shared_cache.put("session", sid, etag or f"w{time.time_ns()}", _SESSION_SHARED_TTL)
+
+def _session_store(sid: str, entity: dict, etag: Optional[str]) -> None:
+    with _session_lock:
+        _session_cache[sid] = (dict(entity), etag, time.time() + _SESSION_TTL)
+        _session_cache.move_to_end(sid)
+        while len(_session_cache) > _SESSION_MAX:
+            _session_cache.popitem(last=False)
+
+def invalidate_session(sid: str) -> None:
+    with _session_lock:
+        _session_cache.pop(sid, None)
+
+def session_cache_stats() -> dict:
+    with _session_lock:
+        st = dict(_session_stats)
+        st["size"] = len(_session_cache)
+    reads = st["hits"] + st["misses"]
+    st["hit_ratio"] = round(st["hits"] / reads, 4) if reads else None
+    return st
+
+def _timed_table(op: str, fn, *args, **kw):
+    t0 = time.perf_counter()
+    try:
+        return fn(*args, **kw)
+    finally:
+        metrics.TABLE_SECONDS.observe(time.perf_counter() - t0, op)
+
+def _read_session(sid: str) -> dict:
+    ent = _timed_table("get", sessions().get_entity, partition_key="session", row_key=sid)
+    metrics.cache_result("session", False)
+    with _session_lock:
+        _session_stats["misses"] += 1
+    entity = dict(ent)
+    _session_store(sid, entity, _etag_of(getattr(ent, "metadata", None)))
+    return entity
+
+def get_session(sid: str) -> dict:
+    """Session entity as a plain dict (a copy; mutate freely). Raises if not found."""
+    cached = _session_cached(sid)
+    if cached is not None:
+        return cached
+    return _read_session(sid)
+
+def upsert_session(entity: dict):
+    meta = _timed_table("upsert", sessions().upsert_entity, entity)
+    with _session_lock:
+        _session_stats["writes"] += 1
+    # upsert merges; drop the entry so the next read sees the merged row
+    invalidate_session(entity["RowKey"])
+    _session_publish(entity["RowKey"], _etag_of(meta))
+    return meta
+
+def update_session(sid: str, changes: dict) -> dict:
+    """
+    Merge `changes` into the session with an ETag-conditional write, so a
+    concurrent update is never clobbered. On a 412 the row is re-read and the
+    merge retried. Returns the merged entity.
+    """
+    for attempt in range(_SESSION_RETRIES):
+        entry = _session_entry(sid)
+        if entry and entry[1]:
+            current, etag = entry
+        else:
+            current = _read_session(sid)
+            with _session_lock:
+                etag = _session_cache[sid][1] if sid in _session_cache else None
+
+        body = {"PartitionKey": "session", "RowKey": sid, **changes}
+        try:
+            if etag:
+                meta = _timed_table("update", sessions().update_entity, body, mode=UpdateMode.MERGE,
+                                    etag=etag, match_condition=MatchConditions.IfNotModified)
+            else:
+                meta = _timed_table("update", sessions().update_entity, body, mode=UpdateMode.MERGE)
+        except ResourceModifiedError:
+            with _session_lock:
+                _session_stats["conflicts"] += 1
+            invalidate_session(sid)
+            if attempt == _SESSION_RETRIES - 1:
+                raise
+            continue
+
+        current.update(changes)
+        with _session_lock:
+            _session_stats["writes"] += 1
+        _session_store(sid, current, _etag_of(meta))
+        _session_publish(sid, _etag_of(meta))
+        return current
+
+# --- async wrappers (run the sync SDK calls on the bounded I/O pool) ---------
+
+async def alist_blobs(container: str, prefix: str = "", suffix: str = "") -> list[str]:
+    return await blocking.run(list_blobs, container, prefix, suffix)
+
+async def alist_blob_props(container: str, prefix: str = "", suffix: str = "") -> list[tuple[str, int, float]]:
+    return await blocking.run(list_blob_props, container, prefix, suffix)
+
+async def adelete_blob(container: str, name: str) -> bool:
+    return await blocking.run(delete_blob, container, name)
+
+async def aput_text(container: str, name: str, text: str):
+    return await blocking.run(put_text, container, name, text)
+
+async def astage_block(container: str, name: str, block_id: str, data: bytes) -> None:
+    return await blocking.run(stage_block, container, name, block_id, data)
+
+async def acommit_blocks(container: str, name: str, block_ids: list[str], content_type: Optional[str] = None) -> None:
+    return await blocking.run(commit_blocks, container, name, block_ids, content_type)
+
+async def aget_text(container: str, name: str) -> str:
+    return await blocking.run(get_text, container, name)
+
+async def aget_text_capped(container: str, name: str, max_chars: int) -> str:
+    return await blocking.run(get_text_capped, container, name, max_chars)
+
+async def aget_session(sid: str) -> dict:
+    if _shared():
+        # the cached copy is checked against the shared store (a socket call)
+        return await blocking.run(get_session, sid)
+    cached = _session_cached(sid)
+    if cached is not None:
+        return cached
+    return await blocking.run(_read_session, sid)
+
+async def aupsert_session(entity: dict):
+    return await blocking.run(upsert_session, entity)
+
+async def aupdate_session(sid: str, changes: dict) -> dict:
+    return await blocking.run(update_session, sid, changes)
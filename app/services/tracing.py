@@ -0,0 +1,166 @@
+# app/services/tracing.py
+# Per-draft timing traces written as JSONL blobs to the traces container.
+#
+# - Head sampling: start() decides once per request (TRACING.SAMPLE_RATE in
+#   App Config, default 0.1; `x-trace: 1` on the request forces it).
+# - span("name") records wall-clock offsets on the current trace (a contextvar,
+#   so spans from tasks spawned by the request land on the same trace); with
+#   no sampled trace it costs one contextvar lookup.
+# - finish() only appends the record to an in-memory buffer. A background task
+#   serialises and uploads batches on the I/O pool, so JSON encoding and the
+#   blob write never run on the request path. A full buffer drops oldest.
+#
+# Env: TRACING_FLUSH_SECONDS (5), TRACING_BATCH_MAX (500), TRACING_BUFFER_MAX (5000)
+import asyncio, json, os, random, socket, time, uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from . import blocking, storage
+from .appcfg import aget as cfg_aget
+
+_FLUSH_SECONDS = float(os.environ.get("TRACING_FLUSH_SECONDS", "5"))
+_BATCH_MAX = int(os.environ.get("TRACING_BATCH_MAX", "500"))
+_BUFFER_MAX = int(os.environ.get("TRACING_BUFFER_MAX", "5000"))
+_HOST = socket.gethostname()
+
+class Trace:
+    __slots__ = ("trace_id", "name", "wall", "t0", "attrs", "spans", "done")
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.wall = time.time()
+        self.t0 = time.perf_counter()
+        self.attrs = attrs
+        self.spans: list = []
+        self.done = False
+
+_current: ContextVar[Optional[Trace]] = ContextVar("smartai_trace", default=None)
+_buffer: deque = deque()
+_stats = {"started": 0, "sampled": 0, "finished": 0, "dropped": 0, "flushed": 0, "blobs": 0, "errors": 0}
+_flusher: Optional[asyncio.Task] = None
+_wake: Optional[asyncio.Event] = None
+_seq = 0
+
+async def _sample_rate() -> float:
+    try:
+        return float(await cfg_aget("TRACING.SAMPLE_RATE", "0.1"))
+    except (TypeError, ValueError):
+        return 0.1
+
+async def start(name: str, *, force: bool = False, **attrs) -> Optional[Trace]:
+    """Begin a trace for this request if sampled; returns it (or None)."""
+    _stats["started"] += 1
+    if not force and random.random() >= await _sample_rate():
+        _current.set(None)
+        return None
+    tr = Trace(name, attrs)
+    _current.set(tr)
+    _stats["sampled"] += 1
+    return tr
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block on the current trace; yields a dict the block may add attributes to."""
+    tr = _current.get()
+    if tr is None:
+        yield attrs
+        return
+    t = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter()
+        attrs["name"] = name
+        attrs["start_ms"] = round((t - tr.t0) * 1000, 2)
+        attrs["duration_ms"] = round((end - t) * 1000, 2)
+        tr.spans.append(attrs)
+
+def finish(tr: Optional[Trace], **attrs) -> None:
+    """Close the trace and queue it for upload (no serialisation here)."""
+    if tr is None or tr.done:
+        return
+    tr.done = True
+    tr.attrs.update(attrs)
+    record = {
+        "trace_id": tr.trace_id, "name": tr.name, "host": _HOST, "pid": os.getpid(),
+        "ts": datetime.fromtimestamp(tr.wall, timezone.utc).isoformat(),
+        "duration_ms": round((time.perf_counter() - tr.t0) * 1000, 2),
+        "attrs": tr.attrs, "spans": tr.spans,
+    }
+    if len(_buffer) >= _BUFFER_MAX:
+        _buffer.popleft()
+        _stats["dropped"] += 1
+    _buffer.append(record)
+    _stats["finished"] += 1
+    if _wake is not None and len(_buffer) >= _BATCH_MAX:
+        _wake.set()
+
+def stats() -> dict:
+    st = dict(_stats)
+    st["buffered"] = len(_buffer)
+    return st
+
+# --- flushing ----------------------------------------------------------------
+
+def _to_jsonl(batch: list) -> str:
+    return "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch)
+
+def _blob_name() -> str:
+    global _seq
+    _seq += 1
+    now = datetime.now(timezone.utc)
+    return f"{now:%Y/%m/%d/%H}/{_HOST}-{os.getpid()}-{now:%M%S}-{_seq:06d}.jsonl"
+
+async def flush() -> int:
+    """Upload everything buffered, in batches of TRACING_BATCH_MAX. Returns records written."""
+    written = 0
+    while _buffer:
+        batch = [_buffer.popleft() for _ in range(min(_BATCH_MAX, len(_buffer)))]
+        try:
+            text = await blocking.run(_to_jsonl, batch)
+            await storage.aput_text(storage.CONTAINER_TRACES, _blob_name(), text)
+        except Exception:
+            # traces are best-effort: drop the batch rather than grow without bound
+            _stats["errors"] += 1
+            _stats["dropped"] += len(batch)
+            continue
+        written += len(batch)
+        _stats["flushed"] += len(batch)
+        _stats["blobs"] += 1
+    return written
+
+async def _flush_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await flush()
+
+def start_flusher() -> None:
+    global _flusher, _wake
+    _wake = asyncio.Event()
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.create_task(_flush_loop())
+
+async def stop() -> None:
+    """Stop the flusher and write what is left (FastAPI lifespan shutdown)."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except (asyncio.CancelledError, Exception):
+            pass
+    _flusher = None
+    await flush()
@@ -0,0 +1,182 @@
+# app/services/uploads.py
+# Evidence uploads: request body -> uploads container -> text extraction in
+# the process pool -> evidence/{sid}_{label}.txt (what _load_evidence reads)
+# plus its chunk digest (evidence.py / digest.py).
+#
+# The body is consumed chunk by chunk and staged as block-blob blocks of
+# UPLOAD_BLOCK_BYTES, so at most one block is held in memory; the same bytes
+# are spooled to a temp file for the extractor. Extraction runs in a
+# background task after the upload response.
+#
+# Status: each job's state (receiving -> queued -> extracting -> done | failed)
+# is kept in this process for live progress and written to the session entity
+# as upload_{label} (JSON) on every transition after the upload, so any worker
+# can report it.
+#
+# Env:
+#   UPLOAD_MAX_BYTES    default 50 MiB (larger bodies are rejected)
+#   UPLOAD_BLOCK_BYTES  default 4 MiB
+#   UPLOAD_TMP_DIR      spool directory, default the system temp dir
+import asyncio, base64, json, os, re, tempfile, time
+from typing import AsyncIterator, Optional
+from . import blocking, evidence, extract, metrics, storage
+
+MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+_BLOCK_BYTES = int(os.environ.get("UPLOAD_BLOCK_BYTES", str(4 * 1024 * 1024)))
+_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None
+
+LABEL_RE = re.compile(r"^[a-z0-9_]{1,64}$")
+_SUFFIX = {"pdf": ".pdf", "docx": ".docx", "txt": ".txt"}
+
+EXTRACT_SECONDS = metrics.Histogram("smartai_extract_seconds", "Evidence text extraction time", ("kind", "status"))
+
+class UploadTooLarge(ValueError):
+    pass
+
+class ExtractorUnavailable(ValueError):
+    pass
+
+_jobs: dict[tuple[str, str], dict] = {}  # (sid, label) -> status, this process only
+_JOBS_MAX = 1000
+_tasks: set = set()
+
+def _field(label: str) -> str:
+    return f"upload_{label}"
+
+def _set(sid: str, label: str, st: dict, **changes) -> dict:
+    st = dict(st, updated=time.time(), **changes)
+    _jobs[(sid, label)] = st
+    if len(_jobs) > _JOBS_MAX:
+        # finished jobs are in the session entity too; forget the oldest here
+        done = sorted((v["updated"], k) for k, v in _jobs.items() if v["state"] in ("done", "failed"))
+        for _, k in done[: len(_jobs) - _JOBS_MAX]:
+            del _jobs[k]
+    return st
+
+async def _publish(sid: str, label: str, st: dict) -> None:
+    try:
+        await storage.aupdate_session(sid, {_field(label): json.dumps(st)})
+    except Exception:
+        pass  # this worker still reports it from _jobs
+
+def _block_id(i: int) -> str:
+    # block ids must be base64 and all the same length within a blob
+    return base64.b64encode(f"{i:08d}".encode()).decode()
+
+async def receive(sid: str, label: str, filename: Optional[str], content_type: Optional[str],
+                  chunks: AsyncIterator[bytes], declared_length: Optional[int] = None) -> dict:
+    """
+    Stream an upload into the uploads container and queue its extraction.
+    Raises ValueError for a bad label / unsupported type / empty body, ExtractorUnavailable when
+    the parser for the type is not installed, UploadTooLarge over MAX_BYTES.
+    """
+    if not LABEL_RE.match(label or ""):
+        raise ValueError("label must be 1-64 chars of a-z, 0-9, _")
+    kind = extract.kind_of(filename, content_type)
+    if kind is None:
+        raise ValueError("unsupported file type (expected PDF, DOCX or TXT)")
+    if not extract.available(kind):
+        raise ExtractorUnavailable(f"{kind.upper()} extraction is not available on this server")
+    if declared_length and declared_length > MAX_BYTES:
+        raise UploadTooLarge(f"upload larger than {MAX_BYTES} bytes")
+
+    # read up to the first non-empty chunk before any state or blocks exist, so
+    # an empty body is rejected instead of queueing extraction of an empty file
+    chunks = chunks.__aiter__()
+    first = b""
+    async for first in chunks:
+        if first:
+            break
+    if not first:
+        raise ValueError("upload body is empty")
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    blob = f"{sid}_{label}{_SUFFIX[kind]}"
+    st = _set(sid, label, {"label": label, "filename": filename, "kind": kind, "blob": blob,
+                           "bytes": 0, "started": time.time()}, state="receiving")
+    fd, path = tempfile.mkstemp(prefix=f"{sid}_{label}_", suffix=_SUFFIX[kind], dir=_TMP_DIR)
+    ids: list[str] = []
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            async def flush(data: bytes):
+                ids.append(_block_id(len(ids)))
+                await asyncio.gather(storage.astage_block(storage.CONTAINER_UPLOADS, blob, ids[-1], data),
+                                     blocking.run(spool.write, data))
+
+            buf = bytearray()
+            async for chunk in body():
+                if not chunk:
+                    continue
+                st["bytes"] += len(chunk)
+                if st["bytes"] > MAX_BYTES:
+                    raise UploadTooLarge(f"upload larger than {MAX_BYTES} bytes")
+                buf += chunk
+                if len(buf) >= _BLOCK_BYTES:
+                    data = bytes(buf)
+                    buf.clear()
+                    await flush(data)
+            if buf:
+                await flush(bytes(buf))
+        await storage.acommit_blocks(storage.CONTAINER_UPLOADS, blob, ids, content_type)
+    except BaseException as e:
+        _set(sid, label, st, state="failed", error=str(e)[:500] or type(e).__name__)
+        _unlink(path)
+        raise
+
+    st = _set(sid, label, st, state="queued")
+    await _publish(sid, label, st)
+    task = asyncio.get_running_loop().create_task(_extract(sid, label, path, kind, st))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return st
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+async def _extract(sid: str, label: str, path: str, kind: str, st: dict) -> None:
+    t0 = time.perf_counter()
+    try:
+        st = _set(sid, label, st, state="extracting")
+        await _publish(sid, label, st)
+        text, raw = await extract.run_fn(extract.extract_with_digest, path, kind)
+        await storage.aput_text(storage.CONTAINER_EVIDENCE, evidence.text_name(sid, label), text)
+        await blocking.run(evidence.save, sid, label, raw)
+        EXTRACT_SECONDS.observe(time.perf_counter() - t0, kind, "ok")
+        st = _set(sid, label, st, state="done", chars=len(text), chunks=len(raw["chunks"]),
+                  extract_s=round(time.perf_counter() - t0, 3))
+    except Exception as e:
+        EXTRACT_SECONDS.observe(time.perf_counter() - t0, kind, "error")
+        st = _set(sid, label, st, state="failed", error=str(e)[:500] or type(e).__name__)
+    finally:
+        _unlink(path)
+    await _publish(sid, label, st)
+
+async def status(sid: str) -> dict:
+    """label -> job status for the session; the newer of this worker's and the session's copy."""
+    out: dict[str, dict] = {}
+    try:
+        sess = await storage.aget_session(sid)
+    except Exception:
+        sess = {}
+    for k, v in sess.items():
+        if k.startswith("upload_") and isinstance(v, str):
+            try:
+                out[k[len("upload_"):]] = json.loads(v)
+            except ValueError:
+                pass
+    for (s, label), st in list(_jobs.items()):
+        if s == sid and st.get("updated", 0) >= out.get(label, {}).get("updated", 0):
+            out[label] = st
+    return out
+
+async def drain() -> None:
+    """Wait for running extractions (tests, tools)."""
+    if _tasks:
+        await asyncio.gather(*list(_tasks), return_exceptions=True)
@@ -0,0 +1,106 @@
+# app/services/vault_index.py
+# In-memory index of approved prompt templates, loaded once from the packs on
+# disk (app/vault/*/pack.yml via pack_loader) or from the build_index_payload.py
+# artifact (JSON Lines, or the compat JSON array), streamed doc by doc.
+# Resolves (pack, version, section, variant) with dict lookups; no network.
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from . import pack_loader
+
+VAULT_DIR = Path(__file__).resolve().parents[1] / "vault"
+
+def _variant_key(name: str) -> str:
+    # pack.yml keys use "__" (about_project__i_and_p__automation), requests and
+    # file stems use "." (about_project.i_and_p.automation)
+    return (name or "").strip().replace("__", ".")
+
+def _version_sort_key(v: str) -> Tuple:
+    return tuple(int(p) if p.isdigit() else p for p in str(v).split("."))
+
+class VaultIndex:
+    def __init__(self):
+        self._docs: Dict[Tuple[str, str, str, str], dict] = {}   # (pack, ver, section, variant) -> doc
+        self._default: Dict[Tuple[str, str, str], dict] = {}     # (pack, ver, section) -> doc
+        self._default_rank: Dict[Tuple[str, str, str], int] = {}
+        self._latest: Dict[str, str] = {}                         # pack -> highest approved version
+        self.source: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, pack_id: str, version: str, section_id: str, template_key: str,
+            template: str, metadata: dict) -> None:
+        pack_id, version = pack_id.upper(), str(version)
+        doc = {"template": template, "pack_id": pack_id, "version": version, "metadata": metadata}
+        variant = _variant_key(template_key)
+        self._docs[(pack_id, version, section_id, variant)] = doc
+
+        # Default template for a bare section: the one keyed by the section itself,
+        # else a ".core" variant, else the first approved one seen.
+        dkey = (pack_id, version, section_id)
+        rank = 0 if variant == section_id else 1 if variant.endswith(".core") else 2
+        if rank < self._default_rank.get(dkey, 3):
+            self._default[dkey] = doc
+            self._default_rank[dkey] = rank
+
+        if pack_id not in self._latest or _version_sort_key(version) > _version_sort_key(self._latest[pack_id]):
+            self._latest[pack_id] = version
+
+    def lookup(self, pack_id: str, version: str, section_id: str, variant: Optional[str] = None) -> Optional[dict]:
+        pack_id = pack_id.upper()
+        if version == "latest-approved":
+            version = self._latest.get(pack_id, version)
+        if variant:
+            hit = self._docs.get((pack_id, version, section_id, _variant_key(variant)))
+            if hit:
+                return hit
+        return self._default.get((pack_id, version, section_id))
+
+    # --- loaders ---------------------------------------------------------------
+
+    def load_vault_dir(self, vault_dir: Path) -> "VaultIndex":
+        for pack in pack_loader.iter_packs(vault_dir):
+            self._add_pack(pack)
+        self.source = str(vault_dir)
+        return self
+
+    def _add_pack(self, pack: "pack_loader.Pack") -> None:
+        for t in pack.templates.values():
+            if t.status != "approved" or not t.exists():
+                continue
+            self.add(pack.id, pack.version, t.section_id, t.key, t.body, t.metadata())
+
+    def load_artifact(self, path: Path) -> "VaultIndex":
+        """Load docs produced by tools/build_index_payload.py (approved rows only)."""
+        self._add_docs(pack_loader.iter_payload_docs(str(path)))
+        self.source = str(path)
+        return self
+
+    def _add_docs(self, docs: Iterable[dict]) -> None:
+        for d in docs:
+            if d.get("status") != "approved":
+                continue
+            try:
+                meta = json.loads(d.get("metadata_json") or "{}")
+            except Exception:
+                meta = {}
+            section_id = meta.get("section_id") or d.get("section_id")
+            if not section_id:
+                continue  # not addressable by section
+            pack_id = d.get("pack_id") or meta.get("pack_id")
+            version = d.get("version") or meta.get("version")
+            if not pack_id or not version:
+                continue  # not addressable by pack
+            tmpl_key = meta.get("template_key") or section_id
+            # build_index_payload keys sections by template key (about_project__core)
+            if "__" in section_id:
+                section_id = section_id.split("__", 1)[0]
+            self.add(pack_id, version, section_id, tmpl_key, d.get("template_text", ""), meta)
+
+def load(source: Optional[str] = None) -> VaultIndex:
+    """Build an index from a vault directory (default app/vault) or a payload artifact (.jsonl/.json)."""
+    path = Path(source) if source else VAULT_DIR
+    if path.is_file():
+        return VaultIndex().load_artifact(path)
+    return VaultIndex().load_vault_dir(path)
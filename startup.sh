@@ -10,5 +10,19 @@ python -c "import sys, pkgutil; print('PYTHONPATH=', sys.path)" || true
 python -c "import uvicorn, gunicorn; print('uvicorn', uvicorn.__version__)" || true
 python -c "import sys, cryptography; print('cryptography=', cryptography.__version__, cryptography.__file__); print('sys.maxunicode=', sys.maxunicode)" || true
 
+# Workers: WEB_CONCURRENCY if set, else one per CPU available to this process
+WORKERS="${WEB_CONCURRENCY:-$(python -c 'import os; print(max(1, len(os.sched_getaffinity(0))))')}"
+
+# With more than one worker, run the host-local shared cache next to gunicorn
+# so App Config / Key Vault / Search results are fetched once per host, not per worker,
+# and a session written on one worker is not served stale by another
+if [ "${WORKERS}" -gt 1 ]; then
+  export SHARED_CACHE_SOCKET="${SHARED_CACHE_SOCKET:-/tmp/smartai-cache.sock}"
+  python -m app.services.cache_server --socket "${SHARED_CACHE_SOCKET}" &
+  # workers that can't connect skip the store for a while: start them once it answers
+  python -m app.services.cache_server --socket "${SHARED_CACHE_SOCKET}" --wait 15 \
+    || echo "shared cache not ready; workers will fall back to Azure until it is" >&2
+fi
+
 # Start the API
-exec gunicorn -w 1 -k uvicorn.workers.UvicornWorker app.main:app --bind 0.0.0.0:${PORT}
+exec gunicorn -w "${WORKERS}" -k uvicorn.workers.UvicornWorker app.main:app --bind 0.0.0.0:${PORT}
@@ -0,0 +1,93 @@
+# Run: python -m pytest -q test_aoai.py   (or: python test_aoai.py)
+# AOAI scheduler (app/services/aoai.py): server rate-limit headers fed to
+# _Bucket.observe() really hold callers back in _take(), including with the
+# default AOAI.RATE_RPS=0, where AOAI.BURST caps the requests in flight.
+
+import asyncio, time
+
+import httpx
+
+from app.services import aoai
+
+
+def _resp(status=200, **headers):
+    return httpx.Response(status, headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+async def _takes(bucket, n, timeout):
+    """How many of n callers get a slot within timeout."""
+    got = 0
+
+    async def one():
+        nonlocal got
+        await bucket._take()
+        got += 1
+
+    tasks = [asyncio.create_task(one()) for _ in range(n)]
+    await asyncio.sleep(timeout)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return got
+
+
+def test_burst_caps_requests_in_flight_without_a_rate():
+    async def run():
+        b = aoai._Bucket(rate=0.0, burst=3, queue_max=0, queue_timeout=5)
+        assert await _takes(b, 5, 0.05) == 3
+        b.release()
+        assert await _takes(b, 5, 0.05) == 1  # one slot freed, one more caller in
+        assert b.snapshot()["in_flight"] == 3
+    asyncio.run(run())
+
+
+def test_remaining_requests_clamps_until_the_window_resets():
+    async def run():
+        b = aoai._Bucket(rate=0.0, burst=10, queue_max=0, queue_timeout=5)
+        b.observe(_resp(x_ratelimit_remaining_requests="2", x_ratelimit_reset_requests="300ms"))
+        assert await _takes(b, 5, 0.1) == 2  # clamp holds with no steady refill
+        for _ in range(2):
+            b.release()  # responses ending don't lift the server's quota
+        assert await _takes(b, 5, 0.1) == 0
+        assert b.snapshot()["window_s"] > 0
+        await asyncio.sleep(0.15)
+        assert await _takes(b, 12, 0.05) == 10  # window over: back to burst
+    asyncio.run(run())
+
+
+def test_remaining_requests_without_reset_header_uses_default_window():
+    async def run():
+        b = aoai._Bucket(rate=0.0, burst=4, queue_max=0, queue_timeout=5)
+        b.observe(_resp(x_ratelimit_remaining_requests="1"))
+        t0 = time.monotonic()
+        await b._take()
+        await b._take()  # waits for the assumed window
+        assert time.monotonic() - t0 >= aoai._WINDOW * 0.9
+    asyncio.run(run())
+
+
+def test_exhausted_quota_and_429_pause_the_bucket():
+    async def run():
+        b = aoai._Bucket(rate=5.0, burst=5, queue_max=0, queue_timeout=5)
+        b.observe(_resp(x_ratelimit_remaining_tokens="0", retry_after_ms="200"))
+        assert await _takes(b, 1, 0.1) == 0
+        await asyncio.sleep(0.15)
+        assert await _takes(b, 1, 0.05) == 1
+        b.observe(_resp(429, retry_after="1"))
+        assert 0.9 < b.pause_left() <= 1.0
+    asyncio.run(run())
+
+
+def test_reset_header_durations():
+    parse = lambda v: aoai._reset_after({"x-ratelimit-reset-requests": v})
+    assert parse("1s") == 1.0 and parse("250ms") == 0.25 and parse("6m0s") == 360.0 and parse("2") == 2.0
+    assert parse("soon") is None and aoai._reset_after({}) is None
+
+
+if __name__ == "__main__":
+    test_burst_caps_requests_in_flight_without_a_rate()
+    test_remaining_requests_clamps_until_the_window_resets()
+    test_remaining_requests_without_reset_header_uses_default_window()
+    test_exhausted_quota_and_429_pause_the_bucket()
+    test_reset_header_durations()
+    print("OK ✓  AOAI bucket honours server rate-limit feedback.")
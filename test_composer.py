@@ -0,0 +1,156 @@
+# Run: python -m pytest -q test_composer.py   (or: python test_composer.py)
+# Golden-output equivalence: the compiled template renderer must produce exactly
+# what the legacy string-pass renderer produces, over every real EDG/PSG template.
+# Token budget: composed prompts stay within TokenBudget.prompt_budget; the tiktoken
+# path (stubbed) is loaded off the event loop, once, and a failed load is retried later.
+
+import asyncio, random, sys, threading, types
+from pathlib import Path
+
+from app.services import composer
+
+VAULT = Path(__file__).resolve().parent / "app" / "vault"
+TEMPLATES = sorted(VAULT.glob("*/templates/*.md"))
+
+LABEL_SETS = [
+    {},
+    {"registry": "acra_bizfile"},
+    {"financials": "audited_financials"},
+    {"registry": "acra_bizfile", "financials": "audited_financials"},
+    {"vendor_quote": "vendor_quotation", "costs": "cost_breakdown", "deployment_proof": "deployment_location_proof"},
+    {"registry": "acra_bizfile", "financials": "audited_financials", "vendor_quote": "vendor_quotation",
+     "costs": "cost_breakdown", "deployment_proof": "deployment_location_proof", "annex3_package": "annex3_package",
+     "market_analysis": "market_analysis", "consultant_proposal": "consultant_proposal"},
+]
+
+KV_SETS = [
+    {"framework": "SCQA", "style": "Formal, consultant voice", "length_limit": "350",
+     "evidence_window": "", "user_prompt": ""},
+    {"framework": "PAS", "style": "Formal, outcome-oriented", "length_limit": "220",
+     "evidence_window": "\n\n--- [evidence:acra_bizfile] ---\nUEN 201912345Z\tincorporated 2019.\n\n"
+                        "--- [evidence:audited_financials] ---\nRevenue FY2023: SGD 4.2m  (FY2022: 3.9m)",
+     "user_prompt": "Emphasise  export\n growth"},
+]
+
+
+def _assert_equivalent(tpl: str):
+    ops = composer.compile_template(tpl)
+    for labels in LABEL_SETS:
+        for kv in KV_SETS:
+            expected = composer._render_legacy(tpl, kv, labels)
+            got = composer.render_compiled(ops, kv, labels)
+            assert got == expected, f"mismatch (labels={labels}, kv={kv['framework']})"
+
+
+def test_real_templates_match_legacy():
+    assert TEMPLATES, "no templates found under app/vault"
+    for path in TEMPLATES:
+        _assert_equivalent(path.read_text(encoding="utf-8"))
+
+
+def test_block_edge_cases_match_legacy():
+    cases = [
+        "a {{#labels.registry}}in [source:{{labels.registry}}]{{/labels.registry}} b",
+        "{{#labels.registry}}x{{#labels.costs}}y {{labels.costs}}{{/labels.costs}}z{{/labels.registry}}",
+        "mismatch {{#labels.registry}}x{{/labels.costs}} tail",
+        "stray {{/labels.registry}} then {{#labels.costs}}kept?{{/labels.costs}} {{labels.costs}}",
+        "unclosed {{#labels.nope}} content {{labels.registry}}",
+        "spaces {{# labels.registry }}x{{/ labels.registry }} {{ labels.unknown }} {{framework}}",
+        "unknown {{foo}} {{ style }} {{style}}",
+        "",
+    ]
+    for tpl in cases:
+        _assert_equivalent(tpl)
+
+
+def test_random_templates_match_legacy():
+    rnd = random.Random(7)
+    pieces = ["{{#labels.registry}}", "{{/labels.registry}}", "{{#labels.costs}}", "{{/labels.costs}}",
+              "{{labels.registry}}", "{{labels.costs}}", "{{labels.nope}}", "{{framework}}",
+              "{{evidence_window}}", " ", "\n\n", "## Head ", "text", "[source:x]"]
+    for _ in range(2000):
+        _assert_equivalent("".join(rnd.choice(pieces) for _ in range(rnd.randint(0, 12))))
+
+
+def test_trim_tokens_respects_limit():
+    text = "Revenue FY2023: SGD 4.2m [source:audited_financials]. " * 300
+    for limit in (0, 1, 50, 700):
+        head, n, cut = composer.trim_tokens(text, limit)
+        assert cut and n <= limit and text.startswith(head)
+        assert composer.count_tokens(head) == n
+    assert composer.trim_tokens("short", 50) == ("short", composer.count_tokens("short"), False)
+
+
+def test_budget_fits_prompt_and_sizes_output():
+    tpl = (VAULT / "EDG.v1" / "templates" / "consultancy_scope.md").read_text(encoding="utf-8")
+    tpl_obj = {"template": tpl, "pack_id": "EDG", "version": "t", "metadata": {"template_key": "consultancy_scope"}}
+    evidence = "\n\n--- [evidence:acra_bizfile] ---\n" + "UEN 201912345Z incorporated 2019. " * 2000
+    for prompt_budget, length in ((3000, 350), (1800, 100)):
+        budget = composer.TokenBudget(prompt_budget=prompt_budget, operator_limit=40)
+        inputs = {"length_limit": length, "prompt": "Emphasise export growth " * 50}
+        msgs, _, _ = composer._render_instruction("SCQA", inputs, evidence, tpl_obj, None, budget)
+        assert budget.evidence_truncated and budget.prompt_tokens <= prompt_budget
+        assert budget.max_tokens == max(256, length * 2)
+        assert composer.count_tokens(msgs[1]["content"]) <= prompt_budget
+        assert "[evidence:acra_bizfile]" in msgs[1]["content"]
+
+
+class _StubEncoding:
+    """Byte-level stand-in for a tiktoken Encoding: one token per UTF-8 byte."""
+    def encode(self, text, disallowed_special=()):
+        return list(text.encode("utf-8"))
+
+    def decode(self, ids):
+        return bytes(ids).decode("utf-8", "ignore")
+
+
+def test_tiktoken_encoder_loads_off_the_loop_and_retries_failures():
+    loads = []
+
+    def get_encoding(name):
+        loads.append((name, threading.current_thread() is threading.main_thread()))
+        if name == "broken":
+            raise OSError("BPE download failed")
+        return _StubEncoding()
+
+    saved = sys.modules.get("tiktoken")
+    sys.modules["tiktoken"] = types.SimpleNamespace(get_encoding=get_encoding)
+    composer._encoders.clear()
+    try:
+        assert composer.count_tokens("héllo", "stub") == composer.estimate_tokens("héllo")  # never loads inline
+        assert not loads
+
+        async def load_concurrently(name):
+            return await asyncio.gather(*(composer.aload_encoder(name) for _ in range(5)))
+
+        encs = asyncio.run(load_concurrently("stub"))
+        assert loads == [("stub", False)]  # one load, on the I/O pool
+        assert all(e is encs[0] for e in encs)
+        assert composer.count_tokens("héllo", "stub") == 6  # memoised estimate dropped
+        assert composer.trim_tokens("héllo world", 3, "stub") == ("hé", 3, True)
+        assert composer.TokenBudget(encoding="stub").tokenizer == "tiktoken:stub"
+
+        assert asyncio.run(composer.aload_encoder("broken")) is None
+        assert asyncio.run(composer.aload_encoder("broken")) is None
+        assert loads.count(("broken", False)) == 1  # failure cached...
+        enc, retry_at = composer._encoders["broken"]
+        composer._encoders["broken"] = (enc, retry_at - composer._ENCODER_RETRY_SECONDS)
+        asyncio.run(composer.aload_encoder("broken"))
+        assert loads.count(("broken", False)) == 2  # ...for a while, then retried
+    finally:
+        if saved is None:
+            sys.modules.pop("tiktoken", None)
+        else:
+            sys.modules["tiktoken"] = saved
+        composer._encoders.clear()
+        composer._count_memo.cache_clear()
+
+
+if __name__ == "__main__":
+    test_real_templates_match_legacy()
+    test_block_edge_cases_match_legacy()
+    test_random_templates_match_legacy()
+    test_trim_tokens_respects_limit()
+    test_budget_fits_prompt_and_sizes_output()
+    test_tiktoken_encoder_loads_off_the_loop_and_retries_failures()
+    print(f"OK ✓  compiled renderer matches legacy over {len(TEMPLATES)} templates.")
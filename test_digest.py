@@ -0,0 +1,121 @@
+# Run: python -m pytest -q test_digest.py   (or: python test_digest.py)
+# Evidence digests (app/services/digest.py): paragraph-aligned chunking, BM25
+# ranking, and packing the best chunks into the evidence budget in document
+# order. evidence.get() rebuilds a stored digest once its text blob changes
+# (against the in-memory Azure fakes in tools/fake_azure.py).
+
+import asyncio, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "tools"))
+import fake_azure
+from app.services import digest
+
+PARAS = [
+    "Acme Pte Ltd was incorporated in 2019 and designs industrial sensors.",
+    "Revenue grew to SGD 4.2m in FY2023, with export sales at 40 percent.",
+    "The company employs 35 staff across Singapore and Malaysia.",
+    "The project automates the sensor calibration line with robotic arms.",
+    "Automation cuts calibration time per unit from 12 to 3 minutes.",
+]
+
+
+def _digest(paras=PARAS, size=80):
+    return digest.load(digest.build("\n\n".join(paras), size))
+
+
+def test_chunks_follow_paragraphs_and_split_long_ones():
+    assert digest.chunk("\n\n".join(PARAS), 80) == PARAS
+    # short paragraphs are merged up to the chunk size
+    assert digest.chunk("a b\n\nc d\n\n\n\ne f", 100) == ["a b\n\nc d\n\ne f"]
+    long = " ".join(f"Sentence number {i} is here." for i in range(40))
+    chunks = digest.chunk(long, 100)
+    assert len(chunks) > 1 and all(len(c) <= 100 for c in chunks)
+    assert " ".join(chunks) == long  # split at sentence boundaries, nothing lost
+    assert digest.chunk("x" * 250, 100) == ["x" * 100, "x" * 100, "x" * 50]  # no boundary: hard cut
+    assert digest.chunk("") == [] and digest.chunk("\n\n  \n\n") == []
+
+
+def test_rank_scores_matching_chunks_first_in_document_order():
+    d = _digest()
+    ranked = d.rank(digest.query_terms("automation calibration"))
+    assert {i for _, i in ranked[:2]} == {3, 4}
+    assert [i for s, i in ranked if s == 0] == [0, 1, 2]  # non-matching: document order
+    assert d.rank(digest.query_terms("automation calibration")) is ranked  # memoised
+    assert [i for _, i in d.rank(())] == list(range(len(PARAS)))
+    assert digest.query_terms("Customers, customer; activities") == ("activity", "customer")
+
+
+def test_pack_returns_everything_when_it_fits():
+    d = _digest()
+    snippet, used = digest.pack([("acra", d)], (), 10_000)
+    assert used == ["acra"]
+    assert snippet == "\n\n--- [evidence:acra] ---\n" + "\n\n".join(PARAS)
+    assert digest.pack([("acra", d)], (), 0) == ("", [])
+    assert digest.pack([("none", None), ("empty", _digest([]))], (), 1000) == ("", [])
+
+
+def test_pack_fills_budget_with_best_chunks_in_document_order():
+    d = _digest()
+    terms = digest.query_terms("automation calibration revenue")
+    header = len("\n\n--- [evidence:acra] ---\n")
+    budget = header + len(PARAS[1]) + len(PARAS[3]) + len(PARAS[4]) + 2 * len("\n[...]\n")
+    snippet, used = digest.pack([("acra", d)], terms, budget)
+    assert used == ["acra"] and len(snippet) <= budget
+    # chosen by score, reassembled in document order; adjacent chunks joined,
+    # skipped text marked
+    assert snippet == ("\n\n--- [evidence:acra] ---\n" + PARAS[1] + "\n[...]\n" + PARAS[3]
+                       + "\n\n" + PARAS[4])
+    assert PARAS[0] not in snippet and PARAS[2] not in snippet
+
+
+def test_pack_gives_every_label_its_best_chunk_first():
+    company, project = _digest(PARAS[:3]), _digest(PARAS[3:])
+    terms = digest.query_terms("automation calibration")
+    budget = 2 * len("\n\n--- [evidence:company] ---\n") + len(PARAS[0]) + len(PARAS[3]) + 10
+    snippet, used = digest.pack([("company", company), ("project", project)], terms, budget)
+    assert used == ["company", "project"]  # label order kept
+    assert snippet.index("[evidence:company]") < snippet.index("[evidence:project]")
+    assert PARAS[0] in snippet and (PARAS[3] in snippet or PARAS[4] in snippet)
+
+
+def test_pack_cuts_the_first_chunk_when_nothing_fits():
+    d = _digest()
+    snippet, used = digest.pack([("acra", d), ("other", d)], digest.query_terms("revenue"), 40)
+    assert used == ["acra"] and len(snippet) == 40
+    assert snippet == ("\n\n--- [evidence:acra] ---\n" + PARAS[1])[:40]
+
+
+def test_stored_digest_is_rebuilt_when_the_text_changes():
+    fake_azure.set_dummy_env()
+    from app.services import evidence, storage
+    fakes = fake_azure.install()
+    fakes.blobs["evidence"] = {}
+    storage.put_text("evidence", evidence.text_name("s1", "acra"), "Incorporated in 2019.")
+    evidence.save("s1", "acra", digest.build("Incorporated in 2019."))
+
+    async def get():
+        evidence._clear()
+        return await evidence.get("s1", "acra")
+
+    d, source = asyncio.run(get())
+    assert source == "blob" and d.text == "Incorporated in 2019."
+    # rewritten without going through uploads: the stored digest is stale
+    storage.put_text("evidence", evidence.text_name("s1", "acra"), "Incorporated in 2020.")
+    d, source = asyncio.run(get())
+    assert source == "built" and d.text == "Incorporated in 2020."
+    d, source = asyncio.run(get())
+    assert source == "blob" and d.text == "Incorporated in 2020."
+    fakes.blobs["evidence"].pop(evidence.text_name("s1", "acra"))
+    assert asyncio.run(get()) == (None, "missing")
+
+
+if __name__ == "__main__":
+    test_chunks_follow_paragraphs_and_split_long_ones()
+    test_rank_scores_matching_chunks_first_in_document_order()
+    test_pack_returns_everything_when_it_fits()
+    test_pack_fills_budget_with_best_chunks_in_document_order()
+    test_pack_gives_every_label_its_best_chunk_first()
+    test_pack_cuts_the_first_chunk_when_nothing_fits()
+    test_stored_digest_is_rebuilt_when_the_text_changes()
+    print("OK ✓  digest chunking, ranking and packing.")
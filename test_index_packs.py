@@ -0,0 +1,146 @@
+# Run: python -m pytest -q test_index_packs.py   (or: python test_index_packs.py)
+# Incremental indexer (tools/index_packs.py) against the local fake Search REST
+# server (tools/fake_search.py): only changed docs are sent, orphans in scope are
+# deleted, partial failures are retried, batches overlap. Payload files are read
+# lazily in both formats (JSON Lines and the compat JSON array). The payload
+# builder and load_prompt_packs.py produce the same docs via app/services/pack_loader.
+
+import json, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "tools"))
+import build_index_payload, fake_search, index_packs
+from app.services import pack_loader, vault_index
+
+
+def _docs(n, *, pack="EDG", version="1.0.1", status="approved", updated_at="2026-01-01T00:00:00Z"):
+    return [{
+        "id": f"{pack}={version.replace('.', '_')}=s{i}={status}",
+        "pack_id": pack, "version": version, "status": status, "section_id": f"s{i}",
+        "retrieval_tags": ["edg", f"s{i}"],
+        "template_text": f"## Situation\nSection {i} [source:acra_bizfile]",
+        "metadata_json": json.dumps({"pack_id": pack, "section_id": f"s{i}", "updated_at": updated_at}),
+    } for i in range(n)]
+
+
+def _sync(srv, docs, **kw):
+    kw.setdefault("batch", 50)
+    return index_packs.sync(lambda: docs, endpoint=srv.endpoint, index=srv.index, key=fake_search.API_KEY, **kw)
+
+
+def test_only_changed_docs_are_sent_and_orphans_deleted():
+    srv = fake_search.FakeSearch().start()
+    try:
+        other = _docs(3, pack="PSG", version="1.0.0")
+        _sync(srv, other)
+        docs = _docs(1200)
+        r = _sync(srv, docs, parallel=4)
+        assert len(r["new"]) == 1200 and r["uploaded"] == 1200 and not r["failed"]
+        assert srv.peak_in_flight > 1
+        assert all(d.get("content_hash") for d in srv.docs.values())
+
+        # rebuilt payload (new updated_at) with nothing else changed: no writes
+        writes = srv.requests["index"]
+        r = _sync(srv, _docs(1200, updated_at="2026-02-02T00:00:00Z"))
+        assert r["unchanged"] == 1200 and r["uploaded"] == 0 and srv.requests["index"] == writes
+
+        docs = _docs(1198)
+        docs[5]["template_text"] += " edited"
+        docs[7]["retrieval_tags"].append("new_tag")
+        r = _sync(srv, docs)
+        assert r["changed"] == sorted([docs[5]["id"], docs[7]["id"]]) and r["uploaded"] == 2
+        assert r["orphans"] == sorted(d["id"] for d in _docs(1200)[1198:]) and r["deleted"] == 2
+        assert len(srv.docs) == 1198 + len(other)  # other pack untouched
+    finally:
+        srv.stop()
+
+
+def test_partial_failures_and_throttling_are_retried():
+    srv = fake_search.FakeSearch().start()
+    backoff, index_packs._backoff = index_packs._backoff, lambda attempt, retry_after=None: 0.0
+    try:
+        docs = _docs(120)
+        srv.fail_keys = {docs[3]["id"]: 2, docs[70]["id"]: 1}
+        srv.throttle_next = 1
+        r = _sync(srv, docs)
+        assert not r["failed"] and r["uploaded"] == 120 and len(srv.docs) == 120
+
+        srv.fail_keys = {docs[0]["id"]: 99}
+        docs[0]["template_text"] += " v2"
+        r = _sync(srv, docs, retries=2)
+        assert [f["key"] for f in r["failed"]] == [docs[0]["id"]] and r["uploaded"] == 0
+    finally:
+        index_packs._backoff = backoff
+        srv.stop()
+
+
+def test_dry_run_and_index_without_hash_field():
+    srv = fake_search.FakeSearch(fields=fake_search.schema_fields(with_hash=False)).start()
+    try:
+        docs = _docs(10)
+        _sync(srv, docs)
+        assert "content_hash" not in next(iter(srv.docs.values()))
+        docs[2]["metadata_json"] = json.dumps({"pack_id": "EDG", "section_id": "s2", "rubric": {"x": 1}})
+        writes = srv.requests["index"]
+        r = _sync(srv, docs[:9], dry_run=True)
+        assert r["changed"] == [docs[2]["id"]] and r["orphans"] == [docs[9]["id"]] and r["unchanged"] == 8
+        assert srv.requests["index"] == writes and len(srv.docs) == 10
+    finally:
+        srv.stop()
+
+
+def test_payload_reader_streams_jsonl_and_json_array(tmp_path):
+    docs = _docs(40)
+    (tmp_path / "d.jsonl").write_text("".join(json.dumps(d) + "\n" for d in docs), encoding="utf-8")
+    (tmp_path / "d.json").write_text(json.dumps(docs, indent=2), encoding="utf-8")
+    (tmp_path / "e.json").write_text("[]\n", encoding="utf-8")
+    for name in ("d.jsonl", "d.json"):
+        for chunk in (16, 300, 1 << 16):  # docs straddling read boundaries
+            assert list(index_packs.iter_docs(str(tmp_path / name), chunk)) == docs
+    assert list(index_packs.iter_docs(str(tmp_path / "e.json"))) == []
+
+
+def test_payload_docs_match_shared_loader_docs():
+    vault = Path(__file__).resolve().parent / "app" / "vault"
+    built = {d["id"]: d for d in build_index_payload.build_docs(vault, "approved", None)}
+    loaded = {d["id"]: d for p in pack_loader.iter_packs(vault) for t in p.templates.values()
+              for d in [pack_loader.index_doc(t)] if d["status"] == "approved"}
+    assert built and built.keys() == loaded.keys()
+    assert all(index_packs.content_hash(built[k]) == index_packs.content_hash(loaded[k]) for k in built)
+    # variants keep their own section_id and template file; draft variants stay out
+    assert built["EDG=1_0_1=about_project__core=approved"]["section_id"] == "about_project"
+    assert not any("MISSING TEMPLATE" in d["template_text"] for d in built.values())
+    assert "EDG=1_0_1=business_case__manufacturing=approved" not in built
+    assert pack_loader.doc_id("edg", "1.0.1", "a.b", "Draft") != pack_loader.doc_id("edg", "1.0.1", "a_b", "draft")
+    parses = pack_loader.stats()["parses"]
+    list(pack_loader.iter_packs(vault))
+    assert pack_loader.stats()["parses"] == parses  # memoised
+
+
+def test_local_vault_loads_payload_artifacts_in_both_formats(tmp_path):
+    vault = Path(__file__).resolve().parent / "app" / "vault"
+    from_dir = vault_index.load(str(vault))
+    for name, fmt in (("docs.jsonl", "jsonl"), ("docs.json", "json")):
+        with open(tmp_path / name, "w", encoding="utf-8") as f:
+            docs = list(build_index_payload.build_docs(vault, "approved", None))
+            # an approved doc without a pack is skipped, like one without a section
+            docs.append({**docs[0], "pack_id": None, "metadata_json": json.dumps({"section_id": "orphan"})})
+            build_index_payload.write_docs(docs, f, fmt)
+        idx = vault_index.load(str(tmp_path / name))
+        assert len(idx) == len(from_dir) > 0
+        for pack, ver, sec, variant in (("EDG", "1.0.1", "about_project", None),
+                                        ("EDG", "1.0.1", "about_project", "about_project.core")):
+            assert idx.lookup(pack, ver, sec, variant)["template"] == from_dir.lookup(pack, ver, sec, variant)["template"]
+
+
+if __name__ == "__main__":
+    test_only_changed_docs_are_sent_and_orphans_deleted()
+    test_partial_failures_and_throttling_are_retried()
+    test_dry_run_and_index_without_hash_field()
+    test_payload_docs_match_shared_loader_docs()
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        test_payload_reader_streams_jsonl_and_json_array(Path(d))
+    with tempfile.TemporaryDirectory() as d:
+        test_local_vault_loads_payload_artifacts_in_both_formats(Path(d))
+    print("OK ✓  incremental indexer against fake Search.")
@@ -0,0 +1,56 @@
+# Run: python -m pytest -q test_offline_eval.py   (or: python test_offline_eval.py)
+# Golden runs of tools/offline_eval.py: every golden renders through the composer
+# against the local vault and the deterministic fake backend meets its thresholds;
+# replayed responses are scored the same way, and bad drafts fail for the right reasons.
+
+import json, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "tools"))
+import offline_eval
+
+VAULT = ROOT / "app" / "vault"
+GOLDENS = offline_eval.load_goldens(str(VAULT / "**" / "golden" / "*.jsonl"))
+SCORING = {"min_citation": 0.5, "length_tolerance": 0.10}
+
+
+def _run(backend="fake", options=None, jobs=1, goldens=GOLDENS):
+    return offline_eval.run_goldens(goldens, vault=VAULT, backend=backend, options=options or {},
+                                    fixtures=None, scoring=SCORING, jobs=jobs)
+
+
+def test_fake_backend_passes_every_golden():
+    assert GOLDENS and any(g.get("variant") for g in GOLDENS)
+    runs = _run()
+    assert [r["reasons"] for r in runs if not r["ok"]] == []
+    for g, r in zip(GOLDENS, runs):
+        assert r["id"] == g["id"] and r["scores"]["structure_coverage"] == 1.0
+        assert set(r["scores"]["cited_labels"]) <= set(g["evidence_labels"])
+        assert r["timing_ms"]["total"] >= r["timing_ms"]["render"]
+    assert [r["output"] for r in _run()] == [r["output"] for r in runs]  # deterministic
+    sections = offline_eval.section_report(runs)
+    assert sections["PSG:business_impact"]["runs"] == 3 and "EDG:about_project.core" in sections
+
+
+def test_replayed_responses_are_scored(tmp_path):
+    goldens = [g for g in GOLDENS if g["id"] in ("edg-ac-001", "psg-cb-001", "psg-sd-001")]
+    outputs = {
+        "edg-ac-001": "## Year of Incorporation\n2019 [source:acra_bizfile]\n\n## Key Activities\nConsulting [source:acra_bizfile]\n",
+        "psg-cb-001": "## Problem\nCosts are high.\n\n## Solve\nBuy it [source:invented_label]\n",
+    }
+    replay = tmp_path / "responses.jsonl"
+    replay.write_text("".join(json.dumps({"id": k, "output": v}) + "\n" for k, v in outputs.items()), encoding="utf-8")
+    runs = {r["id"]: r for r in _run("replay", {"replay": str(replay)}, jobs=2, goldens=goldens)}
+    assert runs["edg-ac-001"]["ok"]
+    reasons = " | ".join(runs["psg-cb-001"]["reasons"])
+    assert "['Agitate']" in reasons and "citation coverage 0.50 < 0.70" in reasons and "invented_label" in reasons
+    assert not runs["psg-sd-001"]["ok"] and "no recorded response" in runs["psg-sd-001"]["reasons"][0]
+
+
+if __name__ == "__main__":
+    test_fake_backend_passes_every_golden()
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        test_replayed_responses_are_scored(Path(d))
+    print(f"OK ✓  {len(GOLDENS)} goldens through the composer and fake backend.")
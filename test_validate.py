@@ -1,20 +1,8 @@
 # Run: python test_validate.py
 # Note: Requires environment variables to be set (STORAGE_ACCOUNT_NAME, etc.)
 
-import os
-import sys
-
-# Set minimal dummy env vars if not present (for import to work)
-# These will be overridden by actual env vars if they exist
-if "STORAGE_ACCOUNT_NAME" not in os.environ:
-    print("Warning: Environment variables not set. Setting minimal values for import...")
-    os.environ.setdefault("STORAGE_ACCOUNT_NAME", "dummy")
-    os.environ.setdefault("STORAGE_CONTAINER_UPLOADS", "dummy")
-    os.environ.setdefault("STORAGE_CONTAINER_EVIDENCE", "dummy")
-    os.environ.setdefault("STORAGE_CONTAINER_OUTPUTS", "dummy")
-    os.environ.setdefault("STORAGE_CONTAINER_TRACES", "dummy")
-    os.environ.setdefault("STORAGE_TABLE_SESSIONS", "dummy")
-    print("Note: Actual storage calls will fail. Ensure proper environment is configured.\n")
+# Importing app.main needs no env (Azure clients are built on first use);
+# the calls below go to the real services configured in the environment.
 
 from app.main import app
 from fastapi.testclient import TestClient
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+bench_aoai_pool.py
+- Benchmarks app.services.aoai.chat_completion against a local mock AOAI server.
+- Compares the old "fresh httpx.AsyncClient per draft" behaviour with the pooled client.
+- Reports p50/p95 latency and TCP connections opened per request.
+
+No Azure access needed: Key Vault / App Config lookups are replaced with fixed values.
+
+Usage:
+  python tools/bench_aoai_pool.py [--requests 200] [--concurrency 8] [--latency-ms 50] [--handshake-ms 40]
+"""
+from __future__ import annotations
+import argparse, asyncio, os, statistics, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+import httpx
+from mock_aoai import MockAOAI
+from app.services import aoai
+
+MESSAGES = [
+    {"role": "system", "content": "You are a grant consultant."},
+    {"role": "user", "content": "Draft the About the Company section. " * 40},
+]
+
+HEADERS = {"api-key": "bench", "Content-Type": "application/json"}
+
+async def _headers():
+    return HEADERS
+
+async def _deployment(use: str) -> str:
+    return "bench-worker"
+
+def _patch_config():
+    aoai._headers = _headers
+    aoai._deployment = _deployment
+    aoai.get = lambda key, default=None: default
+    aoai.get_bool = lambda key, default=False: default
+
+async def _fresh_client_call(url: str):
+    # Pre-pooling behaviour: one client (and connection) per draft
+    async with httpx.AsyncClient(timeout=60) as client:
+        r = await client.post(url, headers=HEADERS, json={"messages": MESSAGES})
+    r.raise_for_status()
+    return r.json()["choices"][0]["message"]["content"]
+
+async def _run(mode: str, mock: MockAOAI, n: int, concurrency: int) -> dict:
+    url = f"{mock.endpoint}/openai/deployments/bench-worker/chat/completions?api-version=2024-02-15-preview"
+    sem = asyncio.Semaphore(concurrency)
+    lat: list[float] = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            if mode == "fresh":
+                await _fresh_client_call(url)
+            else:
+                await aoai.chat_completion(MESSAGES)
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    mock.reset_counters()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "mode": mode,
+        "requests": mock.requests,
+        "connections": mock.connections,
+        "conn_per_req": mock.connections / max(1, mock.requests),
+        "p50_ms": statistics.median(lat),
+        "p95_ms": lat[int(len(lat) * 0.95) - 1],
+        "rps": n / wall,
+    }
+
+async def _main(args) -> int:
+    _patch_config()
+    mock = await MockAOAI(latency_ms=args.latency_ms, handshake_ms=args.handshake_ms).start()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = mock.endpoint
+    try:
+        rows = [await _run("fresh", mock, args.requests, args.concurrency)]
+        rows.append(await _run("pooled", mock, args.requests, args.concurrency))
+    finally:
+        await aoai.aclose()
+        await mock.stop()
+
+    print(f"{'mode':8} {'reqs':>6} {'conns':>6} {'conn/req':>9} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}")
+    for r in rows:
+        print(f"{r['mode']:8} {r['requests']:>6} {r['connections']:>6} {r['conn_per_req']:>9.3f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['rps']:>8.1f}")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="mock model latency per request")
+    ap.add_argument("--handshake-ms", type=float, default=40.0, help="mock TCP+TLS setup cost per new connection")
+    args = ap.parse_args()
+    return asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
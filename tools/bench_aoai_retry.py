@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+bench_aoai_retry.py
+- Load test for the AOAI scheduler (token bucket + 429/5xx retry) in app.services.aoai.
+- Drives chat_completion against tools/mock_aoai.py configured to throttle like AOAI:
+  a requests-per-second window plus a random share of 429s.
+- Compares three settings:
+    * no-retry  : AOAI.MAX_RETRIES=0 (old behaviour: every 429 is a failed draft)
+    * reactive  : retries with jittered back-off, bucket paced only by retry-after/ratelimit headers
+    * paced     : as reactive, plus AOAI.RATE_RPS set to the mock's limit
+
+No Azure access needed: Key Vault / App Config lookups are replaced with fixed values.
+
+Usage:
+  python tools/bench_aoai_retry.py [--requests 120] [--concurrency 30] [--limit-rps 20] [--throttle-rate 0.05]
+"""
+from __future__ import annotations
+import argparse, asyncio, os, statistics, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+from mock_aoai import MockAOAI
+from app.services import aoai
+
+MESSAGES = [{"role": "user", "content": "Draft the About the Company section."}]
+CONFIG: dict = {}
+
+async def _headers():
+    return {"api-key": "bench", "Content-Type": "application/json"}
+
+async def _deployment(use: str) -> str:
+    return "bench-worker"
+
+def _patch_config():
+    aoai._headers = _headers
+    aoai._deployment = _deployment
+    aoai.get = lambda key, default=None: CONFIG.get(key, default)
+
+    async def aget(key, default=None):
+        return CONFIG.get(key, default)
+    aoai.aget = aget
+    aoai.get_bool = lambda key, default=False: default
+
+async def _run(mode: str, settings: dict, mock: MockAOAI, n: int, concurrency: int) -> dict:
+    CONFIG.clear()
+    CONFIG.update(settings)
+    aoai._buckets.clear()
+    for k in aoai._stats:
+        aoai._stats[k] = 0
+    sem = asyncio.Semaphore(concurrency)
+    lat: list[float] = []
+    failed = 0
+
+    async def one():
+        nonlocal failed
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await aoai.chat_completion(MESSAGES)
+            except RuntimeError:
+                failed += 1
+                return
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    await asyncio.sleep(1.0)  # let the mock's rate window drain between modes
+    mock.reset_counters()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "mode": mode, "ok": len(lat), "failed": failed, "sent": mock.requests, "429s": mock.throttled,
+        "retries": aoai._stats["retries"], "wall_s": wall,
+        "p50_ms": statistics.median(lat) if lat else 0.0,
+        "p95_ms": lat[max(0, int(len(lat) * 0.95) - 1)] if lat else 0.0,
+    }
+
+async def _main(args) -> int:
+    _patch_config()
+    mock = await MockAOAI(latency_ms=args.latency_ms, limit_rps=args.limit_rps,
+                          throttle_rate=args.throttle_rate, retry_after_ms=args.retry_after_ms).start()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = mock.endpoint
+    modes = [
+        ("no-retry", {"AOAI.MAX_RETRIES": "0"}),
+        ("reactive", {"AOAI.MAX_RETRIES": str(args.retries)}),
+        ("paced", {"AOAI.MAX_RETRIES": str(args.retries), "AOAI.RATE_RPS": str(args.limit_rps),
+                   "AOAI.BURST": str(max(1, int(args.limit_rps)))}),
+    ]
+    rows = []
+    try:
+        for mode, settings in modes:
+            rows.append(await _run(mode, settings, mock, args.requests, args.concurrency))
+    finally:
+        await aoai.aclose()
+        await mock.stop()
+
+    print(f"{'mode':9} {'ok':>5} {'failed':>6} {'sent':>6} {'429s':>6} {'retries':>7} {'wall s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in rows:
+        print(f"{r['mode']:9} {r['ok']:>5} {r['failed']:>6} {r['sent']:>6} {r['429s']:>6} {r['retries']:>7} "
+              f"{r['wall_s']:>7.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=120)
+    ap.add_argument("--concurrency", type=int, default=30)
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="mock model latency per request")
+    ap.add_argument("--limit-rps", type=float, default=20.0, help="mock accepts this many requests per second")
+    ap.add_argument("--throttle-rate", type=float, default=0.05, help="extra random share of 429s")
+    ap.add_argument("--retry-after-ms", type=float, default=200.0, help="retry-after-ms on random 429s")
+    ap.add_argument("--retries", type=int, default=6)
+    args = ap.parse_args()
+    return asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+bench_composer.py
+- Micro-benchmark of template rendering over the real EDG/PSG templates in app/vault.
+- Compares the legacy renderer (_kv_replace + _render_label_blocks regex passes)
+  with the precompiled op-list renderer used by compose_instruction.
+- Also checks both produce identical output for every template.
+
+Usage:
+  python tools/bench_composer.py [--iterations 2000] [--evidence-chars 6000]
+"""
+from __future__ import annotations
+import argparse, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.services import composer
+
+LABELS = {"registry": "acra_bizfile", "financials": "audited_financials",
+          "vendor_quote": "vendor_quotation", "costs": "cost_breakdown"}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vault", default=str(ROOT / "app" / "vault"))
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--evidence-chars", type=int, default=6000)
+    args = ap.parse_args()
+
+    evidence = ("\n\n--- [evidence:acra_bizfile] ---\n" + "UEN 201912345Z incorporated 2019. " * 400)[: args.evidence_chars]
+    kv = {"framework": "SCQA", "style": "Formal, outcome-oriented", "length_limit": "350",
+          "evidence_window": evidence, "user_prompt": "Emphasise export growth"}
+
+    templates = sorted(Path(args.vault).glob("*/templates/*.md"))
+    if not templates:
+        print(f"ERR: no templates under {args.vault}", file=sys.stderr)
+        return 2
+
+    print(f"{'template':50} {'legacy us':>10} {'compiled us':>12} {'speedup':>8}")
+    tot_legacy = tot_compiled = 0.0
+    for path in templates:
+        tpl = path.read_text(encoding="utf-8")
+        ops = composer.compile_template(tpl)
+        if composer.render_compiled(ops, kv, LABELS) != composer._render_legacy(tpl, kv, LABELS):
+            print(f"ERR: output mismatch for {path}", file=sys.stderr)
+            return 1
+
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            composer._render_legacy(tpl, kv, LABELS)
+        legacy = (time.perf_counter() - t0) / args.iterations * 1e6
+
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            composer.render_compiled(ops, kv, LABELS)
+        compiled = (time.perf_counter() - t0) / args.iterations * 1e6
+
+        tot_legacy += legacy
+        tot_compiled += compiled
+        name = f"{path.parent.parent.name}/{path.name}"
+        print(f"{name:50} {legacy:>10.1f} {compiled:>12.1f} {legacy / compiled:>7.1f}x")
+
+    print(f"{'TOTAL':50} {tot_legacy:>10.1f} {tot_compiled:>12.1f} {tot_legacy / tot_compiled:>7.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
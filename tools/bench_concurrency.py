@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+bench_concurrency.py
+- Fires N concurrent /v1/draft requests at the real FastAPI app (in-process, via ASGI).
+- Azure SDK clients are replaced with blocking in-memory fakes (tools/fake_azure.py);
+  AOAI is the local mock server (tools/mock_aoai.py).
+- Compares two modes:
+    * inline : SDK calls run directly on the event loop (pre-async behaviour)
+    * pool   : SDK calls run on app.services.blocking's bounded I/O pool
+
+Usage:
+  python tools/bench_concurrency.py [--drafts 50] [--blob-ms 30] [--table-ms 20] [--aoai-ms 200]
+"""
+from __future__ import annotations
+import argparse, asyncio, os, statistics, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+import fake_azure
+fake_azure.set_dummy_env()
+
+import httpx
+from mock_aoai import MockAOAI
+from app import main as api
+from app.services import aoai, blocking
+
+_pool_run = blocking.run
+
+async def _inline_run(fn, *args, **kwargs):
+    # What the handlers did before: call the sync SDK straight from the coroutine
+    return fn(*args, **kwargs)
+
+def _seed(fakes, n: int) -> list[str]:
+    sids = []
+    for i in range(n):
+        sid = f"s_bench{i:03d}"
+        fakes.table.rows[("session", sid)] = {"PartitionKey": "session", "RowKey": sid, "grant": "EDG"}
+        ev = fakes.blobs.setdefault("evidence", {})
+        ev[f"{sid}_acra_bizfile.txt"] = ("UEN 201912345Z incorporated 2019. " * 80).encode("utf-8")
+        ev[f"{sid}_audited_financials.txt"] = ("Revenue FY2023 SGD 4.2m. " * 120).encode("utf-8")
+        sids.append(sid)
+    return sids
+
+async def _run(mode: str, client: httpx.AsyncClient, sids: list[str]) -> dict:
+    blocking.run = _pool_run if mode == "pool" else _inline_run
+    lat: list[float] = []
+
+    async def one(sid: str):
+        t0 = time.perf_counter()
+        r = await client.post("/v1/draft", json={"session_id": sid, "section_id": "about_company"})
+        r.raise_for_status()
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    # warm caches (App Config / Key Vault / template) so both modes measure the steady state
+    await one(sids[0])
+    lat.clear()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(s) for s in sids))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {"mode": mode, "drafts": len(sids), "wall_s": wall, "rps": len(sids) / wall,
+            "p50_ms": statistics.median(lat), "max_ms": lat[-1]}
+
+async def _main(args) -> int:
+    fakes = fake_azure.install(blob_ms=args.blob_ms, table_ms=args.table_ms, search_ms=args.search_ms)
+    sids = _seed(fakes, args.drafts)
+    mock = await MockAOAI(latency_ms=args.aoai_ms).start()
+    os.environ["AZURE_OPENAI_ENDPOINT"] = mock.endpoint
+
+    rows = []
+    transport = httpx.ASGITransport(app=api.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for mode in ("inline", "pool"):
+                rows.append(await _run(mode, client, sids))
+    finally:
+        blocking.run = _pool_run
+        await aoai.aclose()
+        blocking.shutdown()
+        await mock.stop()
+
+    print(f"{'mode':7} {'drafts':>6} {'wall s':>8} {'drafts/s':>9} {'p50 ms':>8} {'max ms':>8}")
+    for r in rows:
+        print(f"{r['mode']:7} {r['drafts']:>6} {r['wall_s']:>8.2f} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--drafts", type=int, default=50, help="concurrent drafts")
+    ap.add_argument("--blob-ms", type=float, default=30.0)
+    ap.add_argument("--table-ms", type=float, default=20.0)
+    ap.add_argument("--search-ms", type=float, default=40.0)
+    ap.add_argument("--aoai-ms", type=float, default=200.0)
+    args = ap.parse_args()
+    return asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
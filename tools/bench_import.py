@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+bench_import.py
+- Cold-start cost of `import app.main`, measured with `python -X importtime` in fresh
+  interpreters (median of --runs).
+- Prints the total plus the heaviest top-level packages and app.* modules by cumulative time.
+- With --history, appends one JSON line per run (timestamp, git commit, totals) so the
+  number can be tracked over time, e.g. from CI.
+
+Usage:
+  python tools/bench_import.py [--runs 5] [--top 12] [--module app.main] [--history artifacts/importtime.jsonl]
+"""
+from __future__ import annotations
+import argparse, json, os, statistics, subprocess, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def _importtime(module: str) -> dict[str, tuple[int, int]]:
+    """One fresh interpreter; returns module -> (self_us, cumulative_us)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True, env=dict(os.environ))
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    out: dict[str, tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        out[name.strip()] = (int(self_us), int(cum_us))
+    return out
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", default="app.main")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=12)
+    ap.add_argument("--history", help="append a JSON line with the result to this file")
+    args = ap.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        try:
+            runs.append(_importtime(args.module))
+        except RuntimeError as e:
+            print(f"ERR: {e}", file=sys.stderr)
+            return 1
+
+    # median cumulative time per module over runs (nested names keep their indentation-free form)
+    names = set().union(*runs)
+    cum = {n: statistics.median(r.get(n, (0, 0))[1] for r in runs) for n in names}
+    total_ms = cum.get(args.module, 0) / 1000
+
+    top_level = {n: v for n, v in cum.items() if "." not in n and n != args.module}
+    app_mods = {n: v for n, v in cum.items() if n.startswith("app.") and n != args.module}
+
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs} cold runs)\n")
+    for title, rows in (("top-level packages", top_level), ("app modules", app_mods)):
+        print(f"{title:40} {'cumulative ms':>14}")
+        for n, v in sorted(rows.items(), key=lambda kv: -kv[1])[: args.top]:
+            print(f"  {n:38} {v / 1000:>14.1f}")
+        print()
+
+    if args.history:
+        rec = {"ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "commit": _git_commit(),
+               "module": args.module, "runs": args.runs, "total_ms": round(total_ms, 1),
+               "top": {n: round(v / 1000, 1) for n, v in sorted(top_level.items(), key=lambda kv: -kv[1])[:5]}}
+        path = Path(args.history)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+        print(f"appended to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
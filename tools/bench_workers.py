@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+bench_workers.py
+- Throughput of the real app under gunicorn with 1 worker vs N workers (startup.sh's
+  multi-worker mode, including the shared cache server on a Unix socket).
+- Azure is faked per worker (tools/fake_app.py); AOAI is tools/mock_aoai.py in its own process.
+- The load generator runs in this process, so on small machines it competes with the
+  workers for CPU; compare runs on the same host only.
+
+Usage:
+  python tools/bench_workers.py [--workers N] [--requests 600] [--concurrency 48] [--aoai-ms 50]
+"""
+from __future__ import annotations
+import argparse, asyncio, os, socket, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_http(url: str, timeout: float = 30.0) -> None:
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+def _start(cmd: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def _stop(p: subprocess.Popen) -> None:
+    p.terminate()
+    try:
+        p.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        p.kill()
+
+async def _load(base: str, n: int, concurrency: int, sessions: int) -> dict:
+    lat: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        async def one(i: int):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/v1/draft", json={"session_id": f"s_bench{i % sessions:03d}",
+                                                         "section_id": "about_company"})
+                if r.status_code != 200:
+                    errors += 1
+                    return
+                lat.append((time.perf_counter() - t0) * 1000)
+
+        await asyncio.gather(*(one(i) for i in range(concurrency)))  # warm every worker's caches
+        lat.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        wall = time.perf_counter() - t0
+    lat.sort()
+    return {"rps": len(lat) / wall, "errors": errors,
+            "p50_ms": statistics.median(lat) if lat else 0.0,
+            "p95_ms": lat[max(0, int(len(lat) * 0.95) - 1)] if lat else 0.0}
+
+def _run(workers: int, args, aoai_endpoint: str) -> dict:
+    port = _free_port()
+    env = dict(os.environ, AZURE_OPENAI_ENDPOINT=aoai_endpoint, FAKE_SESSIONS=str(args.sessions),
+               FAKE_BLOB_MS=str(args.blob_ms), FAKE_TABLE_MS=str(args.table_ms),
+               FAKE_SEARCH_MS=str(args.search_ms), FAKE_CONFIG_MS=str(args.config_ms))
+    env.pop("SHARED_CACHE_SOCKET", None)
+    procs = []
+    try:
+        if workers > 1:
+            sock = os.path.join(tempfile.mkdtemp(prefix="smartai-"), "cache.sock")
+            env["SHARED_CACHE_SOCKET"] = sock
+            procs.append(_start([sys.executable, "-m", "app.services.cache_server", "--socket", sock], env))
+        procs.append(_start([sys.executable, "-m", "gunicorn", "--pythonpath", "tools,.", "-w", str(workers),
+                             "-k", "uvicorn.workers.UvicornWorker", "fake_app:app",
+                             "--bind", f"127.0.0.1:{port}"], env))
+        base = f"http://127.0.0.1:{port}"
+        _wait_http(f"{base}/health")
+        row = asyncio.run(_load(base, args.requests, args.concurrency, args.sessions))
+    finally:
+        for p in reversed(procs):
+            _stop(p)
+    row["workers"] = workers
+    return row
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=max(2, len(os.sched_getaffinity(0))))
+    ap.add_argument("--requests", type=int, default=600)
+    ap.add_argument("--concurrency", type=int, default=48)
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--aoai-ms", type=float, default=50.0)
+    ap.add_argument("--blob-ms", type=float, default=10.0)
+    ap.add_argument("--table-ms", type=float, default=10.0)
+    ap.add_argument("--search-ms", type=float, default=40.0)
+    ap.add_argument("--config-ms", type=float, default=20.0)
+    args = ap.parse_args()
+
+    aoai_port = _free_port()
+    mock = _start([sys.executable, "tools/mock_aoai.py", "--port", str(aoai_port),
+                   "--latency-ms", str(args.aoai_ms), "--handshake-ms", "0"], dict(os.environ))
+    rows = []
+    try:
+        time.sleep(0.5)
+        for n in (1, args.workers):
+            rows.append(_run(n, args, f"http://127.0.0.1:{aoai_port}"))
+    finally:
+        _stop(mock)
+
+    print(f"cpus available: {len(os.sched_getaffinity(0))}")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for r in rows:
+        print(f"{r['workers']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['errors']:>7}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,13 @@
 build_index_payload.py
 Purpose
 	•	Walks your repo under app/vault/**/pack.yml.
-	•	Validates + normalizes each pack.
-	•	Produces a single JSON array of documents ready for Azure Search, saved to a file (e.g., artifacts/index_docs.json).
+	•	Loads + normalizes each pack through app/services/pack_loader.py, the
+		same loader (and document ids) as the other tools and the API.
+	•	Streams the documents ready for Azure Search to a file: JSON Lines (one doc
+		per line, e.g. artifacts/index_docs.jsonl), or a JSON array for older
+		consumers (any other extension, or --format json).
+	•	Docs are produced by a generator and written as they are built, so memory
+		stays flat however many packs the vault holds.
 
 Why split it out
 	•	PR CI can run this safely (no admin keys).
@@ -12,31 +17,24 @@ Why split it out
 	•	It’s deterministic input to the next step.
 
 Usage:
-  python tools/build_index_payload.py --status candidate --out artifacts/index_docs.json [--packs "psg@1.0.0,edg@1.0.1"]
+  python tools/build_index_payload.py --status candidate --out artifacts/index_docs.jsonl [--packs "psg@1.0.0,edg@1.0.1"]
+  python tools/build_index_payload.py --status candidate --out artifacts/index_docs.json   # JSON array
 """
 from __future__ import annotations
 import argparse, json, os, sys
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Iterator
 
-def read_yaml(path: Path) -> dict:
-    import yaml
-    with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from app.services import pack_loader
 
-def discover_packs(vault_root: Path):
-    for p in vault_root.glob("*.*"):
-        y = p / "pack.yml"
-        if y.exists():
-            yield p, y
-
-def normalize_pack_id(name: str) -> str:
-    return name.split(".")[0].upper()
+class PackError(Exception):
+    pass
 
-def make_safe_doc_id(pack_id: str, version: str, section: str, status: str) -> str:
-    # Azure Search key rules: letters, digits, underscore (_), dash (-), equal sign (=)
-    safe_version = str(version).replace(".", "_")
-    return f"{pack_id}={safe_version}={section}={status}"
+def discover_packs(vault_root: Path):
+    return pack_loader.discover(vault_root)
 
 def should_include(pack_id: str, version: str, status: str, cli_status: str, packs_filter: set[str] | None):
     if cli_status and status != cli_status:
@@ -46,12 +44,59 @@ def should_include(pack_id: str, version: str, status: str, cli_status: str, pac
     key = f"{pack_id}@{version}"
     return key in packs_filter
 
+def build_docs(vault: Path, status_filter: str, packs_filter: set[str] | None) -> Iterator[dict]:
+    """Yield one index doc per template of every matching pack; raises PackError on a bad pack.
+
+    Docs come from pack_loader.index_doc, so ids and fields match what
+    load_prompt_packs.py uploads. Templates carrying their own status (e.g. a
+    draft variant inside an approved pack) are left out of other statuses' payloads.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+
+    for pack_dir, _ in discover_packs(vault):
+        pack = pack_loader.load_pack(pack_dir)
+        for note in pack.notes:
+            print(f"WARNING: {note}", file=sys.stderr)
+        if not pack.raw.get("version"):
+            raise PackError(f"{pack.manifest}: version is required")
+
+        if not should_include(pack.id, pack.version, pack.status, status_filter, packs_filter):
+            continue
+
+        if not pack.templates:
+            print(f"WARN: [PACK] {pack.manifest}: no sections found (neither 'sections' nor 'templates'); skipping", file=sys.stderr)
+            continue
+
+        for t in pack.templates.values():
+            if t.status != status_filter:
+                continue
+            # tolerate missing template but flag it in output for visibility
+            text = None if t.exists() else f"[[MISSING TEMPLATE: {t.path}]]"
+            yield pack_loader.index_doc(t, updated_at=now, text=text)
+
+def write_docs(docs: Iterator[dict], f, fmt: str) -> int:
+    """Stream docs to `f` as JSON Lines or a JSON array; returns the count."""
+    n = 0
+    if fmt == "jsonl":
+        for d in docs:
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            n += 1
+        return n
+    f.write("[")
+    for d in docs:
+        f.write(("," if n else "") + "\n  " + json.dumps(d, ensure_ascii=False))
+        n += 1
+    f.write("\n]\n" if n else "]\n")
+    return n
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--vault", default="app/vault")
     ap.add_argument("--status", choices=["candidate", "approved"], required=True)
     ap.add_argument("--packs", help='Comma-separated like "psg@1.0.0,edg@1.0.1"', default=None)
-    ap.add_argument("--out", default="artifacts/index_docs.json")
+    ap.add_argument("--out", default="artifacts/index_docs.jsonl")
+    ap.add_argument("--format", choices=["auto", "jsonl", "json"], default="auto",
+                    help="auto: JSON Lines for *.jsonl, else a JSON array (compat)")
     args = ap.parse_args()
 
     vault = Path(args.vault)
@@ -61,83 +106,27 @@ def main():
     
     out_path = Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    fmt = args.format if args.format != "auto" else ("jsonl" if out_path.suffix == ".jsonl" else "json")
 
     packs_filter = None
     if args.packs:
         packs_filter = {x.strip().upper() for x in args.packs.split(",") if x.strip()}
 
-    docs = []
-    now = datetime.now(timezone.utc).isoformat()
-
-    for pack_dir, pack_yml in discover_packs(vault):
-        pack = read_yaml(pack_yml)
-        pack_id = (pack.get("id") or normalize_pack_id(pack_dir.name)).upper()
-        version = pack.get("version")
-        if not version:
-            print(f"ERR: {pack_yml}: version is required", file=sys.stderr)
-            return 1
-        version = str(version)
-        status = str(pack.get("status")).lower()
-        labels = pack.get("labels", {})
-        
-        # --- Back-compat: derive `sections` from `templates` if missing ---
-        sections = pack.get("sections", [])
-        if not sections:
-            tmpl = pack.get("templates")
-            if isinstance(tmpl, dict) and tmpl:
-                sections = list(tmpl.keys())
-                print(f"WARNING: [PACK] {pack_yml}: deriving 'sections' from 'templates' (deprecated)", file=sys.stderr)
-        # -----------------------------------------------------------------
-
-        if not should_include(pack_id, version, status, args.status, packs_filter):
-            continue
-
-        if not sections:
-            print(f"WARN: [PACK] {pack_yml}: no sections found (neither 'sections' nor 'templates'); skipping", file=sys.stderr)
-            continue
-
-        tmpl_dir = pack_dir / "templates"
-        templates_cfg = pack.get("templates", {})
-        for section in sections:
-            md_path = tmpl_dir / f"{section}.md"
-            if not md_path.exists():
-                # tolerate missing section but flag it in output for visibility
-                body = f"[[MISSING TEMPLATE: {md_path}]]"
-            else:
-                body = md_path.read_text(encoding="utf-8")
-
-            doc_id = make_safe_doc_id(pack_id, version, section, args.status)
-            tmpl_cfg = templates_cfg.get(section, {}) if isinstance(templates_cfg, dict) else {}
-            retrieval_tags = tmpl_cfg.get("retrieval_tags", []) or []
-
-            metadata = {
-                "path": str(md_path),
-                "labels": labels,
-                "updated_at": now,
-                "pack_id": pack_id,
-                "version": version,
-                "section_id": section,
-                "template_key": section,
-            }
-
-            docs.append({
-                "id": doc_id,
-                "pack_id": pack_id,
-                "version": version,
-                "status": args.status,
-                "section_id": section,
-                "retrieval_tags": retrieval_tags,
-                "template_text": body,
-                "metadata_json": json.dumps(metadata, ensure_ascii=False),
-            })
-
-    with out_path.open("w", encoding="utf-8") as f:
-        json.dump(docs, f, ensure_ascii=False, indent=2)
-
-    if not docs:
+    # write next to the target and rename, so a failed build never leaves a half file behind
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as f:
+            n = write_docs(build_docs(vault, args.status, packs_filter), f, fmt)
+    except PackError as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"ERR: {e}", file=sys.stderr)
+        return 1
+    os.replace(tmp_path, out_path)
+
+    if not n:
         print("WARN: no docs built (check --status and --packs filters)", file=sys.stderr)
     
-    print(f"Wrote {len(docs)} docs → {out_path}")
+    print(f"Wrote {n} docs → {out_path}")
     return 0
 
 if __name__ == "__main__":
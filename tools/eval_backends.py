@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+eval_backends.py
+- Model backends for tools/offline_eval.py. A backend turns the composed chat
+  messages of one golden into a draft:
+      backend.complete(messages, *, max_tokens, golden) -> str
+- Built in:
+    * fake    deterministic local stand-in (default): writes every markdown heading
+              (and **bold** label) of the rendered template with an evidence-backed,
+              cited sentence, within the template's "Max words" cap.
+              Same prompt -> same draft.
+    * replay  recorded responses, JSON Lines of {"id": <golden id>, "output": "...",
+              "prompt_sha": optional}; a golden with no recording is an error.
+- Anything else is "package.module:Class", constructed with the same options.
+
+record() writes the drafts of a run in the replay format, so outputs captured
+once (from any backend) can be re-scored offline.
+"""
+from __future__ import annotations
+import hashlib, importlib, json, re
+from pathlib import Path
+
+# composed prompts may have their whitespace folded: headings and evidence blocks
+# are found inline, not per line
+_HEADING = re.compile(r"(?:^|\s)#{1,6}\s+")
+_EVIDENCE = re.compile(r"--- \[evidence:([A-Za-z0-9_\-]+)\] ---\s*(.+?[.!?])(?=\s|$)", re.S)
+_SOURCE = re.compile(r"\[source:([A-Za-z0-9_\-]+)\]")
+_MAX_WORDS = re.compile(r"Max words:\s*(\d+)", re.I)
+_CONNECTORS = {"of", "and", "&", "/", "for", "vs", "or"}
+_BOLD = re.compile(r"(\*\*|__)([^*_\n]{1,60}?)\1")
+
+def prompt_sha(messages: list[dict]) -> str:
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+class FakeModel:
+    name = "fake"
+
+    def __init__(self, **_):
+        pass
+
+    @staticmethod
+    def _title(segment: str) -> str:
+        # "Year of Incorporation Summarise the company's ..." -> "Year of Incorporation":
+        # the heading is the run of words before the capitalised instruction verb
+        words = segment.split()
+        for i, w in enumerate(words):
+            if i >= 2 and w[:1].islower() and w not in _CONNECTORS and words[i - 1][:1].isupper():
+                return " ".join(words[:i - 1])
+        return " ".join(words[:6])
+
+    @staticmethod
+    def _clip(line: str, n: int) -> str:
+        # keep the citation when the sentence is cut
+        words = line.split()
+        if len(words) <= n:
+            return line
+        cite = words[-1] if words[-1].startswith("[source:") else ""
+        return " ".join(words[:max(1, n - 1 if cite else n)] + ([cite] if cite else []))
+
+    def complete(self, messages: list[dict], *, max_tokens: int, golden: dict) -> str:
+        prompt = messages[-1]["content"]
+        facts = {label: " ".join(fact.split()) for label, fact in _EVIDENCE.findall(prompt)}
+        labels = list(facts)
+        m = _MAX_WORDS.search(prompt)
+        cap = int(m.group(1)) if m else max(1, max_tokens // 2)
+
+        segments = [seg for seg in _HEADING.split(prompt)[1:] if seg.strip()]
+        sections = [(self._title(seg), seg) for seg in segments] or [("Draft", prompt)]
+        per_section = max(4, cap // len(sections))
+
+        out, used = [], 0
+        for i, (title, instructions) in enumerate(sections):
+            words = len(title.split()) + 1  # "##" counts as a word too
+            if used + words + 1 > cap:
+                break
+            preferred = [x for x in _SOURCE.findall(instructions) if x in facts]
+            label = preferred[0] if preferred else (labels[i % len(labels)] if labels else None)
+            if label:
+                line = facts[label] + f" [source:{label}]"
+            else:
+                line = "Not stated in the evidence provided."
+            # bold labels the instructions ask for (**Phase** — ...) become labelled lines
+            marks = list(dict.fromkeys(m.group(2).strip() for m in _BOLD.finditer(instructions)))
+            room = max(1, (per_section - words) // max(1, len(marks)))
+            lines = [self._clip(f"**{mk}**: {line}", room) for mk in marks] or [self._clip(line, per_section - words)]
+            body = []
+            for ln in lines:
+                n = len(ln.split())
+                if used + words + n > cap:
+                    break
+                body.append(ln)
+                used += n
+            out.append("\n".join([f"## {title}"] + body))
+            used += words
+        return "\n\n".join(out) + "\n"
+
+class ReplayModel:
+    name = "replay"
+
+    def __init__(self, *, replay: str | None = None, **_):
+        if not replay:
+            raise ValueError("replay backend needs --replay <responses.jsonl>")
+        self.path = replay
+        self.responses: dict[str, dict] = {}
+        for ln in Path(replay).read_text(encoding="utf-8").splitlines():
+            if ln.strip():
+                rec = json.loads(ln)
+                self.responses[rec["id"]] = rec
+
+    def complete(self, messages: list[dict], *, max_tokens: int, golden: dict) -> str:
+        rec = self.responses.get(golden["id"])
+        if rec is None:
+            raise KeyError(f"no recorded response for golden {golden['id']} in {self.path}")
+        return rec["output"]
+
+    def stale(self, messages: list[dict], golden: dict) -> bool:
+        """True when the response was recorded against a different prompt."""
+        rec = self.responses.get(golden["id"]) or {}
+        return bool(rec.get("prompt_sha")) and rec["prompt_sha"] != prompt_sha(messages)
+
+BACKENDS = {"fake": FakeModel, "replay": ReplayModel}
+
+def load(spec: str, **options):
+    """Backend from "fake" | "replay" | "package.module:Class"."""
+    if spec in BACKENDS:
+        return BACKENDS[spec](**options)
+    if ":" not in spec:
+        raise ValueError(f"unknown backend {spec!r} (use {', '.join(BACKENDS)} or module:Class)")
+    mod, cls = spec.split(":", 1)
+    return getattr(importlib.import_module(mod), cls)(**options)
+
+def record(path: str, runs: list[dict]) -> int:
+    """Write the drafts of `runs` (offline_eval golden results) as a replay file."""
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for r in runs:
+            if r.get("output") is not None:
+                f.write(json.dumps({"id": r["id"], "output": r["output"], "prompt_sha": r["prompt_sha"]},
+                                   ensure_ascii=False) + "\n")
+                n += 1
+    return n
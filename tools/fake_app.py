@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+fake_app.py
+- The real app.main:app with every Azure client swapped for tools/fake_azure.py fakes,
+  so it can run under gunicorn/uvicorn for benchmarks (each worker installs its own fakes
+  and seeds the same sessions/evidence).
+- AOAI is whatever AZURE_OPENAI_ENDPOINT points at (normally tools/mock_aoai.py).
+
+Env:
+  FAKE_BLOB_MS / FAKE_TABLE_MS / FAKE_SEARCH_MS / FAKE_CONFIG_MS   per-call latency (default 0)
+  FAKE_SESSIONS                                                   sessions s_bench000.. to seed (default 50)
+
+Usage:
+  AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 \\
+    gunicorn --pythonpath tools,. -w 2 -k uvicorn.workers.UvicornWorker fake_app:app
+"""
+from __future__ import annotations
+import os, sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+import fake_azure
+
+def _ms(name: str) -> float:
+    return float(os.environ.get(name, "0") or 0)
+
+fakes = fake_azure.install(blob_ms=_ms("FAKE_BLOB_MS"), table_ms=_ms("FAKE_TABLE_MS"),
+                           search_ms=_ms("FAKE_SEARCH_MS"), config_ms=_ms("FAKE_CONFIG_MS"))
+
+for i in range(int(os.environ.get("FAKE_SESSIONS", "50"))):
+    sid = f"s_bench{i:03d}"
+    fakes.table.rows[("session", sid)] = {"PartitionKey": "session", "RowKey": sid, "grant": "EDG"}
+    ev = fakes.blobs.setdefault("evidence", {})
+    ev[f"{sid}_acra_bizfile.txt"] = ("UEN 201912345Z incorporated 2019. " * 80).encode("utf-8")
+    ev[f"{sid}_audited_financials.txt"] = ("Revenue FY2023 SGD 4.2m. " * 120).encode("utf-8")
+
+from app.main import app  # noqa: E402
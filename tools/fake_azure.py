@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+fake_azure.py
+- In-memory, Azurite-style stand-ins for the synchronous Azure SDK clients used by app/services:
+    * Blob containers (download/upload/list/delete, block staging, properties with a content ETag)
+    * Table (sessions)
+    * AI Search (prompt templates, served from app/vault)
+    * App Configuration and Key Vault
+- Every call sleeps for a configurable latency with time.sleep, exactly like a blocking SDK call,
+  so benchmarks can show what happens to the event loop.
+
+Usage (from a benchmark):
+  fakes = fake_azure.install(blob_ms=30, table_ms=20, search_ms=40)
+  fakes.blobs["evidence"]["s_1_acra_bizfile.txt"] = "..."
+"""
+from __future__ import annotations
+import hashlib, json, os, time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Container/table names and client factories read these; install() overrides every client.
+DUMMY_ENV = {
+    "STORAGE_ACCOUNT_NAME": "fake",
+    "STORAGE_CONTAINER_UPLOADS": "uploads",
+    "STORAGE_CONTAINER_EVIDENCE": "evidence",
+    "STORAGE_CONTAINER_OUTPUTS": "outputs",
+    "STORAGE_CONTAINER_TRACES": "traces",
+    "STORAGE_TABLE_SESSIONS": "sessions",
+    "APPCONFIG_ENDPOINT": "https://fake.azconfig.io",
+    "KEYVAULT_URI": "https://fake.vault.azure.net",
+    "AZURE_SEARCH_ENDPOINT": "https://fake.search.windows.net",
+    "AZURE_SEARCH_QUERY_KEY": "fake",
+}
+
+def set_dummy_env() -> None:
+    for k, v in DUMMY_ENV.items():
+        os.environ.setdefault(k, v)
+
+def _sleep(ms: float) -> None:
+    if ms:
+        time.sleep(ms / 1000)
+
+# --- Blob --------------------------------------------------------------------
+
+class FakeDownloader:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def readall(self) -> bytes:
+        return self._data
+
+    def content_as_text(self, encoding: str = "UTF-8") -> str:
+        return self._data.decode(encoding)
+
+class FakeBlobClient:
+    """One blob: block staging (stage_block / commit_block_list) and properties."""
+    def __init__(self, container: "FakeContainer", name: str):
+        self._container = container
+        self._name = name
+
+    def stage_block(self, block_id: str, data, **kw):
+        _sleep(self._container._ms)
+        self._container._staged.setdefault(self._name, {})[block_id] = bytes(data)
+
+    def commit_block_list(self, block_list, **kw):
+        _sleep(self._container._ms)
+        staged = self._container._staged.pop(self._name, {})
+        ids = [getattr(b, "id", b) for b in block_list]
+        self._container._store[self._name] = b"".join(staged[i] for i in ids)
+        self._container._modified[self._name] = time.time()
+
+    def get_blob_properties(self, **kw):
+        _sleep(self._container._ms)
+        data = self._container._store.get(self._name)
+        if data is None:
+            raise ResourceNotFoundError(f"blob not found: {self._name}")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        # content-derived: changes whenever the blob is rewritten with other bytes
+        return SimpleNamespace(name=self._name, size=len(data), etag=f'"{hashlib.sha1(data).hexdigest()}"')
+
+class FakeContainer:
+    def __init__(self, store: dict, latency_ms: float, staged: dict | None = None, modified: dict | None = None):
+        self._store = store
+        self._ms = latency_ms
+        self._staged = staged if staged is not None else {}
+        self._modified = modified if modified is not None else {}  # blob -> write time (epoch)
+
+    def get_blob_client(self, name: str) -> FakeBlobClient:
+        return FakeBlobClient(self, name)
+
+    def download_blob(self, name: str, offset: int | None = None, length: int | None = None, **kw):
+        _sleep(self._ms)
+        if name not in self._store:
+            raise ResourceNotFoundError(f"blob not found: {name}")
+        data = self._store[name]
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if offset is not None:
+            data = data[offset: (offset + length) if length is not None else None]
+        return FakeDownloader(data)
+
+    def upload_blob(self, name: str, data, overwrite: bool = False, **kw):
+        _sleep(self._ms)
+        if not overwrite and name in self._store:
+            raise FileExistsError(name)
+        if hasattr(data, "read"):
+            data = data.read()
+        self._store[name] = data if isinstance(data, bytes) else str(data).encode("utf-8")
+        self._modified[name] = time.time()
+
+    def delete_blob(self, name: str, **kw):
+        _sleep(self._ms)
+        if name not in self._store:
+            raise ResourceNotFoundError(f"blob not found: {name}")
+        del self._store[name]
+        self._modified.pop(name, None)
+
+    def list_blobs(self, name_starts_with: str = ""):
+        _sleep(self._ms)
+        # blobs put straight into the dict (tests, benchmarks) count as written now
+        return [SimpleNamespace(name=n, size=len(v),
+                                last_modified=datetime.fromtimestamp(self._modified.get(n, time.time()), timezone.utc))
+                for n, v in sorted(self._store.items()) if n.startswith(name_starts_with or "")]
+
+class FakeBlobService:
+    def __init__(self, latency_ms: float):
+        self.containers: dict[str, dict] = {}
+        self.staged: dict[str, dict] = {}  # container -> blob -> uncommitted blocks
+        self.modified: dict[str, dict] = {}  # container -> blob -> write time
+        self._ms = latency_ms
+
+    def get_container_client(self, container: str) -> FakeContainer:
+        return FakeContainer(self.containers.setdefault(container, {}), self._ms,
+                             self.staged.setdefault(container, {}), self.modified.setdefault(container, {}))
+
+# --- Table -------------------------------------------------------------------
+
+class FakeEntity(dict):
+    """dict + .metadata, like azure.data.tables.TableEntity."""
+    metadata: dict = {}
+
+class FakeTable:
+    def __init__(self, rows: dict, latency_ms: float):
+        self._rows = rows
+        self._etags: dict = {}
+        self._ms = latency_ms
+        self.calls = 0
+
+    def _write(self, key, row: dict) -> dict:
+        self._rows[key] = row
+        etag = f'W/"{time.monotonic_ns()}"'
+        self._etags[key] = etag
+        return {"etag": etag}
+
+    def get_entity(self, partition_key: str, row_key: str, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        key = (partition_key, row_key)
+        row = self._rows.get(key)
+        if row is None:
+            raise ResourceNotFoundError(f"entity not found: {partition_key}/{row_key}")
+        ent = FakeEntity(row)
+        ent.metadata = {"etag": self._etags.setdefault(key, 'W/"0"')}
+        return ent
+
+    def upsert_entity(self, entity: dict, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        key = (entity["PartitionKey"], entity["RowKey"])
+        row = dict(self._rows.get(key, {}))
+        row.update(entity)
+        return self._write(key, row)
+
+    def update_entity(self, entity: dict, mode=None, etag=None, match_condition=None, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        key = (entity["PartitionKey"], entity["RowKey"])
+        if key not in self._rows:
+            raise ResourceNotFoundError(f"entity not found: {key}")
+        if etag and self._etags.setdefault(key, 'W/"0"') != etag:
+            raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+        row = dict(self._rows[key])
+        row.update(entity)
+        return self._write(key, row)
+
+class FakeTableService:
+    def __init__(self, latency_ms: float):
+        self.rows: dict = {}
+        self.table = FakeTable(self.rows, latency_ms)
+
+    def get_table_client(self, table_name: str) -> FakeTable:
+        return self.table
+
+# --- Search (templates from app/vault) ---------------------------------------
+
+def _vault_docs() -> list[dict]:
+    import yaml
+    docs = []
+    for pack_yml in sorted((ROOT / "app" / "vault").glob("*/pack.yml")):
+        pack = yaml.safe_load(pack_yml.read_text(encoding="utf-8")) or {}
+        pack_id = str(pack.get("pack_id") or pack.get("id")).upper()
+        version = str(pack.get("version"))
+        for key, t in (pack.get("templates") or {}).items():
+            section = t.get("section_id", key)
+            meta = {"pack_id": pack_id, "version": version, "section_id": section, "template_key": key,
+                    "evidence_hints": t.get("evidence_hints", {})}
+            docs.append({
+                "pack_id": pack_id, "version": version, "section_id": section,
+                "status": t.get("status", pack.get("status", "approved")),
+                "template_text": (pack_yml.parent / t["file"]).read_text(encoding="utf-8"),
+                "metadata_json": json.dumps(meta),
+            })
+    return docs
+
+class FakeSearch:
+    def __init__(self, latency_ms: float):
+        self._ms = latency_ms
+        self.docs = _vault_docs()
+        self.calls = 0
+
+    def search(self, search_text: str = "*", filter: str = "", top: int = 50, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        # filter is "a eq 'x' and b eq 'y'"; enough for the app's own queries
+        conds = [c.strip().split(" eq ") for c in filter.split(" and ") if " eq " in c]
+        out = [d for d in self.docs if all(str(d.get(k.strip())) == v.strip().strip("'") for k, v in conds)]
+        return out[:top]
+
+# --- App Config / Key Vault --------------------------------------------------
+
+class FakeAppConfig:
+    def __init__(self, values: dict, latency_ms: float):
+        self.values = values
+        self._ms = latency_ms
+        self.calls = 0
+
+    def get_configuration_setting(self, key: str, label=None, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        if key not in self.values:
+            raise ResourceNotFoundError(key)
+        return SimpleNamespace(key=key, label=label, value=self.values[key], etag=str(hash(self.values[key])))
+
+    def list_configuration_settings(self, key_filter: str = "*", label_filter=None, **kw):
+        _sleep(self._ms)
+        self.calls += 1
+        return [SimpleNamespace(key=k, label=label_filter, value=v, etag=str(hash(v))) for k, v in self.values.items()]
+
+class FakeKeyVault:
+    def __init__(self, latency_ms: float):
+        self._ms = latency_ms
+
+    def get_secret(self, name: str, **kw):
+        _sleep(self._ms)
+        return SimpleNamespace(name=name, value=f"fake-{name}")
+
+# --- wiring ------------------------------------------------------------------
+
+DEFAULT_CONFIG = {
+    "MODEL.WORKER": "bench-worker",
+    "MODEL.MANAGER": "bench-manager",
+    "PROMPT_PACK_LATEST.EDG": "1.0.1",
+    "PROMPT_PACK_LATEST.PSG": "1.0.1",
+    "EVIDENCE_CHAR_CAP": "6000",
+}
+
+def install(*, blob_ms: float = 0.0, table_ms: float = 0.0, search_ms: float = 0.0,
+            config_ms: float = 0.0, secret_ms: float = 0.0, config: dict | None = None):
+    """Swap the SDK clients in app.services.* for fakes; returns a namespace with the fakes."""
+    set_dummy_env()
+    from app.services import appcfg, clients
+
+    fakes = SimpleNamespace(
+        blob=FakeBlobService(blob_ms),
+        table=FakeTableService(table_ms),
+        search=FakeSearch(search_ms),
+        appcfg=FakeAppConfig(dict(DEFAULT_CONFIG, **(config or {})), config_ms),
+        keyvault=FakeKeyVault(secret_ms),
+    )
+    fakes.blobs = fakes.blob.containers
+    clients.override("blob", fakes.blob)
+    clients.override("table", fakes.table)
+    clients.override("search", fakes.search)
+    clients.override("appconfig", fakes.appcfg)
+    clients.override("keyvault", fakes.keyvault)
+    appcfg._snapshot = None  # start from per-key reads; appcfg.start()/load_snapshot() bulk-load from the fake
+    appcfg._cache.clear()
+    return fakes
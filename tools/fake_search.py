@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+fake_search.py
+- Local stand-in for the Azure AI Search REST endpoints used by tools/index_packs.py:
+    GET  /indexes/{index}                 index definition (fields)
+    POST /indexes/{index}/docs/search     search="*" with $filter (eq / and / or), select, top, skip
+    POST /indexes/{index}/docs/index      upload / merge / mergeOrUpload / delete
+- Runs a ThreadingHTTPServer on a background thread, so concurrent batches really overlap.
+- Counts requests per endpoint and the peak number of indexing batches in flight.
+- Failure injection: `fail_keys[id] = n` answers the next n writes of that key with a
+  per-document 503 (HTTP 207); `throttle_next = n` answers the next n batches with 503.
+
+Usage (from a test):
+  srv = FakeSearch(fields=[...]).start()
+  os.environ["AZURE_SEARCH_ENDPOINT"] = srv.endpoint
+  ...
+  srv.stop()
+"""
+from __future__ import annotations
+import json, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+ROOT = Path(__file__).resolve().parents[1]
+API_KEY = "fake-admin-key"
+
+def schema_fields(with_hash: bool = True) -> list[dict]:
+    fields = json.loads((ROOT / "smartai-prompts-v2.schema.json").read_text(encoding="utf-8"))["fields"]
+    return [f for f in fields if with_hash or f["name"] != "content_hash"]
+
+_CLAUSE = re.compile(r"(\w+) eq '((?:[^']|'')*)'")
+
+def _parse_filter(flt: str | None):
+    """'(a eq 'x' and b eq 'y') or (...)' -> list of {field: value} alternatives (None = match all)."""
+    if not flt:
+        return None
+    alts = []
+    for part in re.split(r"\)\s+or\s+\(", flt.strip().strip("()")):
+        alts.append({f: v.replace("''", "'") for f, v in _CLAUSE.findall(part)})
+    return alts
+
+class FakeSearch:
+    def __init__(self, *, fields: list[dict] | None = None, index: str = "smartai-prompts-v2", latency_ms: float = 0.0):
+        self.index = index
+        self.fields = fields if fields is not None else schema_fields()
+        self.latency_ms = latency_ms
+        self.docs: dict[str, dict] = {}
+        self.fail_keys: dict[str, int] = {}
+        self.throttle_next = 0
+        self.requests = {"schema": 0, "search": 0, "index": 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeSearch":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def _send(self, code: int, obj: dict | None = None):
+                body = json.dumps(obj or {}).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self, method: str):
+                if self.headers.get("api-key") != API_KEY:
+                    return self._send(403, {"error": {"message": "bad api-key"}})
+                path = urlparse(self.path).path
+                m = re.fullmatch(r"/indexes/([^/]+)(/docs/(search|index))?", path)
+                if not m or m.group(1) != fake.index:
+                    return self._send(404, {"error": {"message": f"no index at {path}"}})
+                n = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(n) or b"{}") if n else {}
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                op = m.group(3)
+                if method == "GET" and op is None:
+                    return fake._count("schema") or self._send(200, {"name": fake.index, "fields": fake.fields})
+                if method == "POST" and op == "search":
+                    fake._count("search")
+                    return self._send(200, fake._search(payload))
+                if method == "POST" and op == "index":
+                    fake._count("index")
+                    return self._send(*fake._index(payload))
+                return self._send(405)
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.requests[name] += 1
+
+    def _search(self, payload: dict) -> dict:
+        alts = _parse_filter(payload.get("filter"))
+        select = [s.strip() for s in (payload.get("select") or "").split(",") if s.strip()]
+        with self._lock:
+            rows = [d for d in self.docs.values()
+                    if alts is None or any(all(str(d.get(f)) == v for f, v in a.items()) for a in alts)]
+        skip, top = int(payload.get("skip") or 0), int(payload.get("top") or 50)
+        out = []
+        for d in rows[skip:skip + top]:
+            row = {k: d.get(k) for k in select} if select else dict(d)
+            row["@search.score"] = 1.0
+            out.append(row)
+        return {"value": out}
+
+    def _index(self, payload: dict) -> tuple[int, dict]:
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            throttled = self.throttle_next > 0
+            if throttled:
+                self.throttle_next -= 1
+        try:
+            time.sleep(max(self.latency_ms, 5) / 1000)  # let concurrent batches overlap
+            if throttled:
+                return 503, {"error": {"message": "throttled"}}
+            names = {f["name"] for f in self.fields}
+            results, partial = [], False
+            with self._lock:
+                for a in payload.get("value", []):
+                    key = a.get("id")
+                    if self.fail_keys.get(key, 0) > 0:
+                        self.fail_keys[key] -= 1
+                        results.append({"key": key, "status": False, "statusCode": 503, "errorMessage": "injected"})
+                        partial = True
+                        continue
+                    action = a.get("@search.action", "upload")
+                    doc = {k: v for k, v in a.items() if not k.startswith("@")}
+                    unknown = set(doc) - names
+                    if unknown:
+                        return 400, {"error": {"message": f"unknown fields {sorted(unknown)}"}}
+                    if action == "delete":
+                        self.docs.pop(key, None)
+                    elif action in ("merge", "mergeOrUpload") and key in self.docs:
+                        self.docs[key].update(doc)
+                    else:
+                        self.docs[key] = doc
+                    results.append({"key": key, "status": True, "statusCode": 200})
+            return (207 if partial else 200), {"value": results}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
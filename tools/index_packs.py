@@ -1,26 +1,54 @@
 #!/usr/bin/env python3
 """
 index_packs.py
-- Upserts docs into Azure AI Search using REST API.
-- Reads a JSON array (from build_index_payload.py).
+- Syncs docs into Azure AI Search using REST API, incrementally.
+- Reads JSON Lines or a JSON array (from build_index_payload.py), lazily.
 
-	•	Read the JSON produced by build_index_payload.py.
-	•	Upsert those documents to Azure Cognitive Search.
+	•	Stream the docs produced by build_index_payload.py (never the whole file in memory).
+	•	Diff them against what the index already holds and upload only the difference.
 
 Why separate?
 	•	Needs admin key; you don’t want this in PR CI.
 	•	Keeps the “mutating the world” step inside a gated Promote workflow.
 
+How the diff works
+	•	Every doc gets a content hash: template_text + metadata_json (without the
+		volatile updated_at) + the other indexed fields.
+	•	Existing docs in the payload's scope (same pack_id / version / status) are
+		read from the index in pages. If the index has a content_hash field, only
+		id + content_hash are selected; otherwise the fields are fetched and
+		hashed locally.
+	•	New and changed docs are uploaded (mergeOrUpload); docs in scope that the
+		payload no longer contains (orphans) are deleted. Unchanged docs are skipped.
+	•	Batches are sent from a small thread pool (--parallel). Throttling / 5xx
+		responses are retried with back-off, and so are the failed keys of a
+		partial (207) response.
+
 Env:
   AZURE_SEARCH_ENDPOINT (e.g., https://<name>.search.windows.net)
   AZURE_SEARCH_INDEX    (e.g., smartai-prompts-v2)
   AZURE_SEARCH_ADMIN_KEY
 
 Usage:
-  python tools/index_packs.py --in artifacts/index_docs.json [--batch 1000]
+  python tools/index_packs.py --in artifacts/index_docs.jsonl [--batch 500] [--parallel 4]
+  python tools/index_packs.py --in artifacts/index_docs.jsonl --dry-run [--report artifacts/index_diff.json]
 """
 from __future__ import annotations
-import argparse, json, os, sys, time, urllib.request, urllib.error, urllib.parse
+import argparse, hashlib, json, os, random, sys, time, urllib.request, urllib.error, urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from app.services import pack_loader
+
+API_VERSION = "2024-07-01"
+HASH_FIELD = "content_hash"
+SCOPE_FIELDS = ("pack_id", "version", "status")
+_VOLATILE_META = ("updated_at",)         # rewritten on every build; not content
+_RETRY_STATUS = {409, 422, 429, 503}     # per-document statusCode worth retrying
+_PAGE = 1000
 
 def post_json(url: str, payload: dict, headers: dict):
     data = json.dumps(payload).encode("utf-8")
@@ -36,6 +64,9 @@ def post_json(url: str, payload: dict, headers: dict):
         print("Body:", body[:2000], file=sys.stderr)  # print the first ~2KB
         raise
 
+# the payload reader is shared with the API's local vault (vault_index.load_artifact)
+iter_docs = pack_loader.iter_payload_docs
+
 def chunked(iterable, n):
     buf = []
     for x in iterable:
@@ -46,7 +77,7 @@ def chunked(iterable, n):
     if buf: yield buf
 
 def fetch_index_schema(endpoint: str, index: str, key: str) -> set[str]:
-    url = f"{endpoint}/indexes/{urllib.parse.quote(index)}?api-version=2024-07-01"
+    url = f"{endpoint}/indexes/{urllib.parse.quote(index)}?api-version={API_VERSION}"
     req = urllib.request.Request(url, headers={"api-key": key})
     try:
         with urllib.request.urlopen(req) as resp:
@@ -60,10 +91,205 @@ def fetch_index_schema(endpoint: str, index: str, key: str) -> set[str]:
         print("Body:", body[:500], file=sys.stderr)
         raise
 
+# --- content hashes ------------------------------------------------------------
+
+def content_hash(doc: dict) -> str:
+    """Stable hash of what a search doc serves (ignores id, @-annotations and metadata updated_at)."""
+    meta = doc.get("metadata_json") or ""
+    try:
+        m = json.loads(meta)
+        if isinstance(m, dict):
+            for k in _VOLATILE_META:
+                m.pop(k, None)
+        meta = json.dumps(m, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        pass  # hash the raw string
+    rest = {k: v for k, v in doc.items()
+            if k not in ("id", "metadata_json", HASH_FIELD) and not k.startswith("@")}
+    basis = json.dumps(rest, ensure_ascii=False, sort_keys=True, separators=(",", ":")) + "\x00" + meta
+    return hashlib.sha256(basis.encode("utf-8")).hexdigest()
+
+def _odata_str(v) -> str:
+    return "'" + str(v).replace("'", "''") + "'"
+
+def scope_filter(scopes: Iterable[tuple], fields: tuple = SCOPE_FIELDS) -> str:
+    """OData filter matching any of the (field values...) scopes."""
+    return " or ".join(
+        "(" + " and ".join(f"{f} eq {_odata_str(v)}" for f, v in zip(fields, s)) + ")" for s in sorted(scopes)
+    )
+
+def fetch_existing(endpoint: str, index: str, key: str, flt: str, allowed: set[str]) -> dict[str, str]:
+    """id -> content hash of every doc matching `flt`, read in pages of _PAGE."""
+    url = f"{endpoint}/indexes/{urllib.parse.quote(index)}/docs/search?api-version={API_VERSION}"
+    headers = {"Content-Type": "application/json", "api-key": key}
+    stored = HASH_FIELD in allowed
+    select = f"id,{HASH_FIELD}" if stored else ",".join(sorted(allowed - {HASH_FIELD}))
+    out: dict[str, str] = {}
+    skip = 0
+    while True:
+        page = post_json(url, {"search": "*", "filter": flt, "select": select, "top": _PAGE, "skip": skip}, headers)
+        rows = page.get("value", [])
+        for row in rows:
+            # docs indexed before content_hash existed have it null: always "changed"
+            out[row["id"]] = (row.get(HASH_FIELD) or "") if stored else content_hash(row)
+        if len(rows) < _PAGE:
+            return out
+        skip += len(rows)
+
+# --- batches ---------------------------------------------------------------------
+
+def _backoff(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+
+def send_batch(url: str, headers: dict, actions: list[dict], retries: int = 4) -> list[dict]:
+    """
+    POST one indexing batch. Whole-request throttling/5xx/connection errors and
+    retryable per-key failures are retried; returns the keys that still failed
+    as [{key, statusCode, errorMessage}].
+    """
+    pending = actions
+    failed: list[dict] = []
+    for attempt in range(retries + 1):
+        try:
+            res = _post_quiet(url, pending, headers)
+        except urllib.error.HTTPError as e:
+            if e.code not in (429, 500, 502, 503, 504) or attempt == retries:
+                return [{"key": a["id"], "statusCode": e.code, "errorMessage": str(e)} for a in pending]
+            time.sleep(_backoff(attempt, e.headers.get("Retry-After")))
+            continue
+        except urllib.error.URLError as e:
+            if attempt == retries:
+                return [{"key": a["id"], "statusCode": 0, "errorMessage": str(e.reason)} for a in pending]
+            time.sleep(_backoff(attempt))
+            continue
+        results = {r.get("key"): r for r in res.get("value", [])}
+        retry_ids = set()
+        for a in pending:
+            r = results.get(a["id"])
+            if r is None or r.get("status"):
+                continue
+            if r.get("statusCode") in _RETRY_STATUS and attempt < retries:
+                retry_ids.add(a["id"])
+            else:
+                failed.append({"key": a["id"], "statusCode": r.get("statusCode"), "errorMessage": r.get("errorMessage")})
+        pending = [a for a in pending if a["id"] in retry_ids]
+        if not pending:
+            return failed
+        time.sleep(_backoff(attempt))
+    return failed
+
+def _post_quiet(url: str, actions: list[dict], headers: dict) -> dict:
+    # like post_json without the error dump: failures end up in the report
+    req = urllib.request.Request(url, data=json.dumps({"value": actions}).encode("utf-8"), headers=headers, method="POST")
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+def _run_batches(url: str, headers: dict, batches: Iterable[list[dict]], parallel: int, retries: int) -> list[dict]:
+    """Send batches from a pool with at most `parallel` in flight (so at most that many held); returns failures."""
+    parallel = max(1, parallel)
+    failed: list[dict] = []
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        running = set()
+        for batch in batches:
+            if len(running) >= parallel:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    failed.extend(f.result())
+            running.add(pool.submit(send_batch, url, headers, batch, retries))
+        for f in running:
+            failed.extend(f.result())
+    return failed
+
+# --- sync ------------------------------------------------------------------------
+
+def sync(docs: Callable[[], Iterable[dict]], *, endpoint: str, index: str, key: str, batch: int = 500,
+         parallel: int = 4, retries: int = 4, delete_orphans: bool = True, dry_run: bool = False,
+         scope_fields: tuple = SCOPE_FIELDS) -> dict:
+    """
+    Bring the index in line with the payload for the payload's scopes.
+    `docs` returns a fresh iterable on each call: the payload is read once to
+    plan (ids and hashes only) and once more to upload what changed.
+    Returns the diff report.
+    """
+    t0 = time.perf_counter()
+    allowed = fetch_index_schema(endpoint, index, key)
+
+    wanted: dict[str, str] = {}
+    scopes: set[tuple] = set()
+    doc_keys: set[str] = set()
+    for d in docs():
+        wanted[d["id"]] = content_hash(d)
+        scopes.add(tuple(str(d.get(f)) for f in scope_fields))
+        doc_keys.update(d.keys())
+    unknown = sorted(doc_keys - allowed - {"@search.action"})
+    if unknown:
+        print(f"WARN: unknown fields not in schema: {unknown}", file=sys.stderr)
+
+    existing = fetch_existing(endpoint, index, key, scope_filter(scopes, scope_fields), allowed) if scopes else {}
+    new = sorted(i for i in wanted if i not in existing)
+    changed = sorted(i for i in wanted if i in existing and existing[i] != wanted[i])
+    orphans = sorted(i for i in existing if i not in wanted) if delete_orphans else []
+    report = {
+        "index": index,
+        "scopes": [dict(zip(scope_fields, s)) for s in sorted(scopes)],
+        "new": new, "changed": changed, "orphans": orphans,
+        "unchanged": len(wanted) - len(new) - len(changed),
+        "dry_run": dry_run, "uploaded": 0, "deleted": 0, "failed": [],
+    }
+    if not dry_run:
+        url = f"{endpoint}/indexes/{urllib.parse.quote(index)}/docs/index?api-version={API_VERSION}"
+        headers = {"Content-Type": "application/json", "api-key": key}
+        todo = set(new) | set(changed)
+        stamp = HASH_FIELD in allowed
+
+        def actions():
+            for d in docs():
+                if d["id"] in todo:
+                    a = {"@search.action": "mergeOrUpload", **d}
+                    if stamp:
+                        a[HASH_FIELD] = wanted[d["id"]]
+                    yield a
+            for i in orphans:
+                yield {"@search.action": "delete", "id": i}
+
+        failed = _run_batches(url, headers, chunked(actions(), batch), parallel, retries)
+        bad = {f["key"] for f in failed}
+        report["uploaded"] = len(todo - bad)
+        report["deleted"] = len(set(orphans) - bad)
+        report["failed"] = failed
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+def print_report(report: dict, verbose: bool = False) -> None:
+    for i in report["new"] if verbose else []:
+        print(f"  + {i}")
+    for i in report["changed"] if verbose else []:
+        print(f"  ~ {i}")
+    for i in report["orphans"] if verbose else []:
+        print(f"  - {i}")
+    verb = "Would sync" if report["dry_run"] else "Synced"
+    print(f"{verb} {report['index']}: {len(report['new'])} new, {len(report['changed'])} changed, "
+          f"{report['unchanged']} unchanged, {len(report['orphans'])} orphaned"
+          + ("" if report["dry_run"] else
+             f" -> uploaded {report['uploaded']}, deleted {report['deleted']}, failed {len(report['failed'])}")
+          + f" ({report['seconds']}s)")
+    for f in report["failed"][:20]:
+        print(f"ERR: {f['key']}: {f.get('statusCode')} {f.get('errorMessage')}", file=sys.stderr)
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="infile", help="JSON file of docs to index")
+    ap.add_argument("--in", dest="infile", help="docs to index: JSON Lines (.jsonl) or a JSON array")
     ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--parallel", type=int, default=4, help="batches in flight at once")
+    ap.add_argument("--retries", type=int, default=4, help="retries per batch on throttling / partial failure")
+    ap.add_argument("--dry-run", action="store_true", help="print the diff against the index; change nothing")
+    ap.add_argument("--no-delete", action="store_true", help="keep docs in scope that the payload no longer has")
+    ap.add_argument("--report", help="write the diff report (JSON) here")
     ap.add_argument("--print-schema", action="store_true", help="Print Azure Search index schema and exit")
     args = ap.parse_args()
 
@@ -72,7 +298,7 @@ def main():
     key = os.environ.get("AZURE_SEARCH_ADMIN_KEY", "")
 
     if args.print_schema:
-        url = f"{endpoint}/indexes/{index}?api-version=2024-07-01"
+        url = f"{endpoint}/indexes/{index}?api-version={API_VERSION}"
         headers = {"api-key": key}
         req = urllib.request.Request(url, headers=headers, method="GET")
         try:
@@ -92,31 +318,14 @@ def main():
         print("ERR: set AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_INDEX, AZURE_SEARCH_ADMIN_KEY", file=sys.stderr)
         return 2
 
-    docs = json.loads(open(args.infile, "r", encoding="utf-8").read())
-    
-    # Schema preflight check
-    allowed = fetch_index_schema(endpoint, index, key)
-    allowed_with_action = set(allowed) | {"@search.action"}
-    doc_keys = set().union(*[set(d.keys()) for d in docs]) if docs else set()
-    unknown = sorted(doc_keys - allowed_with_action)
-    if unknown:
-        print(f"WARN: unknown fields not in schema: {unknown}", file=sys.stderr)
-    
-    url = f"{endpoint}/indexes/{index}/docs/index?api-version=2024-07-01"
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": key
-    }
-
-    total = 0
-    for batch in chunked(docs, args.batch):
-        payload = {"value": [{"@search.action": "mergeOrUpload", **d} for d in batch]}
-        _ = post_json(url, payload, headers)
-        total += len(batch)
-        time.sleep(0.05)  # gentle
-
-    print(f"Indexed {total} docs to {index}")
-    return 0
+    report = sync(lambda: iter_docs(args.infile), endpoint=endpoint, index=index, key=key, batch=args.batch,
+                  parallel=args.parallel, retries=args.retries, delete_orphans=not args.no_delete,
+                  dry_run=args.dry_run)
+    print_report(report, verbose=args.dry_run)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["failed"] else 0
 
 if __name__ == "__main__":
     sys.exit(main())
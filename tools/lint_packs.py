@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 lint_packs.py
-Validates prompt packs. This patch adds backward-compat normalization so
+Validates prompt packs. The shared loader applies backward-compat normalization so
 legacy packs using `pack_id` and `templates:` continue to work:
   - id ← pack_id
   - sections ← derived from template file paths or keys
@@ -14,108 +14,203 @@ Downstream validation/heuristics remain unchanged.
 - Enforces PAS/SCQA structure tokens.
 - Fails (exit != 0) on any error.
 
+Packs are read through app/services/pack_loader.py, shared with the other
+tools and the API, and the repo schema is compiled once per process. Packs
+are linted in a process pool once there are enough of them, and results are
+cached per pack in artifacts/lint_cache.json keyed by a hash of pack.yml, the
+templates, the schema and the linter/loader source, so unchanged packs are
+not re-linted.
+Output is the same, in the same order, whether a pack was cached or not.
+
 Usage:
-  python tools/lint_packs.py [--vault app/vault]
+  python tools/lint_packs.py [--vault app/vault] [--jobs N] [--cache PATH | --no-cache]
 """
 from __future__ import annotations
-import argparse, sys, re, json, os
+import argparse, hashlib, sys, re, json, os
 from pathlib import Path
-from typing import Dict, Any
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+from app.services import pack_loader
 
 PAS_TOKENS = ["Problem", "Agitate", "Solve"]
 SCQA_TOKENS = ["Situation", "Complication", "Question", "Answer"]
 
 REQUIRED_PACK_FIELDS = ["id", "version", "status", "sections"]
 
-# Example path patterns we expect: app/vault/EDG.v1/pack.yml
-# Capture "ver" from ".v1" or ".1.2.3"
-VERSION_FROM_DIR = re.compile(r"[\\/](?P<name>[A-Za-z0-9._-]+)\.(?P<ver>v?\d[\w.-]*)[\\/]")
-
-def infer_version_from_path(path: str) -> str:
-    """Extract version from directory name like EDG.v1 → '1' or EDG.v1.2.3 → '1.2.3'"""
-    m = VERSION_FROM_DIR.search(str(path))
-    if m and m.group("ver"):
-        # normalize "v1" or "1.2.3" -> "1" or "1.2.3"
-        ver = m.group("ver").lstrip("vV")
-        # If just a single number, default to SemVer format
-        if re.match(r'^\d+$', ver):
-            return f"{ver}.0.0"
-        return ver
-    return "1.0.0"
-
-def normalize_pack(pack: Dict[str, Any], file_path: str) -> Dict[str, Any]:
-    """
-    Back-compat shim:
-      - Prefer `id`, but fall back to `pack_id`.
-      - Prefer explicit `sections`, else derive from `templates` file paths or keys.
-      - Fill `version` from folder if missing.
-      - Default `status` to "draft" if missing.
-    Does NOT change downstream validation logic; it only ensures required keys exist.
-    """
-    norm = dict(pack) if pack else {}
-
-    # id ← pack_id (back-compat)
-    if "id" not in norm and "pack_id" in norm:
-        norm["id"] = norm["pack_id"]
-        print(f"WARNING: [PACK] {file_path}: using legacy 'pack_id' → 'id' (deprecated)", file=sys.stderr)
-
-    # sections ← templates keys (back-compat)
-    # If deriving from templates, prefer extracting from file field or use keys
-    if "sections" not in norm:
-        templates = norm.get("templates")
-        if isinstance(templates, dict) and templates:
-            # Try to extract section names from file field, fallback to keys
-            sections = []
-            for key, tmpl_data in templates.items():
-                if isinstance(tmpl_data, dict) and "file" in tmpl_data:
-                    # Extract basename from file path, e.g., "templates/about_company.md" -> "about_company"
-                    file_path_str = tmpl_data["file"]
-                    if file_path_str:  # Only proceed if file path is not empty
-                        section_name = Path(file_path_str).stem  # removes .md extension
-                        sections.append(section_name)
-                    else:
-                        # Empty file path: fallback to key name
-                        sections.append(key)
+# back-compat normalisation lives in the shared loader; re-exported for callers
+normalize_pack = pack_loader.normalize
+infer_version_from_path = pack_loader.infer_version_from_path
+find_packs = pack_loader.discover
+
+def check_tokens(md_text: str, required_tokens: list[str], file: Path, errs: list[str]):
+    for tok in required_tokens:
+        # token must appear as a header or strong marker at least once
+        pattern = rf"(^|\n)\s*(#+\s*{re.escape(tok)}\b|(\*\*|__){re.escape(tok)}(\*\*|__))"
+        if not re.search(pattern, md_text, flags=re.IGNORECASE):
+            errs.append(f"[TOKENS] {file}: missing token '{tok}'")
+
+# --- schema --------------------------------------------------------------------
+
+SCHEMA_PATH = Path("smartai-prompts-v2.schema.json")
+_validator = None  # compiled once per process (or the error compiling it)
+
+def _schema_validator():
+    """Read, check and compile the schema once; same failures as jsonschema.validate()."""
+    global _validator
+    if _validator is None:
+        try:
+            import jsonschema
+            schema = json.loads(SCHEMA_PATH.read_text(encoding="utf-8"))
+            cls = jsonschema.validators.validator_for(schema)
+            cls.check_schema(schema)
+            _validator = cls(schema)
+        except Exception as e:
+            _validator = e
+    if isinstance(_validator, Exception):
+        raise _validator
+    return _validator
+
+# --- checks ----------------------------------------------------------------------
+
+def lint_pack(pack_dir: Path, pack_yml_path: Path) -> dict:
+    """Lint one pack: {"notes": [...], "warnings": [...], "errors": [...]} (runs in a pool worker)."""
+    errors: list[str] = []
+    warnings: list[str] = []
+    parsed = pack_loader.load_pack(pack_dir)
+    pack = parsed.data
+    result = {"notes": parsed.notes, "warnings": warnings, "errors": errors}
+
+    # Basic pack.yml shape
+    for field in REQUIRED_PACK_FIELDS:
+        if field not in pack:
+            errors.append(f"[PACK] {pack_yml_path}: missing '{field}'")
+
+    pack_id = pack.get("id", pack_dir.name.split(".")[0].upper())
+    version = str(pack.get("version", ""))
+    status = pack.get("status", "").lower() if isinstance(pack.get("status", ""), str) else pack.get("status")
+    if status not in {"draft", "candidate", "approved"}:
+        errors.append(f"[PACK] {pack_yml_path}: status must be 'draft', 'candidate', or 'approved'")
+
+    # Validate version format (basic SemVer check)
+    if not version:
+        errors.append(f"[PACK] {pack_yml_path}: version is required")
+    elif not re.match(r'^\d+\.\d+\.\d+$', version):
+        warnings.append(f"[PACK] {pack_yml_path}: version '{version}' doesn't follow SemVer format (x.y.z)")
+
+    sections = pack.get("sections", [])
+    if not isinstance(sections, list) or not sections:
+        errors.append(f"[PACK] {pack_yml_path}: 'sections' must be a non-empty list")
+
+    # Check templates exist & tokens present
+    tmpl_dir = pack_dir / "templates"
+    if not tmpl_dir.exists():
+        errors.append(f"[PACK] {pack_yml_path}: templates/ folder missing")
+        return result
+
+    # Enforce section→template parity and validate rubrics
+    for sec in sections:
+        f = tmpl_dir / f"{sec}.md"
+        if not f.exists():
+            errors.append(f"[PACK] {pack_yml_path}: section '{sec}' missing template {f}")
+            continue
+
+        # Check tokens against template rubric if available
+        text = f.read_text(encoding="utf-8")
+        tmpl = parsed.template_by_stem(sec)
+        tmpl_data = tmpl.cfg if tmpl else None
+
+        if tmpl_data and "rubric" in tmpl_data:
+            rubric = tmpl_data["rubric"]
+            if isinstance(rubric, dict) and "required_tokens" in rubric:
+                required_tokens = rubric["required_tokens"]
+                check_tokens(text, required_tokens, f, errors)
+            else:
+                # No required_tokens in rubric, use filename heuristic as fallback
+                fname = f.stem.lower()
+                if any(key in fname for key in ["business_case", "impact", "solution", "proposal", "vendor"]):
+                    check_tokens(text, PAS_TOKENS, f, errors)
                 else:
-                    # Fallback to key name
-                    sections.append(key)
-            norm["sections"] = sections if sections else list(templates.keys())
+                    check_tokens(text, SCQA_TOKENS, f, errors)
         else:
-            norm.setdefault("sections", [])
-        if norm.get("sections"):
-            print(f"WARNING: [PACK] {file_path}: deriving 'sections' from 'templates' (deprecated)", file=sys.stderr)
+            # No rubric defined for this template, use filename heuristic
+            fname = f.stem.lower()
+            if any(key in fname for key in ["business_case", "impact", "solution", "proposal", "vendor"]):
+                check_tokens(text, PAS_TOKENS, f, errors)
+            else:
+                check_tokens(text, SCQA_TOKENS, f, errors)
 
-    # version
-    if "version" not in norm or not norm["version"]:
-        norm["version"] = infer_version_from_path(file_path)
+    # Optional schema check against repo schema (non-fatal if not present)
+    if SCHEMA_PATH.exists():
+        try:
+            doc = {
+                "id": f"{pack_id}@{version}",
+                "pack": pack_id,
+                "version": version,
+                "status": status,
+                "sections": sections,
+            }
+            _schema_validator().validate(doc)
+        except Exception as e:
+            warnings.append(f"[SCHEMA] {pack_yml_path}: {e}")
+    return result
 
-    # status
-    if "status" not in norm or not norm["status"]:
-        norm["status"] = "draft"
+# --- cache -------------------------------------------------------------------------
+# Results are keyed by a hash of pack.yml, every file under templates/, the
+# schema and the linter/loader source, so any edit that could change the
+# outcome re-lints the pack.
 
-    return norm
+def _file_digest(h, path: Path) -> None:
+    h.update(str(path).encode("utf-8") + b"\0")
+    h.update(path.read_bytes() if path.is_file() else b"<missing>")
+    h.update(b"\0")
 
-def read_yaml(path: Path) -> dict:
-    import yaml
-    with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+def pack_fingerprint(pack_dir: Path, pack_yml_path: Path, base: str) -> str:
+    h = hashlib.sha256(base.encode("utf-8"))
+    _file_digest(h, pack_yml_path)
+    tmpl_dir = pack_dir / "templates"
+    if tmpl_dir.is_dir():
+        for f in sorted(tmpl_dir.rglob("*")):
+            if f.is_file():
+                _file_digest(h, f)
+    return h.hexdigest()
 
-def find_packs(vault_dir: Path):
-    for p in vault_dir.glob("*.*"):
-        pack_yml = p / "pack.yml"
-        if pack_yml.exists():
-            yield p, pack_yml
+def _base_fingerprint() -> str:
+    h = hashlib.sha256(Path(__file__).read_bytes())
+    h.update(Path(pack_loader.__file__).read_bytes())
+    h.update(SCHEMA_PATH.read_bytes() if SCHEMA_PATH.exists() else b"<no schema>")
+    return h.hexdigest()
 
-def check_tokens(md_text: str, required_tokens: list[str], file: Path, errs: list[str]):
-    for tok in required_tokens:
-        # token must appear as a header or strong marker at least once
-        pattern = rf"(^|\n)\s*(#+\s*{re.escape(tok)}\b|(\*\*|__){re.escape(tok)}(\*\*|__))"
-        if not re.search(pattern, md_text, flags=re.IGNORECASE):
-            errs.append(f"[TOKENS] {file}: missing token '{tok}'")
+def load_cache(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(path: Path, cache: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(cache, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+# --- driver --------------------------------------------------------------------------
+
+def _lint_all(todo: list[tuple[Path, Path]], jobs: int) -> list[dict]:
+    if jobs <= 1 or len(todo) < 2:
+        return [lint_pack(d, y) for d, y in todo]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+        return list(pool.map(lint_pack, [d for d, _ in todo], [y for _, y in todo]))
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--vault", default="app/vault", help="Root of packs")
+    ap.add_argument("--jobs", type=int, default=0,
+                    help="worker processes (default: CPU count once there are 4+ packs to lint, else inline)")
+    ap.add_argument("--cache", default="artifacts/lint_cache.json", help="per-pack result cache")
+    ap.add_argument("--no-cache", action="store_true", help="lint every pack, ignore and keep the cache")
     args = ap.parse_args()
 
     vault = Path(args.vault)
@@ -126,97 +221,35 @@ def main():
     errors: list[str] = []
     warnings: list[str] = []
 
-    for pack_dir, pack_yml_path in find_packs(vault):
-        pack = read_yaml(pack_yml_path)
-        # Normalize BEFORE schema/field checks
-        pack = normalize_pack(pack, str(pack_yml_path))
-
-        # Basic pack.yml shape
-        for field in REQUIRED_PACK_FIELDS:
-            if field not in pack:
-                errors.append(f"[PACK] {pack_yml_path}: missing '{field}'")
-
-        pack_id = pack.get("id", pack_dir.name.split(".")[0].upper())
-        version = str(pack.get("version", ""))
-        status = pack.get("status", "").lower() if isinstance(pack.get("status", ""), str) else pack.get("status")
-        if status not in {"draft", "candidate", "approved"}:
-            errors.append(f"[PACK] {pack_yml_path}: status must be 'draft', 'candidate', or 'approved'")
-        
-        # Validate version format (basic SemVer check)
-        if not version:
-            errors.append(f"[PACK] {pack_yml_path}: version is required")
-        elif not re.match(r'^\d+\.\d+\.\d+$', version):
-            warnings.append(f"[PACK] {pack_yml_path}: version '{version}' doesn't follow SemVer format (x.y.z)")
-
-        sections = pack.get("sections", [])
-        if not isinstance(sections, list) or not sections:
-            errors.append(f"[PACK] {pack_yml_path}: 'sections' must be a non-empty list")
-
-        # Check templates exist & tokens present
-        tmpl_dir = pack_dir / "templates"
-        if not tmpl_dir.exists():
-            errors.append(f"[PACK] {pack_yml_path}: templates/ folder missing")
-            continue
+    packs = list(find_packs(vault))
+    cache_path = Path(args.cache)
+    cache = {} if args.no_cache else load_cache(cache_path)
+    base = _base_fingerprint()
+    keys = [pack_fingerprint(d, y, base) for d, y in packs]
+    results: list[Optional[dict]] = [None] * len(packs)
+    todo: list[int] = []
+    for i, ((_, pack_yml_path), key) in enumerate(zip(packs, keys)):
+        hit = cache.get(str(pack_yml_path))
+        if isinstance(hit, dict) and hit.get("key") == key:
+            results[i] = hit["result"]
+        else:
+            todo.append(i)
 
-        # Enforce section→template parity and validate rubrics
-        for sec in sections:
-            f = tmpl_dir / f"{sec}.md"
-            if not f.exists():
-                errors.append(f"[PACK] {pack_yml_path}: section '{sec}' missing template {f}")
-                continue
-            
-            # Check tokens against template rubric if available
-            text = f.read_text(encoding="utf-8")
-            templates = pack.get("templates", {})
-            
-            # Find matching template by searching all templates for matching file path
-            tmpl_data = None
-            for key, tmpl in templates.items():
-                if isinstance(tmpl, dict) and tmpl.get("file"):
-                    # Extract basename from template's file field to match against section name
-                    file_path_str = tmpl["file"]
-                    if file_path_str:
-                        template_stem = Path(file_path_str).stem
-                        if template_stem == sec:
-                            tmpl_data = tmpl
-                            break
-            
-            if tmpl_data and "rubric" in tmpl_data:
-                rubric = tmpl_data["rubric"]
-                if isinstance(rubric, dict) and "required_tokens" in rubric:
-                    required_tokens = rubric["required_tokens"]
-                    check_tokens(text, required_tokens, f, errors)
-                else:
-                    # No required_tokens in rubric, use filename heuristic as fallback
-                    fname = f.stem.lower()
-                    if any(key in fname for key in ["business_case", "impact", "solution", "proposal", "vendor"]):
-                        check_tokens(text, PAS_TOKENS, f, errors)
-                    else:
-                        check_tokens(text, SCQA_TOKENS, f, errors)
-            else:
-                # No rubric defined for this template, use filename heuristic
-                fname = f.stem.lower()
-                if any(key in fname for key in ["business_case", "impact", "solution", "proposal", "vendor"]):
-                    check_tokens(text, PAS_TOKENS, f, errors)
-                else:
-                    check_tokens(text, SCQA_TOKENS, f, errors)
+    jobs = args.jobs if args.jobs > 0 else ((os.cpu_count() or 1) if len(todo) >= 4 else 1)
+    for i, result in zip(todo, _lint_all([packs[i] for i in todo], jobs)):
+        results[i] = result
+
+    # report in discovery order, as the serial loop did
+    for (_, pack_yml_path), key, result in zip(packs, keys, results):
+        for note in result["notes"]:
+            print(f"WARNING: {note}", file=sys.stderr)
+        warnings.extend(result["warnings"])
+        errors.extend(result["errors"])
+        cache[str(pack_yml_path)] = {"key": key, "result": result}
 
-        # Optional schema check against repo schema (non-fatal if not present)
-        schema_path = Path("smartai-prompts-v2.schema.json")
-        if schema_path.exists():
-            try:
-                import jsonschema
-                schema = json.loads(schema_path.read_text(encoding="utf-8"))
-                doc = {
-                    "id": f"{pack_id}@{version}",
-                    "pack": pack_id,
-                    "version": version,
-                    "status": status,
-                    "sections": sections,
-                }
-                jsonschema.validate(doc, schema)
-            except Exception as e:
-                warnings.append(f"[SCHEMA] {pack_yml_path}: {e}")
+    if not args.no_cache:
+        live = {str(y) for _, y in packs}
+        save_cache(cache_path, {k: v for k, v in cache.items() if k in live or not k.startswith(str(vault))})
 
     for w in warnings: print(f"WARNING: {w}")
     if errors:
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+mock_aoai.py
+- Minimal local stand-in for the Azure OpenAI chat completions endpoint.
+- Speaks plain HTTP/1.1 with keep-alive so benchmarks can see connection reuse.
+- Counts accepted TCP connections and requests.
+- Optional per-connection delay to mimic the TCP+TLS handshake of the real endpoint.
+- Honours `"stream": true` with chunked SSE deltas, like AOAI.
+- Optional throttling like AOAI: a requests-per-second window and/or a random
+  429 rate, with retry-after-ms and x-ratelimit-remaining-requests headers.
+
+Used by the tools/bench_*.py scripts; can also be run standalone:
+  python tools/mock_aoai.py --port 8089 --latency-ms 50 --handshake-ms 40
+"""
+from __future__ import annotations
+import argparse, asyncio, json, random, sys, time
+
+class MockAOAI:
+    def __init__(self, *, latency_ms: float = 0.0, handshake_ms: float = 0.0, token_ms: float = 0.0,
+                 reply: str = "Mock draft [source:acra_bizfile].", limit_rps: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after_ms: float = 1000.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.handshake_ms = handshake_ms
+        self.token_ms = token_ms  # delay between streamed deltas
+        self.reply = reply
+        self.limit_rps = limit_rps          # accepted requests per 1s window (0 = unlimited)
+        self.throttle_rate = throttle_rate  # fraction of requests answered 429 regardless
+        self.retry_after_ms = retry_after_ms
+        self._rnd = random.Random(seed)
+        self._window = (0, 0)  # (second, accepted in it)
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+        self._server: asyncio.base_events.Server | None = None
+        self.port = 0
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def reset_counters(self) -> None:
+        self.connections = 0
+        self.requests = 0
+        self.throttled = 0
+
+    def _admit(self) -> tuple[bool, dict]:
+        """Returns (accepted, rate-limit headers) for one request."""
+        if self.throttle_rate and self._rnd.random() < self.throttle_rate:
+            return False, {"retry-after-ms": str(int(self.retry_after_ms))}
+        if not self.limit_rps:
+            return True, {}
+        now = time.monotonic()
+        sec, used = self._window
+        if int(now) != sec:
+            sec, used = int(now), 0
+        if used >= self.limit_rps:
+            left_ms = int((sec + 1 - now) * 1000) + 1
+            return False, {"retry-after-ms": str(left_ms), "x-ratelimit-remaining-requests": "0"}
+        self._window = (sec, used + 1)
+        return True, {"x-ratelimit-remaining-requests": str(int(self.limit_rps - used - 1))}
+
+    async def start(self, port: int = 0) -> "MockAOAI":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for ln in lines[1:]:
+            if ":" in ln:
+                k, v = ln.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        body = b""
+        n = int(headers.get("content-length", "0") or 0)
+        if n:
+            body = await reader.readexactly(n)
+        return method, path, headers, body
+
+    async def _write_json(self, writer: asyncio.StreamWriter, status: int, obj: dict, extra_headers: dict | None = None):
+        data = json.dumps(obj).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}.get(status, "OK")
+        hdrs = {"Content-Type": "application/json", "Content-Length": str(len(data)), "Connection": "keep-alive"}
+        hdrs.update(extra_headers or {})
+        head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in hdrs.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def _write_stream(self, writer: asyncio.StreamWriter):
+        head = ("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                "Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+        writer.write(head.encode("latin-1"))
+
+        def chunk(payload: str) -> bytes:
+            data = f"data: {payload}\n\n".encode("utf-8")
+            return f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n"
+
+        # AOAI sends an empty-choices preamble (prompt filter results) first
+        writer.write(chunk(json.dumps({"choices": [], "prompt_filter_results": []})))
+        for i, word in enumerate(self.reply.split(" ")):
+            delta = word if i == 0 else " " + word
+            writer.write(chunk(json.dumps({"choices": [{"index": 0, "delta": {"content": delta}}]})))
+            await writer.drain()
+            if self.token_ms:
+                await asyncio.sleep(self.token_ms / 1000)
+        writer.write(chunk("[DONE]") + b"0\r\n\r\n")
+        await writer.drain()
+
+    async def respond(self, writer: asyncio.StreamWriter, method: str, path: str, headers: dict, body: bytes):
+        ok, rl_headers = self._admit()
+        if not ok:
+            self.throttled += 1
+            await self._write_json(writer, 429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                                   rl_headers)
+            return
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        try:
+            stream = bool(json.loads(body or b"{}").get("stream"))
+        except ValueError:
+            stream = False
+        if stream:
+            await self._write_stream(writer)
+            return
+        await self._write_json(writer, 200, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply}}],
+        }, rl_headers)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        if self.handshake_ms:
+            await asyncio.sleep(self.handshake_ms / 1000)
+        try:
+            while True:
+                try:
+                    method, path, headers, body = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionResetError):
+                    break
+                self.requests += 1
+                await self.respond(writer, method, path, headers, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        finally:
+            writer.close()
+
+async def _serve(args):
+    srv = await MockAOAI(latency_ms=args.latency_ms, handshake_ms=args.handshake_ms,
+                         limit_rps=args.limit_rps, throttle_rate=args.throttle_rate).start(args.port)
+    print(f"mock AOAI listening on {srv.endpoint}")
+    await asyncio.Event().wait()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--handshake-ms", type=float, default=40.0)
+    ap.add_argument("--limit-rps", type=float, default=0.0, help="answer 429 above this many requests/sec")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    args = ap.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
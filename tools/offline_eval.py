@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 """
 offline_eval.py
-- Lightweight CI-time evaluation (no model calls).
-- Computes proxy metrics over pack templates:
+- CI-time evaluation, no live model calls. Two parts:
+- Template proxies over pack templates:
     * groundedness_proxy: share of non-empty lines that contain a citation marker "[source:"
     * avg_chars_per_template and per-section caps (optional)
+- Golden runs (app/vault/*/golden/*.jsonl): each golden is rendered through
+  composer.compose_instruction against the local vault with fixture evidence
+  for its evidence_labels, sent to a model backend (tools/eval_backends.py:
+  deterministic fake by default, or replayed recorded responses) and the
+  draft is scored:
+    * structure coverage: share of structure_tokens present as headings / bold markers
+    * citation coverage: share of content lines with [source:...], vs min_citation_coverage
+    * length: words vs inputs.length_limit (+ tolerance), chars vs max_chars
+    * citations of labels that were not in the evidence
+  Goldens run across a process pool; the report has a per-section summary with timing.
 - Fails PR if thresholds are not met.
 
 Usage:
@@ -14,39 +24,34 @@ Usage:
     --min_grounded 0.80 \
     --max_chars 12000 \
     [--goldens "app/vault/**/golden/*.jsonl"] \
+    [--backend fake | replay --replay responses.jsonl | package.module:Class] \
+    [--fixtures DIR] [--jobs N] [--record responses.jsonl] [--no-goldens] \
     [--dry-worker]
+
+Fixture evidence: DIR/<label>.txt when --fixtures is given and the file exists,
+else a short deterministic synthetic text per label.
 """
 from __future__ import annotations
-import argparse, json, sys, glob
+import argparse, glob, hashlib, json, os, re, sys, time
 from pathlib import Path
+from typing import Optional
 
-def read_yaml(path: Path) -> dict:
-    import yaml
-    with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+from app.services import pack_loader
+import eval_backends
 
 def discover_templates(vault_root: Path):
-    """Discover all templates from pack.yml files.
-    
-    Iterates over pack["templates"] dict, yielding (pack_id, version, section, md_path)
-    for each template. Uses section_id from template config if present, otherwise
-    uses the template key name as the section.
+    """Discover all templates from pack.yml files (via the shared pack loader).
+
+    Yields (pack_id, version, section, md_path) for each template with a `file`;
+    section is the template's section_id if present, else its key.
     """
-    for pack_dir in sorted(vault_root.glob("*.*")):
-        pack_yml = pack_dir / "pack.yml"
-        if not pack_yml.exists():
-            continue
-        pack = read_yaml(pack_yml)
-        pack_id = str(pack.get("id") or pack.get("pack_id") or pack_dir.name.split(".")[0].upper()).upper()
-        version = str(pack.get("version"))
-        templates = pack.get("templates", {}) or {}
-        for tmpl_name, cfg in templates.items():
-            file_rel = cfg.get("file")
-            if not file_rel:
-                continue
-            md_path = pack_dir / file_rel
-            section = cfg.get("section_id") or tmpl_name
-            yield pack_id, version, section, md_path
+    for pack in pack_loader.iter_packs(vault_root):
+        for t in pack.templates.values():
+            if t.cfg.get("file"):
+                yield pack.id, pack.version, t.section_id, t.path
 
 def groundedness_proxy(md_text: str) -> float:
     lines = [ln.strip() for ln in md_text.splitlines()]
@@ -56,6 +61,181 @@ def groundedness_proxy(md_text: str) -> float:
     cited = [ln for ln in nonempty if "[source:" in ln.lower()]
     return len(cited) / max(1, len(nonempty))
 
+def load_goldens(pattern: str) -> list[dict]:
+    """Golden records from every JSONL file matching `pattern` (malformed lines are skipped).
+
+    A file named after a template variant (about_project.core.jsonl) sets the
+    record's `variant`; records without an `id` get <file stem>:<line>.
+    """
+    goldens = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        p = Path(path)
+        for n, ln in enumerate(p.read_text(encoding="utf-8").splitlines(), 1):
+            if not ln.strip(): continue
+            try:
+                rec = json.loads(ln)
+            except Exception:
+                # ignore malformed lines
+                continue
+            if not isinstance(rec, dict):
+                continue
+            rec.setdefault("id", f"{p.stem}:{n}")
+            sec = rec.get("section")
+            if sec and "variant" not in rec and p.stem.startswith(f"{sec}."):
+                rec["variant"] = p.stem
+            goldens.append(rec)
+    return goldens
+
+# --- golden runs -------------------------------------------------------------------
+
+_TOKEN = "(^|\\n)\\s*(#+\\s*{tok}\\b|(\\*\\*|__){tok}(\\*\\*|__))"  # same rule as lint_packs.check_tokens
+_HEADING_LINE = re.compile(r"^\s{0,3}#{1,6}\s")
+_CITED = re.compile(r"\[source:([A-Za-z0-9_\-]+)\]")
+
+def has_token(text: str, tok: str) -> bool:
+    return re.search(_TOKEN.format(tok=re.escape(tok)), text, flags=re.IGNORECASE) is not None
+
+def citation_coverage(text: str) -> float:
+    """Share of non-empty, non-heading lines carrying a [source:...] citation."""
+    lines = [ln for ln in (x.strip() for x in text.splitlines()) if ln and not _HEADING_LINE.match(ln)]
+    if not lines:
+        return 0.0
+    return sum(1 for ln in lines if _CITED.search(ln)) / len(lines)
+
+def _synthetic_evidence(label: str) -> str:
+    h = int(hashlib.sha1(label.encode("utf-8")).hexdigest()[:8], 16)
+    title = label.replace("_", " ").capitalize()
+    return (f"{title} states FY2023 revenue of SGD {1 + h % 90 / 10:.1f}m, up {5 + h % 40}% year on year.\n"
+            f"{title} lists {2 + h % 7} active projects and {10 + h % 50} staff in Singapore.")
+
+def fixture_evidence(labels: list[str], fixtures: Optional[str] = None) -> str:
+    """Evidence snippet in the API's format (--- [evidence:<label>] --- blocks)."""
+    parts = []
+    for label in labels:
+        f = Path(fixtures) / f"{label}.txt" if fixtures else None
+        text = f.read_text(encoding="utf-8").strip() if f is not None and f.is_file() else _synthetic_evidence(label)
+        parts.append(f"\n\n--- [evidence:{label}] ---\n" + text)
+    return "".join(parts)
+
+def score_draft(text: str, golden: dict, labels: list[str], *, required: list[str],
+                min_citation: float, length_tolerance: float) -> tuple[dict, list[str]]:
+    """(scores, failure reasons) of one draft against its golden."""
+    missing = [t for t in required if not has_token(text, t)]
+    cov = citation_coverage(text)
+    cited = list(dict.fromkeys(_CITED.findall(text)))
+    unknown = [c for c in cited if c not in labels]
+    words, chars = len(text.split()), len(text)
+    limit = (golden.get("inputs") or {}).get("length_limit")
+    min_cov = float(golden.get("min_citation_coverage", min_citation))
+    max_chars = golden.get("max_chars")
+
+    reasons = []
+    if missing: reasons.append(f"missing structure tokens {missing}")
+    if cov < min_cov: reasons.append(f"citation coverage {cov:.2f} < {min_cov:.2f}")
+    if limit and words > int(limit) * (1 + length_tolerance): reasons.append(f"words {words} > {limit}")
+    if max_chars and chars > int(max_chars): reasons.append(f"chars {chars} > {max_chars}")
+    if unknown: reasons.append(f"cites labels not in evidence {unknown}")
+    scores = {
+        "structure_coverage": round(1 - len(missing) / len(required), 4) if required else 1.0,
+        "missing_tokens": missing,
+        "citation_coverage": round(cov, 4),
+        "min_citation_coverage": min_cov,
+        "cited_labels": cited,
+        "words": words,
+        "length_limit": limit,
+        "chars": chars,
+    }
+    return scores, reasons
+
+_worker: dict = {}  # per process: backend, fixtures, scoring options, packs by (id, version)
+
+def _init_worker(vault: str, backend: str, options: dict, fixtures: Optional[str], scoring: dict) -> None:
+    from app.services import appcfg
+    # every config read is served from this snapshot: local vault, no App Config / Search I/O
+    appcfg.pin_snapshot({"PROMPT_VAULT.BACKEND": "local", "PROMPT_VAULT.SOURCE": vault,
+                         "PROMPT_VAULT.SEARCH_FALLBACK": "false"})
+    _worker.update(backend=eval_backends.load(backend, **options), fixtures=fixtures, scoring=scoring,
+                   packs={(p.id, p.version): p for p in pack_loader.iter_packs(Path(vault))})
+
+def _framework(meta: dict) -> str:
+    pack = _worker["packs"].get((str(meta.get("pack_id")), str(meta.get("version"))))
+    frameworks = ((pack.data.get("defaults") or {}).get("frameworks") or {}) if pack else {}
+    return frameworks.get(meta.get("template_key")) or frameworks.get(meta.get("section_id")) or "SCQA"
+
+def run_golden(golden: dict) -> dict:
+    """Render, complete and score one golden (runs in a pool worker)."""
+    from app.services import composer, prompt_vault
+    pack = str(golden.get("pack") or "").upper() or None
+    section, variant = golden.get("section"), golden.get("variant")
+    labels = list(golden.get("evidence_labels") or [])
+    inputs = dict(golden.get("inputs") or {})
+    inputs.setdefault("evidence_labels", labels)
+    if pack:
+        inputs.setdefault("grant", pack.lower())
+    run = {"id": golden["id"], "pack": pack, "section": section, "variant": variant,
+           "ok": False, "reasons": [], "output": None}
+    t0 = time.perf_counter()
+    t1 = t2 = None
+    try:
+        tpl = prompt_vault.retrieve_template(section, section_variant=variant, pack_hint=pack)
+        meta = tpl.get("metadata") or {}
+        framework = inputs.get("framework") or _framework(meta)
+        budget = composer.TokenBudget()
+        messages, pack_header, _ = composer.compose_instruction(
+            section, framework, inputs, fixture_evidence(labels, _worker["fixtures"]),
+            section_variant=variant, pack_hint=pack, budget=budget)
+        run.update(template=f"{pack_header}:{meta.get('template_key')}", framework=framework,
+                   prompt_tokens=budget.prompt_tokens, max_tokens=budget.max_tokens,
+                   prompt_sha=eval_backends.prompt_sha(messages))
+        t1 = time.perf_counter()
+        backend = _worker["backend"]
+        run["output"] = backend.complete(messages, max_tokens=budget.max_tokens, golden=golden)
+        if getattr(backend, "stale", None) and backend.stale(messages, golden):
+            run["stale_recording"] = True
+        t2 = time.perf_counter()
+        required = list(golden.get("structure_tokens") or (meta.get("rubric") or {}).get("required_tokens") or [])
+        run["scores"], run["reasons"] = score_draft(run["output"], golden, labels, required=required,
+                                                    **_worker["scoring"])
+        run["ok"] = not run["reasons"]
+    except Exception as e:
+        run["reasons"].append(f"{type(e).__name__}: {e}")
+    t3 = time.perf_counter()
+    t1, t2 = t1 or t3, t2 or t3
+    run["timing_ms"] = {"render": round((t1 - t0) * 1000, 3), "model": round((t2 - t1) * 1000, 3),
+                        "score": round((t3 - t2) * 1000, 3), "total": round((t3 - t0) * 1000, 3)}
+    return run
+
+def run_goldens(goldens: list[dict], *, vault: Path, backend: str, options: dict, fixtures: Optional[str],
+                scoring: dict, jobs: int) -> list[dict]:
+    init = (str(vault), backend, options, fixtures, scoring)
+    if jobs <= 1 or len(goldens) < 2:
+        _init_worker(*init)
+        return [run_golden(g) for g in goldens]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(jobs, len(goldens)), initializer=_init_worker, initargs=init) as pool:
+        return list(pool.map(run_golden, goldens))
+
+def section_report(runs: list[dict]) -> dict:
+    """Per pack:section(.variant) summary: pass count, mean scores, timing."""
+    groups: dict[str, list[dict]] = {}
+    for r in runs:
+        groups.setdefault(f"{r['pack']}:{r['variant'] or r['section']}", []).append(r)
+    report = {}
+    for key, rs in sorted(groups.items()):
+        scored = [r["scores"] for r in rs if r.get("scores")]
+        mean = lambda f: round(sum(s[f] for s in scored) / len(scored), 4) if scored else None
+        totals = [r["timing_ms"]["total"] for r in rs]
+        report[key] = {
+            "runs": len(rs),
+            "passed": sum(1 for r in rs if r["ok"]),
+            "structure_coverage": mean("structure_coverage"),
+            "citation_coverage": mean("citation_coverage"),
+            "words": mean("words"),
+            "ms_mean": round(sum(totals) / len(totals), 3),
+            "ms_max": max(totals),
+        }
+    return report
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--vault", default="app/vault")
@@ -64,6 +244,14 @@ def main():
     ap.add_argument("--min_grounded", type=float, default=0.80)
     ap.add_argument("--max_chars", type=int, default=12000)
     ap.add_argument("--dry-worker", action="store_true", help="placeholder flag for CI parity")
+    ap.add_argument("--backend", default="fake", help="fake | replay | package.module:Class")
+    ap.add_argument("--replay", help="recorded responses (JSONL) for --backend replay")
+    ap.add_argument("--record", help="write this run's drafts as a replay file")
+    ap.add_argument("--fixtures", help="directory of <label>.txt evidence fixtures")
+    ap.add_argument("--jobs", type=int, default=0, help="golden worker processes (default: CPU count)")
+    ap.add_argument("--min_citation", type=float, default=0.5, help="for goldens without min_citation_coverage")
+    ap.add_argument("--length_tolerance", type=float, default=0.10, help="allowed overrun of length_limit words")
+    ap.add_argument("--no-goldens", action="store_true", help="template proxies only")
     args = ap.parse_args()
 
     vault = Path(args.vault)
@@ -73,24 +261,17 @@ def main():
     results = []
     failures = []
 
-    # Optional: ingest golden hints (caps/overrides)
+    # Golden hints double as template caps/overrides
     # Format (jsonl): {"pack":"PSG","section":"business_case","max_chars":15000,"min_grounded":0}
+    goldens = load_goldens(args.goldens)
     golden_overrides = {}
-    for path in glob.glob(args.goldens, recursive=True):
-        p = Path(path)
-        for ln in p.read_text(encoding="utf-8").splitlines():
-            if not ln.strip(): continue
-            try:
-                rec = json.loads(ln)
-                pack = rec.get("pack", "").upper()
-                sec = rec.get("section")
-                if sec:
-                    # Key by (pack, section) for per-pack control
-                    key = f"{pack}:{sec}" if pack else sec
-                    golden_overrides.setdefault(key, {}).update(rec)
-            except Exception:
-                # ignore malformed lines
-                pass
+    for rec in goldens:
+        pack = str(rec.get("pack", "")).upper()
+        sec = rec.get("section")
+        if sec:
+            # Key by (pack, section) for per-pack control
+            key = f"{pack}:{sec}" if pack else sec
+            golden_overrides.setdefault(key, {}).update(rec)
 
     for pack_id, version, section, md_path in discover_templates(vault):
         if not md_path.exists():
@@ -133,7 +314,36 @@ def main():
         })
 
     report = {"results": results, "failures": failures}
-    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if goldens and not args.no_goldens:
+        options = {"replay": args.replay} if args.replay else {}
+        try:
+            eval_backends.load(args.backend, **options)  # fail fast, before starting workers
+        except Exception as e:
+            print(f"ERR: backend {args.backend}: {e}", file=sys.stderr)
+            return 2
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        scoring = {"min_citation": args.min_citation, "length_tolerance": args.length_tolerance}
+        t0 = time.perf_counter()
+        runs = run_goldens(goldens, vault=vault, backend=args.backend, options=options,
+                           fixtures=args.fixtures, scoring=scoring, jobs=jobs)
+        wall_ms = round((time.perf_counter() - t0) * 1000, 1)
+        for r in runs:
+            if not r["ok"]:
+                failures.append({"pack": r["pack"], "section": r["section"], "golden": r["id"], "reasons": r["reasons"]})
+        report["goldens"] = runs
+        report["sections"] = section_report(runs)
+        report["timing"] = {"backend": args.backend, "jobs": min(jobs, len(runs)), "wall_ms": wall_ms,
+                            "sum_ms": round(sum(r["timing_ms"]["total"] for r in runs), 1)}
+        for key, sec in report["sections"].items():
+            print(f"  {key:45s} {sec['passed']}/{sec['runs']} passed  structure {sec['structure_coverage']}  "
+                  f"citations {sec['citation_coverage']}  words {sec['words']}  {sec['ms_mean']:.1f} ms")
+        print(f"offline_eval: {len(runs)} golden run(s) with backend {args.backend} in {wall_ms:.0f} ms.")
+        if args.record:
+            n = eval_backends.record(args.record, runs)
+            print(f"offline_eval: recorded {n} response(s) → {args.record}")
+
+    out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
     print(f"offline_eval: wrote {out} with {len(failures)} failure(s).")
     return 1 if failures else 0
 
@@ -147,6 +357,11 @@ def main():
 # app/vault/PSG.v1/templates/cost_breakdown.md and rerun:
 #   python tools/offline_eval.py --vault app/vault --out /tmp/eval_report.json
 # You should now see at least one failure where groundedness_proxy < min_grounded.
+#
+# Golden runs: "goldens" has one entry per golden (draft, scores, timing) and
+# "sections" the per-section summary. Record the drafts and score them again:
+#   python tools/offline_eval.py --out /tmp/r.json --record /tmp/responses.jsonl
+#   python tools/offline_eval.py --out /tmp/r.json --backend replay --replay /tmp/responses.jsonl
 
 if __name__ == "__main__":
     sys.exit(main())